@@ -0,0 +1,210 @@
+"""
+Answer Cache
+Per-document cache of generated answers for repeated questions
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return re.sub(r"\s+", " ", question).strip()
+
+
+class _CachedAnswer:
+    def __init__(self, answer: str, sources: List[str], vector: Optional[np.ndarray], expires_at: float):
+        self.answer = answer
+        self.sources = sources
+        self.vector = vector  # unit-length question embedding, if near-duplicate matching is on
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    Answers keyed by document (vector namespace) and normalized question
+
+    Lookups try an exact match on the normalized question first. When a
+    similarity threshold is configured, they fall back to the cached question
+    whose embedding is closest to the new one, if it clears the threshold.
+    Entries expire after ttl_seconds; each document keeps at most
+    max_entries answers (least recently used dropped first).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        similarity_threshold: Optional[float] = None
+    ):
+        self.ttl_seconds = ttl_seconds or float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+        # 0 disables near-duplicate matching (exact matches only)
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None
+            else float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+        )
+        self._scopes: Dict[str, "OrderedDict[str, _CachedAnswer]"] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @property
+    def similarity_enabled(self) -> bool:
+        return self.similarity_threshold > 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _live_entries(self, scope: str) -> "OrderedDict[str, _CachedAnswer]":
+        """Entries for a scope with expired ones dropped (caller holds the lock)"""
+        entries = self._scopes.get(scope)
+        if entries is None:
+            return OrderedDict()
+        now = time.time()
+        for key in [key for key, entry in entries.items() if entry.expires_at <= now]:
+            del entries[key]
+        return entries
+
+    def get(
+        self,
+        scope: str,
+        question: str,
+        embed_query: Optional[Callable[[str], Sequence[float]]] = None
+    ) -> Optional[Dict]:
+        """
+        Look up a cached answer
+
+        Args:
+            scope: Vector namespace of the document
+            question: User question
+            embed_query: Embeds the question for near-duplicate matching
+                (only called when similarity matching is enabled)
+
+        Returns:
+            Dictionary with 'answer' and 'sources', or None on a miss
+        """
+        hit, entries, candidates = self._get_exact(scope, question)
+        if hit is not None:
+            return hit
+        query_vector = None
+        if self.similarity_enabled and embed_query and candidates:
+            query_vector = embed_query(question)
+        return self._get_similar(entries, candidates, query_vector)
+
+    async def aget(
+        self,
+        scope: str,
+        question: str,
+        aembed_query: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None
+    ) -> Optional[Dict]:
+        """Async variant of get(): aembed_query is awaited, and only after an exact miss
+        when there are cached questions to compare with"""
+        hit, entries, candidates = self._get_exact(scope, question)
+        if hit is not None:
+            return hit
+        query_vector = None
+        if self.similarity_enabled and aembed_query and candidates:
+            query_vector = await aembed_query(question)
+        return self._get_similar(entries, candidates, query_vector)
+
+    def _get_exact(self, scope: str, question: str) -> Tuple[Optional[Dict], "OrderedDict[str, _CachedAnswer]", list]:
+        """(exact hit, live entries, entries with a question embedding)"""
+        key = normalize_question(question)
+        with self._lock:
+            entries = self._live_entries(scope)
+            entry = entries.get(key)
+            if entry is not None:
+                entries.move_to_end(key)
+                self.exact_hits += 1
+                return {"answer": entry.answer, "sources": list(entry.sources)}, entries, []
+
+            return None, entries, [(k, e) for k, e in entries.items() if e.vector is not None]
+
+    def _get_similar(self, entries: "OrderedDict[str, _CachedAnswer]", candidates: list,
+                     query_vector: Optional[Sequence[float]]) -> Optional[Dict]:
+        """Closest cached question if it clears the threshold, else a miss"""
+        if query_vector is not None:
+            scores = np.stack([e.vector for _, e in candidates]) @ self._unit(query_vector)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                best_key, entry = candidates[best]
+                with self._lock:
+                    if best_key in entries:
+                        entries.move_to_end(best_key)
+                    self.similar_hits += 1
+                return {"answer": entry.answer, "sources": list(entry.sources)}
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(
+        self,
+        scope: str,
+        question: str,
+        answer: str,
+        sources: List[str],
+        embed_query: Optional[Callable[[str], Sequence[float]]] = None
+    ) -> None:
+        """Store an answer for a document"""
+        vector = None
+        if self.similarity_enabled and embed_query:
+            vector = self._unit(embed_query(question))
+        self._put(scope, question, answer, sources, vector)
+
+    async def aput(
+        self,
+        scope: str,
+        question: str,
+        answer: str,
+        sources: List[str],
+        aembed_query: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None
+    ) -> None:
+        """Async variant of put()"""
+        vector = None
+        if self.similarity_enabled and aembed_query:
+            vector = self._unit(await aembed_query(question))
+        self._put(scope, question, answer, sources, vector)
+
+    def _put(self, scope: str, question: str, answer: str, sources: List[str], vector: Optional[np.ndarray]) -> None:
+        key = normalize_question(question)
+        with self._lock:
+            entries = self._scopes.setdefault(scope, OrderedDict())
+            entries[key] = _CachedAnswer(answer, list(sources), vector, time.time() + self.ttl_seconds)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, scope: str) -> None:
+        """Drop every cached answer for a document"""
+        with self._lock:
+            self._scopes.pop(scope, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+                "documents": len(self._scopes),
+                "entries": sum(len(entries) for entries in self._scopes.values()),
+                "similarity_threshold": self.similarity_threshold,
+            }
+
+
+# Cache (singleton)
+answer_cache = AnswerCache()
@@ -0,0 +1,88 @@
+"""
+Chat Concurrency Benchmark
+Measures /api/chat throughput on a single worker as concurrent requests increase
+
+Runs fully offline (see offline.py): a temporary SQLite database, the local vector
+backend, and fake embedding/LLM models with a configurable latency standing in for Gemini.
+With a non-blocking request path, throughput should grow roughly linearly with
+concurrency while the per-request latency stays near the model latency.
+
+Usage (from api/):
+    python benchmarks/chat_concurrency.py --requests 64 --concurrency 1 4 16 --llm-latency 0.2
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from typing import List
+
+from offline import install_fakes, index_documents
+
+import httpx
+
+
+async def run_level(client: httpx.AsyncClient, session_ids: List[str], requests: int, concurrency: int) -> dict:
+    """Send `requests` chats with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={
+                "question": f"What does topic {i % 7} cover?",
+                "session_id": session_ids[i % len(session_ids)]
+            })
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+    }
+
+
+async def main(args) -> List[dict]:
+    install_fakes(args.llm_latency, args.embed_latency)
+    session_ids = index_documents(args.documents)
+
+    from main import app
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in args.concurrency:
+            result = await run_level(client, session_ids, args.requests, concurrency)
+            results.append(result)
+            print(f"concurrency={concurrency:>3}  {result['throughput_rps']:>7} req/s  "
+                  f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  errors={result['errors']}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64, help="Chat requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--documents", type=int, default=4, help="Synthetic documents to spread requests over")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per fake query embedding")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,68 @@
+"""
+Chat Query Count Check
+Counts the database statements issued by one /api/chat (and /api/chat/stream) request
+
+A warm session (document context cached, chat session created) must stay within
+MAX_WARM_QUERIES statements: recent-message lookup plus the single write
+transaction (messages, token_usage and the token_usage_daily upsert). Every
+request must also be seen issuing statements at all: a count of 0 means
+count_queries() stopped observing the request, not that it got cheaper. Exits
+non-zero if either check fails. tests/test_chat_queries.py runs the same check.
+
+Usage (from api/):
+    python benchmarks/chat_queries.py
+"""
+
+import sys
+import asyncio
+from typing import Dict, List
+
+from offline import install_fakes, index_documents
+
+import httpx
+
+MAX_WARM_QUERIES = 4
+
+
+async def measure() -> Dict[str, int]:
+    """Statements per request: a cold chat, a warm chat and a warm streamed chat"""
+    install_fakes(llm_latency=0)
+    session_id = index_documents(1, chunks_per_document=20)[0]
+
+    from main import app
+    from database import count_queries
+
+    counts = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for label, path in [("cold", "/api/chat"), ("warm", "/api/chat"), ("warm_stream", "/api/chat/stream")]:
+            with count_queries() as counter:
+                response = await client.post(path, json={"question": f"{label} question?", "session_id": session_id})
+            response.raise_for_status()
+            counts[label] = counter.count
+    return counts
+
+
+def check(counts: Dict[str, int]) -> List[str]:
+    """Budget violations, empty when the counts are within budget"""
+    errors = [f"{label}: no statements observed" for label, count in counts.items() if count == 0]
+    if max(counts["warm"], counts["warm_stream"]) > MAX_WARM_QUERIES:
+        errors.append(f"warm chat exceeded {MAX_WARM_QUERIES} statements")
+    return errors
+
+
+async def main() -> int:
+    counts = await measure()
+    for label, count in counts.items():
+        print(f"{label:<12} {count} statements")
+
+    errors = check(counts)
+    for error in errors:
+        print(f"❌ {error}")
+    if errors:
+        return 1
+    print("✅ query budget met")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,154 @@
+"""
+Cold Start Benchmark
+Time from process start to listening, ready and the first successful chat
+
+Each run starts a fresh uvicorn server (offline environment: fake models,
+local vector backend, SQLite with one indexed document) and measures:
+
+    listen      first 200 from /health
+    ready       first 200 from /ready (skipped if the endpoint does not exist)
+    first_chat  first successful /api/chat, sent as soon as the server listens
+                (total time since start, and the latency of that request)
+    warm_chat   latency of a chat once the server is ready
+
+Usage (from api/):
+    python benchmarks/cold_start.py --runs 5
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import argparse
+import threading
+import statistics
+import subprocess
+from typing import Dict, List, Optional
+
+import httpx
+
+POLL_INTERVAL = 0.01
+
+
+def serve(port: int, llm_latency: float) -> None:
+    """Server process: fake models routed through the registry, then uvicorn"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from registry import registry
+
+    # The fakes import LangChain, so build them on first use like the real clients
+    fakes: Dict[str, object] = {}
+    lock = threading.Lock()
+
+    def fake(kind: str):
+        with lock:
+            if not fakes:
+                from offline import SlowFakeEmbeddings, SlowFakeChatModel
+                from vector_store import EMBEDDING_DIMENSION
+                fakes["embeddings"] = SlowFakeEmbeddings(size=EMBEDDING_DIMENSION)
+                fakes["llm"] = SlowFakeChatModel(latency=llm_latency)
+            return fakes[kind]
+
+    registry.get_embeddings = lambda model=None: fake("embeddings")
+    registry.get_llm = lambda model=None, temperature=0.1: fake("llm")
+
+    import uvicorn
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(client: httpx.Client, path: str, timeout: float) -> Optional[int]:
+    """Poll until path answers 200 (or 404, endpoint missing) and return that status"""
+    deadline = time.perf_counter() + timeout
+    status = None
+    while time.perf_counter() < deadline:
+        try:
+            status = client.get(path).status_code
+            if status in (200, 404):
+                return status
+        except httpx.TransportError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    raise Exception(f"{path} not ready after {timeout:g}s (last status {status})")
+
+
+def chat(client: httpx.Client, session_id: str) -> float:
+    started = time.perf_counter()
+    response = client.post("/api/chat", json={"question": "What does topic 3 cover?", "session_id": session_id})
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def run_once(session_id: str, llm_latency: float, wait_for_ready: bool, timeout: float) -> Dict[str, float]:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--llm-latency", str(llm_latency)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            wait_for(client, "/health", timeout)
+            result["listen_s"] = time.perf_counter() - started
+
+            if wait_for_ready:
+                if wait_for(client, "/ready", timeout) == 200:
+                    result["ready_s"] = time.perf_counter() - started
+                result["first_chat_ms"] = chat(client, session_id) * 1000
+                result["first_chat_s"] = time.perf_counter() - started
+            else:
+                result["first_chat_ms"] = chat(client, session_id) * 1000
+                result["first_chat_s"] = time.perf_counter() - started
+                if wait_for(client, "/ready", timeout) == 200:
+                    result["ready_s"] = time.perf_counter() - started
+            result["warm_chat_ms"] = min(chat(client, session_id) for _ in range(5)) * 1000
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def main(args) -> Dict:
+    from offline import install_fakes, index_documents
+
+    install_fakes(llm_latency=args.llm_latency, embed_latency=0)
+    session_id = index_documents(1, chunks_per_document=50)[0]
+
+    report = {}
+    for scenario, wait_for_ready in (("chat_on_listen", False), ("chat_after_ready", True)):
+        runs: List[Dict[str, float]] = [
+            run_once(session_id, args.llm_latency, wait_for_ready, args.timeout) for _ in range(args.runs)
+        ]
+        report[scenario] = {
+            metric: round(statistics.median(run[metric] for run in runs), 3)
+            for metric in runs[0]
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Server starts per scenario (medians reported)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the server")
+    parser.add_argument("--json", help="Also write results to this file")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.llm_latency)
+        sys.exit(0)
+
+    report = main(args)
+    for scenario, values in report.items():
+        print(f"{scenario:<18} " + "  ".join(f"{metric}={value}" for metric, value in values.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,324 @@
+"""
+Database Helper Benchmark
+Seeds a large dataset and reports each database.py helper's latency before and after
+the composite-index migration (see migrations.py)
+
+The schema is first downgraded to the single-column indexes the models used to have,
+every helper is timed, then the migration is applied and every helper is timed again.
+Statements per call are counted, and on SQLite each helper's query plan is captured
+(EXPLAIN QUERY PLAN), flagging full table scans and sorts the indexes should remove.
+
+Runs on a temporary SQLite database by default. --database-url points it at PostgreSQL
+instead; use a scratch database, its tables are dropped and recreated.
+
+Usage (from api/):
+    python benchmarks/db_helpers.py --documents 100 --messages 2000
+    python benchmarks/db_helpers.py --database-url postgresql://user:pw@localhost/bench --json db.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+WORK_DIR = tempfile.mkdtemp(prefix="pdf-rag-dbbench-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Bench:
+    """Seeded dataset plus the helper calls to time against it"""
+
+    def __init__(self, args):
+        import database
+        self.db = database
+        self.args = args
+        self.rng = random.Random(42)
+        self.sessions: List[Dict] = []
+        self.deletable: List[str] = []
+        self.statements: List[tuple] = []
+        self.capturing = False
+
+    # Dataset
+    def reset_schema(self):
+        from migrations import schema_version
+        db = self.db
+        with db.engine.begin() as conn:
+            schema_version.drop(conn, checkfirst=True)
+        db.Base.metadata.drop_all(bind=db.engine)
+        db.init_db()
+
+    def seed(self):
+        db = self.db
+        args = self.args
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        origin = now - timedelta(days=90)
+        span = 90 * 24 * 3600
+
+        tables = {name: [] for name in ("documents", "indexed_contents", "ingestion_jobs", "chat_sessions",
+                                        "messages", "token_usage", "cleanup_tasks")}
+        for i in range(args.documents):
+            session_id = f"bench-{i}"
+            document_id, chat_session_id, job_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+            content_hash = f"{i:064x}"
+            uploaded_at = origin + timedelta(seconds=i * span // args.documents)
+            tables["documents"].append(dict(
+                id=document_id, session_id=session_id, filename=f"{session_id}.pdf", file_size=1 << 20,
+                chunk_count=200, uploaded_at=uploaded_at, status="active", content_hash=content_hash,
+                vector_namespace=content_hash
+            ))
+            tables["indexed_contents"].append(dict(
+                content_hash=content_hash, vector_namespace=content_hash, file_path=f"uploads/{content_hash}.pdf",
+                file_size=1 << 20, chunk_count=200, ref_count=1, created_at=uploaded_at
+            ))
+            tables["ingestion_jobs"].append(dict(
+                id=job_id, session_id=session_id, content_hash=content_hash, file_path=f"uploads/{content_hash}.pdf",
+                file_size=1 << 20, status="completed", stage="done", created_at=uploaded_at,
+                updated_at=uploaded_at, completed_at=uploaded_at
+            ))
+            tables["chat_sessions"].append(dict(
+                id=chat_session_id, document_id=document_id, session_name=f"{session_id}.pdf",
+                created_at=uploaded_at, updated_at=uploaded_at
+            ))
+
+            # Sessions interleave in time, so created_at alone is not selective
+            times = sorted(uploaded_at + timedelta(seconds=self.rng.uniform(0, span)) for _ in range(args.messages))
+            for j, created_at in enumerate(times):
+                tables["messages"].append(dict(
+                    id=uuid.uuid4(), chat_session_id=chat_session_id, role="user" if j % 2 == 0 else "assistant",
+                    content=f"Message {j} of {session_id} " + "lorem ipsum " * 15,
+                    sources=None if j % 2 == 0 else ["Page 1, Chunk 1"], token_count=40, created_at=created_at
+                ))
+            for _ in range(args.usage):
+                created_at = uploaded_at + timedelta(seconds=self.rng.uniform(0, span))
+                tables["token_usage"].append(dict(
+                    id=uuid.uuid4(), session_id=session_id, model="gemini-2.5-flash", input_tokens=600,
+                    output_tokens=200, total_tokens=800, created_at=created_at
+                ))
+
+            middle = times[len(times) // 2]
+            self.sessions.append(dict(session_id=session_id, document_id=document_id, chat_session_id=chat_session_id,
+                                      job_id=job_id, content_hash=content_hash, middle_at=middle))
+
+        # Finished cleanup history with a few pending retries
+        for i in range(args.cleanup_tasks):
+            pending = i < 20
+            created_at = origin + timedelta(seconds=self.rng.uniform(0, span))
+            tables["cleanup_tasks"].append(dict(
+                id=uuid.uuid4(), content_hash=None, vector_namespace=f"gone-{i}", file_path=None,
+                status="pending" if pending else "done", attempts=1,
+                next_attempt_at=now + timedelta(hours=1) if pending else created_at,
+                created_at=created_at, completed_at=None if pending else created_at
+            ))
+
+        with db.engine.begin() as conn:
+            for name, rows in tables.items():
+                table = db.Base.metadata.tables[name]
+                for offset in range(0, len(rows), 5000):
+                    conn.execute(table.insert(), rows[offset:offset + 5000])
+
+        # Cursors for deep pages (the message id is looked up so the cursor is exact)
+        with db.SessionLocal() as session:
+            for entry in self.sessions:
+                created_at = entry.pop("middle_at")
+                message = session.query(db.Message).filter(
+                    db.Message.chat_session_id == entry["chat_session_id"], db.Message.created_at == created_at
+                ).first()
+                entry["middle"] = db.encode_cursor(created_at, message.id)
+        middle_document = tables["documents"][len(tables["documents"]) // 2]
+        self.deep_document_cursor = db.encode_cursor(middle_document["uploaded_at"], middle_document["id"])
+
+        # The newest documents are deleted by adelete_document, half in each phase
+        reserved = min(args.deletes * 2, len(self.sessions) // 4)
+        self.deletable = [entry["session_id"] for entry in self.sessions[-reserved:]]
+        self.sessions = self.sessions[:-reserved] if reserved else self.sessions
+        self.deletes_per_phase = reserved // 2
+
+        counts = {name: len(rows) for name, rows in tables.items()}
+        print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+        return counts
+
+    def analyze(self):
+        with self.db.engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    # Query plans (SQLite)
+    def install_capture(self):
+        from sqlalchemy import event
+        engines = [self.db.engine] + ([self.db.async_engine.sync_engine] if self.db.async_engine else [])
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if self.capturing and not executemany:
+                self.statements.append((statement, parameters))
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", capture)
+
+    def explain(self, statements: List[tuple]) -> List[str]:
+        if self.db.engine.dialect.name != "sqlite":
+            return []
+        plan = []
+        with self.db.engine.connect() as conn:
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, tuple(parameters or ())).all()
+                plan.extend(row[-1] for row in rows)
+        return plan
+
+    # Helpers under test
+    def pick(self) -> Dict:
+        return self.rng.choice(self.sessions)
+
+    def cases(self) -> List[tuple]:
+        """(name, is_async, call, repeats)"""
+        db = self.db
+        reads = self.args.repeats
+        bulk = max(5, reads // 10)
+        since = datetime.utcnow() - timedelta(days=7)
+
+        def save_exchange(session, s):
+            return db.asave_exchange(
+                session, s["session_id"], s["document_id"], s["chat_session_id"], "bench", "question?", 3,
+                "answer.", 2, sources=["Page 1, Chunk 1"],
+                usage={"model": "gemini-2.5-flash", "input_tokens": 600, "output_tokens": 200}
+            )
+
+        async def stream_messages(session, s):
+            return [m async for m in db.astream_messages(session, s["chat_session_id"])]
+
+        async def delete_document(session, s):
+            return await db.adelete_document(session, self.deletable.pop())
+
+        return [
+            ("aget_session_context", True, lambda session, s: db.aget_session_context(session, s["session_id"]), reads),
+            ("aget_recent_messages", True, lambda session, s: db.aget_recent_messages(session, s["chat_session_id"], 1), reads),
+            ("aget_messages_page (first)", True, lambda session, s: db.aget_messages_page(session, s["chat_session_id"], 50), reads),
+            ("aget_messages_page (deep)", True, lambda session, s: db.aget_messages_page(session, s["chat_session_id"], 50, s["middle"]), reads),
+            ("astream_messages", True, stream_messages, bulk),
+            ("aget_documents_page (first)", True, lambda session, s: db.aget_documents_page(session, 50), reads),
+            ("aget_documents_page (deep)", True, lambda session, s: db.aget_documents_page(session, 50, self.deep_document_cursor), reads),
+            ("aget_token_usage (7 days)", True, lambda session, s: db.aget_token_usage(session, s["session_id"], since), reads),
+            ("aget_usage_report (7 days)", True, lambda session, s: db.aget_usage_report(session, ("day", "model"), s["session_id"], since.date()), reads),
+            ("aget_indexed_content", True, lambda session, s: db.aget_indexed_content(session, s["content_hash"]), reads),
+            ("aget_ingestion_job", True, lambda session, s: db.aget_ingestion_job(session, s["job_id"]), reads),
+            ("asave_exchange", True, save_exchange, reads),
+            ("adelete_document", True, delete_document, self.deletes_per_phase),
+            ("get_recent_messages", False, lambda session, s: db.get_recent_messages(session, s["session_id"], 1), reads),
+            ("get_chat_history", False, lambda session, s: db.get_chat_history(session, s["session_id"]), bulk),
+            ("get_indexed_content", False, lambda session, s: db.get_indexed_content(session, s["content_hash"]), reads),
+            ("get_ingestion_job", False, lambda session, s: db.get_ingestion_job(session, s["job_id"]), reads),
+            ("has_pending_jobs_for_content", False, lambda session, s: db.has_pending_jobs_for_content(session, s["content_hash"]), reads),
+            ("get_unfinished_jobs", False, lambda session, s: db.get_unfinished_jobs(session), reads),
+            ("get_due_cleanup_tasks", False, lambda session, s: db.get_due_cleanup_tasks(session), reads),
+            ("next_cleanup_due_at", False, lambda session, s: db.next_cleanup_due_at(session), reads),
+            ("track_token_usage", False, lambda session, s: db.track_token_usage(session, s["session_id"], "gemini-2.5-flash", 600, 200), reads),
+        ]
+
+    async def run_case(self, is_async: bool, call: Callable, repeats: int) -> Dict:
+        db = self.db
+        samples, queries = [], 0
+        self.statements = []
+        for i in range(repeats):
+            target = self.pick()
+            self.capturing = i == 0
+            with db.count_queries() as counter:
+                if is_async:
+                    async with db.AsyncSessionLocal() as session:
+                        started = time.perf_counter()
+                        await call(session, target)
+                        samples.append(time.perf_counter() - started)
+                else:
+                    with db.SessionLocal() as session:
+                        started = time.perf_counter()
+                        call(session, target)
+                        samples.append(time.perf_counter() - started)
+            self.capturing = False
+            queries += counter.count
+        plan = self.explain(self.statements)
+        return {
+            "p50_ms": round(_percentile(samples, 0.5) * 1000, 3),
+            "p95_ms": round(_percentile(samples, 0.95) * 1000, 3),
+            "queries": round(queries / repeats, 2),
+            "full_scans": sum(1 for line in plan if line.startswith("SCAN") and "INDEX" not in line),
+            "temp_sorts": sum(1 for line in plan if "TEMP B-TREE" in line),
+            "plan": plan,
+        }
+
+    async def run_phase(self, label: str) -> Dict[str, Dict]:
+        print(f"\n== {label} ==")
+        results = {}
+        for name, is_async, call, repeats in self.cases():
+            if repeats <= 0:
+                continue
+            results[name] = await self.run_case(is_async, call, repeats)
+            r = results[name]
+            print(f"{name:<30} p50={r['p50_ms']:>8}ms  p95={r['p95_ms']:>8}ms  "
+                  f"queries={r['queries']}  scans={r['full_scans']}  sorts={r['temp_sorts']}")
+        return results
+
+
+async def main(args) -> Dict:
+    from migrations import MIGRATIONS
+
+    bench = Bench(args)
+    bench.reset_schema()
+    counts = bench.seed()
+    bench.install_capture()
+
+    # Only the index migration is toggled; later migrations add columns the helpers write
+    index_migration = next(migration for migration in MIGRATIONS if migration.version == 3)
+    with bench.db.engine.begin() as conn:
+        index_migration.downgrade(conn)
+    bench.analyze()
+    before = await bench.run_phase("Before: single-column indexes")
+
+    with bench.db.engine.begin() as conn:
+        index_migration.upgrade(conn)
+    bench.analyze()
+    after = await bench.run_phase("After: composite indexes")
+
+    print(f"\n{'helper':<30} {'before p50':>11} {'after p50':>11} {'speedup':>8}")
+    for name, b in before.items():
+        a = after[name]
+        speedup = b["p50_ms"] / a["p50_ms"] if a["p50_ms"] else 0.0
+        print(f"{name:<30} {b['p50_ms']:>9}ms {a['p50_ms']:>9}ms {speedup:>7.1f}x")
+
+    await bench.db.async_engine.dispose()
+    return {
+        "dialect": bench.db.engine.dialect.name,
+        "rows": counts,
+        "results": [{"helper": name, "before": before[name], "after": after[name]} for name in before],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Scratch database to use (default: temporary SQLite)")
+    parser.add_argument("--documents", type=int, default=100, help="Documents (each with one chat session)")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages per chat session")
+    parser.add_argument("--usage", type=int, default=500, help="Token usage rows per document")
+    parser.add_argument("--cleanup-tasks", type=int, default=5000, help="Cleanup task rows (20 pending, rest done)")
+    parser.add_argument("--repeats", type=int, default=200, help="Calls per read helper")
+    parser.add_argument("--deletes", type=int, default=20, help="adelete_document calls per phase")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,204 @@
+"""
+Embedding Scheduler Check
+Runs EmbeddingScheduler against the offline fake embedding model
+
+SlowFakeEmbeddings is wrapped in a probe that records batch sizes and calls in
+flight, and can be told to fail. Each check builds its own scheduler:
+
+    batching      texts are split into batch_size requests, vectors come back in order
+    concurrency   bulk work uses at most max_concurrency - 1 workers, all work at most max_concurrency
+    rate_limit    requests beyond the burst wait for the token bucket
+    retries       injected failures are retried after jittered, capped backoff delays;
+                  a request failing more than max_retries times raises
+    preemption    a query sent while bulk batches are queued runs on the free worker
+                  instead of waiting behind them
+
+Exits non-zero if any check fails.
+
+Usage (from api/):
+    python benchmarks/embedding_scheduler.py
+"""
+
+import sys
+import time
+import random
+import asyncio
+import threading
+from typing import List
+
+from offline import SlowFakeEmbeddings
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_scheduler import EmbeddingScheduler
+
+DIMENSION = 16
+
+
+class ProbeEmbeddings(Embeddings):
+    """Delegates to a fake model, recording batch sizes and peak calls in flight"""
+
+    def __init__(self, latency: float = 0.0, failures: int = 0):
+        self.model = SlowFakeEmbeddings(size=DIMENSION, latency=latency)
+        self.failures = failures  # the next N calls raise
+        self.batches: List[int] = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if self.failures:
+                self.failures -= 1
+                self.in_flight -= 1
+                raise Exception("injected embedding failure")
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._enter()
+        try:
+            self.batches.append(len(texts))
+            return self.model.embed_documents(texts)
+        finally:
+            self._exit()
+
+    def embed_query(self, text: str) -> List[float]:
+        self._enter()
+        try:
+            return self.model.embed_query(text)
+        finally:
+            self._exit()
+
+
+def check_batching() -> List[str]:
+    probe = ProbeEmbeddings()
+    scheduler = EmbeddingScheduler(probe, batch_size=100, max_concurrency=2, requests_per_minute=0)
+    texts = [f"text {i}" for i in range(250)]
+    vectors = scheduler.embed_documents(texts)
+    errors = []
+    if sorted(probe.batches) != [50, 100, 100]:
+        errors.append(f"expected batches of 100, 100 and 50 texts, got {probe.batches}")
+    if vectors != probe.model.embed_documents(texts):
+        errors.append("vectors differ from the unscheduled model or are out of order")
+    async_vectors = asyncio.run(scheduler.aembed_documents(texts))
+    if async_vectors != vectors:
+        errors.append("aembed_documents differs from embed_documents")
+    return errors
+
+
+def check_concurrency() -> List[str]:
+    probe = ProbeEmbeddings(latency=0.02)
+    scheduler = EmbeddingScheduler(probe, batch_size=1, max_concurrency=3, requests_per_minute=0)
+    scheduler.embed_documents([f"text {i}" for i in range(20)])
+    errors = []
+    if probe.peak_in_flight != 2:
+        errors.append(f"bulk should use max_concurrency - 1 = 2 workers, peak was {probe.peak_in_flight}")
+
+    probe.peak_in_flight = 0
+    bulk = threading.Thread(target=scheduler.embed_documents, args=([f"text {i}" for i in range(20)],))
+    bulk.start()
+    queries = [threading.Thread(target=scheduler.embed_query, args=(f"query {i}",)) for i in range(10)]
+    for thread in queries:
+        thread.start()
+    for thread in [bulk] + queries:
+        thread.join()
+    if probe.peak_in_flight > 3:
+        errors.append(f"more than max_concurrency = 3 calls in flight: {probe.peak_in_flight}")
+    return errors
+
+
+def check_rate_limit() -> List[str]:
+    # 10 requests per second after a burst of 2
+    probe = ProbeEmbeddings()
+    scheduler = EmbeddingScheduler(probe, max_concurrency=4, requests_per_minute=600, burst=2)
+    started = time.perf_counter()
+    threads = [threading.Thread(target=scheduler.embed_query, args=(f"query {i}",)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    errors = []
+    if elapsed < 0.9:
+        errors.append(f"12 requests at 10/s with a burst of 2 took {elapsed:.2f}s, expected about 1s")
+    if scheduler.stats()["throttled_seconds"] <= 0:
+        errors.append("no time recorded as throttled")
+    return errors
+
+
+def check_retries() -> List[str]:
+    random.seed(0)
+    delays: List[float] = []
+    probe = ProbeEmbeddings(failures=3)
+    scheduler = EmbeddingScheduler(probe, max_concurrency=1, requests_per_minute=0, max_retries=5,
+                                   base_delay=0.5, max_delay=1.5, sleep=delays.append)
+    errors = []
+    if scheduler.embed_query("query") != probe.model.embed_query("query"):
+        errors.append("retried query returned a different vector")
+    caps = [min(1.5, 0.5 * 2 ** attempt) for attempt in range(3)]
+    if len(delays) != 3 or any(not 0 <= delay <= cap for delay, cap in zip(delays, caps)):
+        errors.append(f"expected 3 backoff delays within {caps}, got {delays}")
+    if len(set(delays)) < len(delays) or delays == caps:
+        errors.append(f"backoff delays are not jittered: {delays}")
+
+    probe.failures = 10
+    try:
+        scheduler.embed_query("query")
+        errors.append("a request failing more than max_retries times did not raise")
+    except Exception:
+        pass
+    stats = scheduler.stats()
+    if stats["retries"] != 3 + 5 or stats["failures"] != 1:
+        errors.append(f"expected 8 retries and 1 failure in stats, got {stats['retries']} and {stats['failures']}")
+    return errors
+
+
+def check_preemption() -> List[str]:
+    latency = 0.05
+    probe = ProbeEmbeddings(latency=latency)
+    scheduler = EmbeddingScheduler(probe, batch_size=1, max_concurrency=2, requests_per_minute=0)
+    bulk = threading.Thread(target=scheduler.embed_documents, args=([f"text {i}" for i in range(40)],))
+    bulk.start()
+    time.sleep(latency * 2)  # bulk batches are queued and running
+
+    started = time.perf_counter()
+    scheduler.embed_query("query")
+    query_seconds = time.perf_counter() - started
+    queued_bulk = scheduler.stats()["queued_bulk"]
+    bulk.join()
+
+    errors = []
+    if query_seconds > latency * 4:
+        errors.append(f"query took {query_seconds:.3f}s behind bulk work (model latency {latency}s)")
+    if not queued_bulk:
+        errors.append("bulk queue was already drained when the query finished; nothing was preempted")
+    return errors
+
+
+CHECKS = [
+    ("batching", check_batching),
+    ("concurrency", check_concurrency),
+    ("rate_limit", check_rate_limit),
+    ("retries", check_retries),
+    ("preemption", check_preemption),
+]
+
+
+def main() -> int:
+    failed = 0
+    for name, check in CHECKS:
+        errors = check()
+        print(f"{'✅' if not errors else '❌'} {name}")
+        for error in errors:
+            print(f"   {error}")
+        failed += bool(errors)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
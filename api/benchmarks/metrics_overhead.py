@@ -0,0 +1,89 @@
+"""
+Metrics Overhead Benchmark
+Cost of the latency instrumentation, enabled and disabled
+
+Times span() on its own, then sends the same /api/chat requests with metrics
+enabled, disabled and enabled with "X-Trace: 1". The fake models answer
+instantly (see offline.py), so every microsecond left is request overhead.
+
+Usage (from api/):
+    python benchmarks/metrics_overhead.py --requests 300
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List
+
+from offline import install_fakes, index_documents
+
+import httpx
+
+import metrics
+
+
+def span_cost(iterations: int) -> Dict[str, float]:
+    """Nanoseconds per `with span(...)` block"""
+    results = {}
+    for label, enabled in (("disabled", False), ("enabled", True)):
+        metrics.set_enabled(enabled)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with metrics.span("bench.noop"):
+                pass
+        results[label] = round((time.perf_counter() - started) / iterations * 1e9, 1)
+    return results
+
+
+async def chat_latency(client: httpx.AsyncClient, session_id: str, requests: int, headers: Dict[str, str]) -> float:
+    """Median /api/chat latency in milliseconds"""
+    latencies: List[float] = []
+    for i in range(requests):
+        started = time.perf_counter()
+        response = await client.post("/api/chat", headers=headers, json={
+            "question": f"What does topic {i % 7} cover?", "session_id": session_id
+        })
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+    latencies.sort()
+    return round(latencies[len(latencies) // 2] * 1000, 3)
+
+
+async def main(args) -> Dict:
+    install_fakes(llm_latency=0, embed_latency=0)
+    session_id = index_documents(1, chunks_per_document=50)[0]
+
+    from main import app
+    report = {"span_ns": span_cost(args.iterations), "chat_p50_ms": {}}
+    modes = [("disabled", False, {}), ("enabled", True, {}), ("enabled+trace", True, {"X-Trace": "1"})]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        metrics.set_enabled(True)
+        await chat_latency(client, session_id, 20, {})  # warm up
+        for _ in range(args.rounds):
+            # Interleaved rounds so drift affects every mode alike
+            for label, enabled, headers in modes:
+                metrics.set_enabled(enabled)
+                p50 = await chat_latency(client, session_id, args.requests // args.rounds, headers)
+                report["chat_p50_ms"].setdefault(label, []).append(p50)
+    metrics.set_enabled(True)
+    report["chat_p50_ms"] = {label: sorted(values)[len(values) // 2] for label, values in report["chat_p50_ms"].items()}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="Chat requests per mode")
+    parser.add_argument("--rounds", type=int, default=3, help="Interleaved rounds per mode")
+    parser.add_argument("--iterations", type=int, default=200000, help="span() calls to time")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    print(f"\nspan(): {report['span_ns']['disabled']}ns disabled, {report['span_ns']['enabled']}ns enabled")
+    baseline = report["chat_p50_ms"]["disabled"]
+    for label, p50 in report["chat_p50_ms"].items():
+        print(f"/api/chat p50 {label:<14} {p50:>8}ms  ({(p50 - baseline) / baseline:+.1%})")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,120 @@
+"""
+Multi-Document Chat Benchmark
+Latency of /api/chat/multi as the number of documents grows, against searching them one by one
+
+Runs fully offline (see offline.py). Every namespace search is given an injected
+latency (--shard-latency), one document is slower (--slow-latency) and, with --stall,
+one never answers within MULTI_DOC_SHARD_TIMEOUT_SECONDS. Fanned out, a request
+should take about the slowest shard plus the embedding and LLM call, not the sum
+of all shards, and a stalled shard should cost the timeout and be reported, not fail
+the request.
+
+Usage (from api/):
+    python benchmarks/multi_doc.py --documents 2 8 16 --shard-latency 0.05 --slow-latency 0.2
+    python benchmarks/multi_doc.py --documents 8 --stall --timeout 0.5
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List
+
+from offline import install_fakes, index_documents
+
+import httpx
+
+
+def inject_latency(latencies: Dict[str, float]) -> None:
+    """Delay every search of a namespace by latencies[namespace] seconds"""
+    from vector_store import get_vector_backend
+
+    backend = get_vector_backend()
+    search_by_vector = backend.search_by_vector
+
+    def slow_search(namespace, vector, k=2):
+        time.sleep(latencies.get(namespace, 0.0))
+        return search_by_vector(namespace, vector, k=k)
+
+    backend.search_by_vector = slow_search
+
+
+async def run_level(client: httpx.AsyncClient, session_ids: List[str], requests: int) -> dict:
+    from rag_engine_pinecone import _search_shard
+    from registry import registry
+
+    # Baseline: the same shards searched one after another
+    vector = registry.get_embeddings().embed_query("baseline")
+    started = time.perf_counter()
+    for session_id in session_ids:
+        _search_shard(session_id, "What does topic 3 cover?", vector)
+    sequential = time.perf_counter() - started
+
+    latencies: List[float] = []
+    last = {}
+    for i in range(requests):
+        started = time.perf_counter()
+        response = await client.post("/api/chat/multi", json={
+            "question": f"What does topic {i % 7} cover?",
+            "session_ids": session_ids,
+        })
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise Exception(f"/api/chat/multi returned {response.status_code}: {response.text}")
+        last = response.json()
+
+    latencies.sort()
+    return {
+        "documents": len(session_ids),
+        "sequential_search_ms": round(sequential * 1000, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "sources_from": len({source["session_id"] for source in last["sources"]}),
+        "timed_out": last["documents"]["timed_out"],
+    }
+
+
+async def main(args) -> List[dict]:
+    os.environ["MULTI_DOC_SHARD_TIMEOUT_SECONDS"] = str(args.timeout)
+    install_fakes(args.llm_latency, args.embed_latency)
+    session_ids = index_documents(max(args.documents), chunks_per_document=50)
+
+    latencies = {session_id: args.shard_latency for session_id in session_ids}
+    latencies[session_ids[-1]] = args.slow_latency
+    if args.stall:
+        latencies[session_ids[0]] = args.timeout * 4
+    inject_latency(latencies)
+
+    from main import app
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for documents in args.documents:
+            # Always include the slow document (and the stalled one, if any)
+            selected = session_ids[:documents - 1] + [session_ids[-1]]
+            result = await run_level(client, selected, args.requests)
+            results.append(result)
+            print(f"documents={documents:>3}  one-by-one={result['sequential_search_ms']}ms  "
+                  f"fan-out p50={result['p50_ms']}ms  max={result['max_ms']}ms  "
+                  f"timed out={len(result['timed_out'])}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, nargs="+", default=[2, 4, 8, 16], help="Documents per question")
+    parser.add_argument("--requests", type=int, default=5, help="Questions per level")
+    parser.add_argument("--shard-latency", type=float, default=0.05, help="Seconds per namespace search")
+    parser.add_argument("--slow-latency", type=float, default=0.2, help="Seconds for the one slow namespace")
+    parser.add_argument("--stall", action="store_true", help="Make one namespace outlast the timeout")
+    parser.add_argument("--timeout", type=float, default=1.0, help="MULTI_DOC_SHARD_TIMEOUT_SECONDS")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Seconds per fake LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per fake query embedding")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,186 @@
+"""
+Offline Benchmark Environment
+Temporary SQLite database, local vector backend, fake models with injectable latency
+and synthetic PDFs
+
+Import this module before any application module: it points DATABASE_URL,
+VECTOR_BACKEND, UPLOADS_DIR and the caches at a fresh temporary directory (or at
+BENCH_WORK_DIR when set, so server subprocesses share the parent's data).
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+WORK_DIR = os.getenv("BENCH_WORK_DIR") or tempfile.mkdtemp(prefix="pdf-rag-bench-")
+os.environ.update({
+    "BENCH_WORK_DIR": WORK_DIR,
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}",
+    "VECTOR_BACKEND": "local",
+    "VECTOR_STORE_DIR": os.path.join(WORK_DIR, "vector_store"),
+    "UPLOADS_DIR": os.path.join(WORK_DIR, "uploads"),
+    "ANSWER_CACHE_ENABLED": "false",
+    "EMBEDDING_CACHE_ENABLED": "false",
+    "GEMINI_API_KEY": "offline",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from vector_store import EMBEDDING_DIMENSION
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings with a fixed per-call latency"""
+    latency: float = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class SlowFakeChatModel(BaseChatModel):
+    """Chat model that answers after a fixed latency (spread over tokens when streaming)"""
+    latency: float = 0.2
+    answer: str = "The answer is in the document."
+    model: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake-chat"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+
+
+def install_fakes(llm_latency: float = 0.2, embed_latency: float = 0.0):
+    """Route the registry's embedding and LLM clients to the fakes"""
+    from registry import registry
+
+    embeddings = SlowFakeEmbeddings(size=EMBEDDING_DIMENSION, latency=embed_latency)
+    llm = SlowFakeChatModel(latency=llm_latency)
+    registry.get_embeddings = lambda model=None: embeddings
+    registry.get_llm = lambda model=None, temperature=0.1: llm
+    return embeddings, llm
+
+
+def index_documents(documents: int, chunks_per_document: int = 200) -> List[str]:
+    """Create and index synthetic documents, returns their session ids"""
+    from database import init_db, SessionLocal, save_document
+    from rag_engine_pinecone import initialize_rag
+
+    init_db()
+    session_ids = []
+    db = SessionLocal()
+    try:
+        for i in range(documents):
+            session_id = f"bench-{i}"
+            chunks = [
+                {"content": f"Document {i} section {j} discusses topic {j % 7}.", "page": j // 4 + 1, "chunk_index": j}
+                for j in range(chunks_per_document)
+            ]
+            initialize_rag(session_id, chunks)
+            save_document(db, session_id=session_id, filename=f"{session_id}.pdf", file_size=0,
+                          chunk_count=len(chunks), vector_namespace=session_id)
+            session_ids.append(session_id)
+    finally:
+        db.close()
+    return session_ids
+
+
+_WORDS = (
+    "pump valve seal bearing housing flange torque pressure sensor calibration supplier warranty "
+    "inspection clause delivery schedule tolerance assembly maintenance interval replacement "
+    "the a of to and in for with on by is are be must shall should each every unit system"
+).split()
+
+
+def synthetic_page_lines(page: int, lines: int, seed: int = 0) -> List[str]:
+    """Deterministic manual-like text lines for one page"""
+    rng = random.Random(seed * 100003 + page)
+    result = []
+    for line in range(lines):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 14))]
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), f"PN-{rng.randint(1000, 9999)}-{rng.choice('ABCDEF')}")
+        result.append(f"{page}.{line + 1} " + " ".join(words) + ".")
+    return result
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 0,
+                        changed_pages: Sequence[int] = ()) -> str:
+    """
+    Write a text PDF of `pages` pages (Helvetica, one text line per PDF line)
+
+    Built directly from PDF objects, so no PDF library is needed; pdfplumber
+    extracts the same lines back. Pages listed in changed_pages get different
+    text (as in a revised version of the same document).
+    """
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # filled in once the page ids are known
+    page_ids = []
+    for page in range(1, pages + 1):
+        lines = synthetic_page_lines(page, lines_per_page, seed + 1 if page in changed_pages else seed)
+        text = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+        content = text.encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids)
+    )
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
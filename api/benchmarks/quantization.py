@@ -0,0 +1,190 @@
+"""
+Quantized Local Index Benchmark
+Memory, latency and recall@k of int8 and binary codes with exact rescoring, against float32 search
+
+Builds --namespaces session indexes of --chunks vectors each in the local backend.
+The vectors are synthetic but clustered like a document's chunk embeddings (topic
+directions plus noise); queries are drawn from the same topics. Each mode then
+runs in a fresh process that opens every namespace and answers --queries queries
+per namespace, starting cold (the index files are dropped from the page cache,
+as on a server with more sessions than memory), reporting:
+
+    mapped_mb      resident pages of the memory-mapped index files afterwards:
+                   what searches had to read (codes, float32 rows for rescoring)
+    index_mb       size of what the first pass scans (float32 rows or codes)
+    p50_ms         median search latency, on a second (warm) pass over the queries
+    recall@k       overlap of the top k with exact float32 search
+
+Usage (from api/):
+    python benchmarks/quantization.py --namespaces 200 --chunks 500
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, List
+
+import numpy as np
+
+from offline import WORK_DIR
+from suite import percentile
+
+MODES = ("none", "int8", "binary")
+RECALL_AT = (2, 5, 10)
+
+
+def synthetic_vectors(rng: np.random.Generator, count: int, dim: int, topics: int, noise: float) -> np.ndarray:
+    """Rows clustered around `topics` random directions"""
+    centers = rng.normal(size=(topics, dim))
+    return (centers[rng.integers(0, topics, count)] + rng.normal(size=(count, dim)) * noise).astype(np.float32)
+
+
+def build(args) -> str:
+    """Write the namespaces and their queries, then the codes for every mode"""
+    from vector_store import LocalVectorBackend, EMBEDDING_DIMENSION
+
+    root = os.path.join(WORK_DIR, "quantization")
+    backend = LocalVectorBackend(root, "none")
+    queries = {}
+    for n in range(args.namespaces):
+        rng = np.random.default_rng(n)
+        vectors = synthetic_vectors(rng, args.chunks + args.queries, EMBEDDING_DIMENSION, args.topics, args.noise)
+        namespace = f"session-{n}"
+        backend.add_embeddings(
+            namespace, [f"chunk {i}" for i in range(args.chunks)], vectors[:args.chunks],
+            [{"row": i} for i in range(args.chunks)]
+        )
+        queries[namespace] = vectors[args.chunks:].tolist()
+
+    # Encode ahead of time, so measuring processes only map the codes
+    for mode in MODES[1:]:
+        coded = LocalVectorBackend(root, mode)
+        for namespace in queries:
+            coded._load(namespace)
+
+    with open(os.path.join(root, "queries.json"), "w") as f:
+        json.dump(queries, f)
+    return root
+
+
+def mapped_resident_bytes(root: str) -> int:
+    """Resident bytes of this process's mappings of files under root (from /proc/self/smaps)"""
+    total = 0
+    in_root = False
+    with open("/proc/self/smaps") as f:
+        for line in f:
+            fields = line.split()
+            if "-" in fields[0] and len(fields) >= 5:
+                in_root = len(fields) >= 6 and fields[5].startswith(root)
+            elif in_root and fields[0] == "Rss:":
+                total += int(fields[1]) * 1024
+    return total
+
+
+def drop_page_cache(root: str) -> None:
+    """Evict the index files from the page cache, so only pages read afterwards are resident"""
+    for directory, _, files in os.walk(root):
+        for name in files:
+            fd = os.open(os.path.join(directory, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def measure(root: str, mode: str, k: int) -> Dict:
+    """Child process: open every namespace in one mode and search it"""
+    from vector_store import LocalVectorBackend
+
+    drop_page_cache(root)
+
+    with open(os.path.join(root, "queries.json")) as f:
+        queries: Dict[str, List[List[float]]] = json.load(f)
+
+    backend = LocalVectorBackend(root, mode)
+    results, index_bytes = {}, 0
+    for namespace, vectors in queries.items():
+        results[namespace] = [
+            [doc.metadata["row"] for doc, _ in backend.search_by_vector(namespace, vector, k=k)]
+            for vector in vectors
+        ]
+        loaded = backend._load(namespace)
+        for array in (loaded.matrix,) if loaded.codes is None else (loaded.codes, loaded.scales):
+            index_bytes += array.nbytes if array is not None else 0
+    mapped = mapped_resident_bytes(os.path.realpath(root))
+
+    latencies = []
+    for namespace, vectors in queries.items():
+        for vector in vectors:
+            started = time.perf_counter()
+            backend.search_by_vector(namespace, vector, k=k)
+            latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    return {
+        "mapped_mb": round(mapped / 2 ** 20, 1),
+        "index_mb": round(index_bytes / 2 ** 20, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "results": results,
+    }
+
+
+def recall(exact: Dict[str, List[List[int]]], found: Dict[str, List[List[int]]], k: int) -> float:
+    hits = total = 0
+    for namespace, rows in exact.items():
+        for expected, got in zip(rows, found[namespace]):
+            hits += len(set(expected[:k]) & set(got[:k]))
+            total += len(expected[:k])
+    return round(hits / total, 4)
+
+
+def main(args) -> Dict:
+    root = build(args)
+    k = max(RECALL_AT)
+    measured = {}
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure", mode, "--root", root, "--k", str(k)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        measured[mode] = json.loads(output.strip().splitlines()[-1])
+
+    exact = measured["none"]["results"]
+    report = {}
+    for mode, result in measured.items():
+        report[mode] = {key: value for key, value in result.items() if key != "results"}
+        for at in RECALL_AT:
+            report[mode][f"recall@{at}"] = recall(exact, result["results"], at)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--namespaces", type=int, default=200, help="Session indexes")
+    parser.add_argument("--chunks", type=int, default=500, help="Vectors per namespace")
+    parser.add_argument("--queries", type=int, default=2, help="Queries per namespace")
+    parser.add_argument("--topics", type=int, default=25, help="Clusters per namespace")
+    parser.add_argument("--noise", type=float, default=2.0, help="Spread of vectors around their topic")
+    parser.add_argument("--json", help="Also write results to this file")
+    parser.add_argument("--measure", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    parser.add_argument("--k", type=int, default=10, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.root, args.measure, args.k)))
+        sys.exit(0)
+
+    report = main(args)
+    baseline = report["none"]["mapped_mb"] or 1
+    for mode, values in report.items():
+        print(f"{mode:<7} mapped={values['mapped_mb']:>7}MB ({values['mapped_mb'] / baseline:>5.0%})  "
+              f"index={values['index_mb']:>7}MB  p50={values['p50_ms']:>7}ms  "
+              + "  ".join(f"recall@{at}={values[f'recall@{at}']}" for at in RECALL_AT))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
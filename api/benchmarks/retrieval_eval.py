@@ -0,0 +1,148 @@
+"""
+Retrieval Evaluation
+Recall@k and latency of dense, BM25 and hybrid retrieval on the bundled evaluation set
+
+retrieval_eval.json is a synthetic service manual and supply agreement: part numbers,
+error codes and clause ids that differ by a digit or two, plus prose sections asked
+about by exact phrase and by paraphrase. Each query lists its relevant chunk(s).
+
+Offline (default), dense search uses a hashed bag-of-words embedding with a simulated
+per-query latency standing in for the embedding API. Identifiers are hashed by their
+sorted characters, the way subword embeddings blur "PN-4471-B" and "PN-4417-B", so
+paraphrases behave poorly but identifier confusion is realistic. --live uses the real
+embedding model instead (GEMINI_API_KEY required).
+
+Usage (from api/):
+    python benchmarks/retrieval_eval.py --k 1 2 5 --embed-latency 0.05
+    python benchmarks/retrieval_eval.py --live --json retrieval.json
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from typing import Dict, List
+
+from offline import WORK_DIR  # noqa: F401  (sets up the offline environment)
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from vector_store import EMBEDDING_DIMENSION, BackendRetriever, get_vector_backend
+from lexical_index import HybridRetriever, LexicalStore, tokenize
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_eval.json")
+NAMESPACE = "retrieval-eval"
+
+
+class HashedWordEmbeddings(Embeddings):
+    """Bag-of-words vectors by feature hashing, with a fixed per-query latency"""
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for term in tokenize(text):
+            if any(c.isdigit() for c in term):
+                term = "".join(sorted(re.sub(r"[._/-]", "", term)))
+            digest = hashlib.md5(term.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimension] += 1.0 if digest[4] & 1 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+
+def recall_at(retrieved: List[Document], relevant: List[int], k: int) -> float:
+    found = {int(doc.metadata["chunk_index"]) for doc in retrieved[:k]}
+    return len(found & set(relevant)) / len(relevant)
+
+
+async def evaluate(args) -> Dict:
+    with open(EVAL_SET, "r", encoding="utf-8") as f:
+        eval_set = json.load(f)
+
+    from registry import registry
+    if args.live:
+        embeddings = registry.get_embeddings()
+    else:
+        embeddings = HashedWordEmbeddings(latency=args.embed_latency)
+        registry.get_embeddings = lambda model=None: embeddings
+    from rag_engine_pinecone import initialize_rag
+    initialize_rag(NAMESPACE, eval_set["chunks"])
+
+    max_k = max(args.k)
+    backend = get_vector_backend()
+    lexical = LexicalStore()
+    retrievers = {
+        "dense": BackendRetriever(backend=backend, namespace=NAMESPACE, embeddings=embeddings, k=max_k),
+        "hybrid": HybridRetriever(backend=backend, lexical=lexical, namespace=NAMESPACE, embeddings=embeddings,
+                                  k=max_k, candidates=max(args.candidates, max_k)),
+    }
+
+    results = {}
+    for mode in ("dense", "lexical", "hybrid"):
+        latencies: List[float] = []
+        recalls: Dict[str, Dict[int, List[float]]] = {}
+        for query in eval_set["queries"]:
+            started = time.perf_counter()
+            if mode == "lexical":
+                hits, _ = await asyncio.get_running_loop().run_in_executor(
+                    None, lexical.search, NAMESPACE, query["question"], max_k
+                )
+                retrieved = [doc for doc, _ in hits]
+            else:
+                retrieved = await retrievers[mode].ainvoke(query["question"])
+            latencies.append(time.perf_counter() - started)
+            for kind in ("all", query["kind"]):
+                for k in args.k:
+                    recalls.setdefault(kind, {}).setdefault(k, []).append(recall_at(retrieved, query["relevant"], k))
+
+        latencies.sort()
+        results[mode] = {
+            "recall": {
+                kind: {f"@{k}": round(sum(values) / len(values), 3) for k, values in by_k.items()}
+                for kind, by_k in recalls.items()
+            },
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+        }
+    results["hybrid"]["fast_path_rate"] = lexical.stats()["fast_path_rate"]
+    return {"queries": len(eval_set["queries"]), "chunks": len(eval_set["chunks"]), "live": args.live, "modes": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 5], help="Cutoffs for recall@k")
+    parser.add_argument("--candidates", type=int, default=10, help="Candidates per ranking before fusion")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per offline query embedding")
+    parser.add_argument("--live", action="store_true", help="Use the real embedding model")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(evaluate(args))
+    kinds = list(report["modes"]["dense"]["recall"])
+    print(f"\n{report['queries']} queries over {report['chunks']} chunks")
+    for mode, result in report["modes"].items():
+        extra = f"  fast path {result['fast_path_rate']:.0%}" if "fast_path_rate" in result else ""
+        print(f"\n{mode:<8} p50={result['p50_ms']}ms  p95={result['p95_ms']}ms{extra}")
+        for kind in kinds:
+            cells = "  ".join(f"R{cutoff}={value:.2f}" for cutoff, value in result["recall"][kind].items())
+            print(f"  {kind:<11} {cells}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,344 @@
+"""
+Offline Benchmark Suite
+Measured cost of every ingestion and chat stage, comparable across commits
+
+Runs without network access (see offline.py): synthetic PDFs of the requested
+page counts, deterministic fake embedding and chat models with injectable
+latency, the local vector backend and a temporary SQLite database.
+
+Stages:
+    process_pdf[Np]      extract and chunk an N-page PDF               (pages/s)
+    chunk_text[Np]       chunk the extracted text only                 (chunks/s)
+    initialize_rag[Np]   embed and store the chunks in a new namespace (chunks/s)
+    upload[Np]           POST /api/upload until the ingestion job ends (pages/s)
+    reupload[Np]         upload a new version with 2 changed pages     (pages/s)
+    chat                 sequential POST /api/chat                     (requests/s)
+    chat_stream          sequential POST /api/chat/stream              (requests/s)
+    chat_concurrent      POST /api/chat with --concurrency in flight   (requests/s)
+
+For each: p50/p95/p99/mean latency, throughput, peak RSS while the stage ran
+(and growth over it), and database statements per run. Results are written as
+JSON; `compare` flags regressions between two result files.
+
+Usage (from api/):
+    python benchmarks/suite.py run --pages 10 100 --json before.json
+    python benchmarks/suite.py run --pages 10 100 --json after.json
+    python benchmarks/suite.py compare before.json after.json --tolerance 0.15
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import platform
+import asyncio
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from offline import WORK_DIR, install_fakes, index_documents, write_synthetic_pdf
+
+import httpx
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """Resident set size in bytes (peak-so-far on platforms without /proc)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RSSSampler:
+    """Samples RSS in a background thread while a stage runs"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end = current_rss()
+        self.peak = max(self.peak, self.end)
+        return False
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], wall: float, units: float, unit: str, rss: RSSSampler, queries: int) -> Dict:
+    latencies = sorted(latencies)
+    runs = len(latencies)
+    return {
+        "runs": runs,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / runs * 1000, 3) if runs else 0.0,
+        "throughput": round(units / wall, 2) if wall else 0.0,
+        "throughput_unit": unit,
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        "rss_growth_mb": round((rss.end - rss.start) / 2 ** 20, 1),
+        "db_queries_per_run": round(queries / runs, 2) if runs else 0.0,
+    }
+
+
+def measure(runs: int, call: Callable[[int], float], unit: str) -> Dict:
+    """
+    Run a synchronous stage `runs` times; call(i) returns the units of work done
+    (pages, chunks, requests) for the throughput figure
+    """
+    from database import total_queries
+
+    latencies, units = [], 0.0
+    queries_before = total_queries()
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        for i in range(runs):
+            run_started = time.perf_counter()
+            units += call(i)
+            latencies.append(time.perf_counter() - run_started)
+        wall = time.perf_counter() - started
+    return summarize(latencies, wall, units, unit, rss, total_queries() - queries_before)
+
+
+async def ameasure(runs: int, call: Callable, unit: str, concurrency: int = 1) -> Dict:
+    """Async variant of measure() with up to `concurrency` runs in flight"""
+    from database import total_queries
+
+    latencies, units = [], [0.0]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            run_started = time.perf_counter()
+            units[0] += await call(i)
+            latencies.append(time.perf_counter() - run_started)
+
+    queries_before = total_queries()
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(runs)))
+        wall = time.perf_counter() - started
+    return summarize(latencies, wall, units[0], unit, rss, total_queries() - queries_before)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_suite(args) -> Dict:
+    install_fakes(args.llm_latency, args.embed_latency)
+
+    from pdf_processor import process_pdf, extract_text_from_pdf, chunk_text
+    from rag_engine_pinecone import initialize_rag, clear_session
+
+    stages: Dict[str, Dict] = {}
+
+    def report(name: str, result: Dict) -> None:
+        stages[name] = result
+        print(f"{name:<22} p50={result['p50_ms']:>9}ms  p95={result['p95_ms']:>9}ms  p99={result['p99_ms']:>9}ms  "
+              f"{result['throughput']:>9} {result['throughput_unit']:<10} peak={result['peak_rss_mb']}MB  "
+              f"queries/run={result['db_queries_per_run']}")
+
+    # Ingestion stages, per document size
+    documents = {}
+    for pages in args.pages:
+        path = write_synthetic_pdf(os.path.join(WORK_DIR, f"synthetic-{pages}.pdf"), pages)
+        revised = write_synthetic_pdf(os.path.join(WORK_DIR, f"synthetic-{pages}-v2.pdf"), pages,
+                                      changed_pages=(2, pages // 2 + 1))
+        documents[pages] = (path, revised)
+        runs = max(1, args.ingest_runs if pages <= 100 else args.ingest_runs // 2)
+
+        report(f"process_pdf[{pages}p]", measure(runs, lambda i: process_pdf(path) and pages, "pages/s"))
+
+        text = extract_text_from_pdf(path)["text"]
+        report(f"chunk_text[{pages}p]", measure(runs, lambda i: len(chunk_text(text)), "chunks/s"))
+
+        chunks = process_pdf(path)
+
+        def index(i: int) -> int:
+            namespace = f"suite-{pages}-{i}"
+            stored = initialize_rag(namespace, chunks)
+            clear_session(namespace)
+            return stored
+
+        report(f"initialize_rag[{pages}p]", measure(runs, index, "chunks/s"))
+
+    # HTTP stages
+    session_id = index_documents(1, chunks_per_document=args.chat_chunks)[0]
+    from main import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        async def ingest(session_id: str, filename: str, body: bytes) -> Dict:
+            response = await client.post(
+                "/api/upload",
+                files={"file": (filename, body, "application/pdf")},
+                data={"session_id": session_id}
+            )
+            response.raise_for_status()
+            job_id = response.json()["job_id"]
+            while True:
+                job = (await client.get(f"/api/jobs/{job_id}")).json()
+                if job["status"] in ("completed", "failed", "cancelled"):
+                    if job["status"] != "completed":
+                        raise Exception(f"Ingestion job {job_id} ended {job['status']}: {job.get('error')}")
+                    return job
+                await asyncio.sleep(0.01)
+
+        for pages, (path, revised) in documents.items():
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+            with open(revised, "rb") as f:
+                revised_bytes = f.read()
+
+            # Distinct bytes per run so deduplication does not skip the work
+            async def upload(i: int, pages=pages, pdf_bytes=pdf_bytes) -> float:
+                await ingest(f"upload-{pages}-{i}", f"synthetic-{pages}.pdf", pdf_bytes + b"\n%% run " + str(i).encode())
+                return pages
+
+            # New version of each document uploaded above; unchanged pages skip embedding
+            # (their vectors are copied, so every chunk is still written)
+            async def reupload(i: int, pages=pages, revised_bytes=revised_bytes) -> float:
+                await ingest(f"upload-{pages}-{i}", f"synthetic-{pages}.pdf", revised_bytes + b"\n%% run " + str(i).encode())
+                return pages
+
+            runs = max(1, args.ingest_runs if pages <= 100 else args.ingest_runs // 2)
+            report(f"upload[{pages}p]", await ameasure(runs, upload, "pages/s"))
+            report(f"reupload[{pages}p]", await ameasure(runs, reupload, "pages/s"))
+
+        async def chat(i: int) -> float:
+            response = await client.post("/api/chat", json={
+                "question": f"What does topic {i % 7} cover?", "session_id": session_id
+            })
+            response.raise_for_status()
+            return 1
+
+        async def chat_stream(i: int) -> float:
+            response = await client.post("/api/chat/stream", json={
+                "question": f"What does topic {i % 7} cover?", "session_id": session_id
+            })
+            response.raise_for_status()
+            return 1
+
+        await ameasure(5, chat, "requests/s")  # warm up clients, retriever and session context
+        report("chat", await ameasure(args.chat_requests, chat, "requests/s"))
+        report("chat_stream", await ameasure(args.chat_requests, chat_stream, "requests/s"))
+        report("chat_concurrent", await ameasure(args.chat_requests, chat, "requests/s", args.concurrency))
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("command", "json")},
+        },
+        "stages": stages,
+    }
+
+
+# Comparison: metric -> True if higher is worse
+COMPARED = {
+    "p50_ms": True,
+    "p95_ms": True,
+    "p99_ms": True,
+    "throughput": False,
+    "peak_rss_mb": True,
+    "db_queries_per_run": True,
+}
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float, rss_tolerance: float) -> int:
+    """Print per-stage changes; returns the number of regressions"""
+    if baseline["meta"].get("args") != current["meta"].get("args"):
+        print("⚠️  Runs used different arguments; differences may not be regressions")
+
+    regressions = 0
+    print(f"{'stage':<22} {'metric':<20} {'baseline':>11} {'current':>11} {'change':>8}")
+    for stage, before in baseline["stages"].items():
+        after = current["stages"].get(stage)
+        if after is None:
+            print(f"{stage:<22} (missing from current run)")
+            continue
+        for metric, higher_is_worse in COMPARED.items():
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            if metric == "db_queries_per_run":
+                worse = new > old  # statement counts are exact
+            else:
+                limit = rss_tolerance if metric == "peak_rss_mb" else tolerance
+                worse = change > limit if higher_is_worse else change < -limit
+            regressions += worse
+            marker = "  ❌" if worse else ""
+            print(f"{stage:<22} {metric:<20} {old:>11} {new:>11} {change:>+8.1%}{marker}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the suite")
+    run.add_argument("--pages", type=int, nargs="+", default=[10, 100], help="Synthetic PDF sizes")
+    run.add_argument("--ingest-runs", type=int, default=6, help="Runs per ingestion stage (halved above 100 pages)")
+    run.add_argument("--chat-requests", type=int, default=100, help="Requests per chat stage")
+    run.add_argument("--chat-chunks", type=int, default=200, help="Chunks in the chat benchmark document")
+    run.add_argument("--concurrency", type=int, default=8, help="In-flight requests for chat_concurrent")
+    run.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call")
+    run.add_argument("--embed-latency", type=float, default=0.01, help="Seconds per fake embedding call")
+    run.add_argument("--json", help="Write results to this file")
+
+    diff = commands.add_parser("compare", help="Compare two result files")
+    diff.add_argument("baseline")
+    diff.add_argument("current")
+    diff.add_argument("--tolerance", type=float, default=0.10, help="Allowed latency/throughput change")
+    diff.add_argument("--rss-tolerance", type=float, default=0.10, help="Allowed peak RSS growth")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        results = asyncio.run(run_suite(args))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {args.json}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance, args.rss_tolerance)
+        print(f"\n{'❌' if regressions else '✅'} {regressions} regression(s)")
+        sys.exit(1 if regressions else 0)
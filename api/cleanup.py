@@ -0,0 +1,121 @@
+"""
+Cleanup Tasks
+Removes vectors and upload files freed by document deletes in the background,
+from tasks persisted in the database and retried with backoff until they succeed
+"""
+
+import os
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Optional
+
+from database import (
+    SessionLocal, CleanupTask, get_due_cleanup_tasks, next_cleanup_due_at,
+    get_indexed_content, has_pending_jobs_for_content
+)
+from ingestion import content_lock
+from rag_engine_pinecone import clear_session
+
+# Attempts before a task is marked failed (left in the table for inspection)
+CLEANUP_MAX_ATTEMPTS = int(os.getenv("CLEANUP_MAX_ATTEMPTS", "8"))
+
+# Retry delay doubles per attempt: 5s, 10s, 20s, ... capped at one hour
+CLEANUP_RETRY_BASE_SECONDS = 5
+CLEANUP_RETRY_MAX_SECONDS = 3600
+
+# Pending tasks are re-checked at least this often
+CLEANUP_POLL_SECONDS = 30.0
+
+_wake = threading.Event()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def start_cleanup_worker() -> None:
+    """Start the background worker (idempotent); it resumes tasks left by a previous process"""
+    global _worker
+    if not SessionLocal:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="cleanup", daemon=True)
+            _worker.start()
+
+
+def notify_cleanup() -> None:
+    """Wake the worker after queueing a task"""
+    _wake.set()
+
+
+def run_cleanup_task(db, task: CleanupTask) -> None:
+    """
+    Remove a task's vectors and file
+
+    Runs under the content lock, so it cannot interleave with an ingestion job
+    for the same bytes. If that content was indexed again since the delete,
+    the vectors and file are in use and nothing is removed.
+    """
+    lock = content_lock(task.content_hash) if task.content_hash else nullcontext()
+    with lock:
+        if task.content_hash and get_indexed_content(db, task.content_hash):
+            return
+
+        if task.vector_namespace:
+            clear_session(task.vector_namespace, raise_errors=True)
+
+        # A queued job for the same bytes still needs the file
+        if task.file_path and not (task.content_hash and has_pending_jobs_for_content(db, task.content_hash)):
+            if os.path.exists(task.file_path):
+                os.remove(task.file_path)
+
+
+def process_due_tasks(limit: int = 50) -> int:
+    """Run due cleanup tasks once, returns how many were attempted"""
+    db = SessionLocal()
+    try:
+        tasks = get_due_cleanup_tasks(db, limit=limit)
+        for task in tasks:
+            task.attempts = (task.attempts or 0) + 1
+            try:
+                run_cleanup_task(db, task)
+                task.status = "done"
+                task.error = None
+                task.completed_at = datetime.utcnow()
+            except Exception as e:
+                task.error = str(e)[:2000]
+                if task.attempts >= CLEANUP_MAX_ATTEMPTS:
+                    task.status = "failed"
+                    print(f"⚠️  Cleanup task {task.id} failed after {task.attempts} attempts: {e}")
+                else:
+                    delay = min(CLEANUP_RETRY_MAX_SECONDS, CLEANUP_RETRY_BASE_SECONDS * 2 ** (task.attempts - 1))
+                    task.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                    print(f"⚠️  Cleanup task {task.id} failed, retrying in {delay}s: {e}")
+            db.commit()
+        return len(tasks)
+    finally:
+        db.close()
+
+
+def _seconds_until_next_task() -> float:
+    db = SessionLocal()
+    try:
+        due_at = next_cleanup_due_at(db)
+    finally:
+        db.close()
+    if due_at is None:
+        return CLEANUP_POLL_SECONDS
+    return min(CLEANUP_POLL_SECONDS, max(0.0, (due_at - datetime.utcnow()).total_seconds()))
+
+
+def _run() -> None:
+    while True:
+        _wake.clear()
+        try:
+            if process_due_tasks():
+                continue  # there may be more due tasks
+            timeout = _seconds_until_next_task()
+        except Exception as e:
+            print(f"⚠️  Cleanup worker error: {e}")
+            timeout = CLEANUP_POLL_SECONDS
+        _wake.wait(timeout=timeout)
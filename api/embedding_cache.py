@@ -0,0 +1,261 @@
+"""
+Embedding Cache
+Disk-backed cache of embedding vectors keyed by model name + normalized text hash
+"""
+
+import os
+import re
+import asyncio
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Vectors are stored as float16: half the size of float32, and the rounding
+# error is far below what changes a cosine similarity ranking
+STORAGE_DTYPE = np.float16
+
+# Hits update last_access in memory; the rows are written once this many are
+# pending or this many seconds have passed, and always before an eviction
+ACCESS_FLUSH_ROWS = 1000
+ACCESS_FLUSH_SECONDS = 30.0
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    """Cache key for a text embedded with a given model"""
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed vector store for embeddings with LRU eviction
+
+    Entries beyond max_entries are evicted oldest-access-first, in batches of
+    evict_batch so a full cache does not pay for an eviction on every put.
+    The entry count is kept in memory (the file belongs to this process).
+    Hit/miss counters cover the lifetime of this process.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 evict_batch: Optional[int] = None):
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", os.path.join("cache", "embeddings.sqlite3"))
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+        self.evict_batch = evict_batch or max(1, self.max_entries // 20)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._pending_access: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """Look up vectors for keys, marking the found ones as recently used"""
+        if not keys:
+            return {}
+
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=STORAGE_DTYPE).astype(np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._pending_access.update((key, now) for key in found)
+                if (len(self._pending_access) >= ACCESS_FLUSH_ROWS
+                        or time.monotonic() - self._last_flush >= ACCESS_FLUSH_SECONDS):
+                    self._flush_access()
+                    self._conn.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]) -> None:
+        """Store vectors, evicting least recently used entries past the size cap"""
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=STORAGE_DTYPE).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            ).rowcount
+            if inserted < len(rows):
+                # Some keys were already cached (e.g. two callers missed at once): refresh them
+                self._conn.executemany(
+                    "UPDATE embeddings SET vector = ?, last_access = ? WHERE key = ?",
+                    [(blob, last_access, key) for key, blob, last_access in rows]
+                )
+            self._entries += inserted
+
+            if self._entries > self.max_entries:
+                # Evict down to a batch below the cap, by up-to-date access times
+                self._flush_access()
+                evicted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (self._entries - self.max_entries + self.evict_batch,)
+                ).rowcount
+                self._entries -= evicted
+                self.evictions += evicted
+            self._conn.commit()
+
+    def flush(self) -> None:
+        """Write pending last_access updates"""
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+
+    def _flush_access(self) -> None:
+        """Write pending last_access updates in one statement batch (caller holds the lock and commits)"""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(last_access, key) for key, last_access in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+        self._last_flush = time.monotonic()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries = self._entries
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "max_entries": self.max_entries,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults an EmbeddingCache before calling the model
+
+    Serves both document (ingestion) and query embeddings. Identical texts
+    within one call are only embedded once.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), computed))
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Query and document embeddings can differ (task type), so keep them apart
+        key = cache_key(f"{self.model}#query", text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = await loop.run_in_executor(None, self.cache.get_many, keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            computed = await self.embeddings.aembed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), computed))
+            await loop.run_in_executor(None, self.cache.put_many, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # SQLite lookups run in a worker thread; the model call is awaited
+        loop = asyncio.get_running_loop()
+        key = cache_key(f"{self.model}#query", text)
+        cached = await loop.run_in_executor(None, self.cache.get_many, [key])
+        if key in cached:
+            return cached[key]
+
+        vector = await self.embeddings.aembed_query(text)
+        await loop.run_in_executor(None, self.cache.put_many, {key: vector})
+        return vector
+
+
+# Cache (singleton)
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the shared embedding cache, or None when EMBEDDING_CACHE_ENABLED=false
+    """
+    global _embedding_cache
+
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+    return _embedding_cache
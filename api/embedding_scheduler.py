@@ -0,0 +1,222 @@
+"""
+Embedding Scheduler
+Batches embedding requests and runs them with bounded concurrency, a token-bucket
+rate limit and jittered retries, serving interactive queries ahead of bulk ingestion
+"""
+
+import os
+import time
+import asyncio
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter (one token per request)
+
+    Bulk callers must leave `reserve` tokens in the bucket, so a burst of
+    ingestion can never use up the allowance interactive queries rely on.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float, reserve: float = 1.0):
+        self.rate = rate_per_second
+        self.capacity = max(capacity, 1.0)
+        self.reserve = min(reserve, self.capacity - 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: str = BULK) -> float:
+        """Block until a token is available, returns seconds spent waiting"""
+        if self.rate <= 0:
+            return 0.0  # rate limiting disabled
+
+        needed = 1.0 + (self.reserve if priority == BULK else 0.0)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= needed:
+                    self._tokens -= 1.0
+                    return waited
+                delay = (needed - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class _Task:
+    def __init__(self, priority: str, call: Callable[[], Any]):
+        self.priority = priority
+        self.call = call
+        self.future: Future = Future()
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Embeddings wrapper that schedules calls to an underlying embedding model
+
+    - embed_documents splits texts into requests of at most batch_size texts
+    - max_concurrency worker threads send requests; bulk work may occupy at
+      most max_concurrency - 1 of them, so one is always free for queries
+    - every request takes a token from the rate limiter first
+    - failed requests are retried with exponential backoff and full jitter
+
+    Any Embeddings implementation can be scheduled; benchmarks/embedding_scheduler.py
+    checks the behaviour above against the offline fake model.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size or int(os.getenv("EMBED_REQUEST_BATCH_SIZE", "100"))
+        self.max_concurrency = max(1, max_concurrency or int(os.getenv("EMBED_MAX_CONCURRENCY", "4")))
+        rpm = requests_per_minute if requests_per_minute is not None else float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "1500"))
+        self.rate_limiter = TokenBucket(
+            rate_per_second=rpm / 60.0,
+            capacity=burst or float(os.getenv("EMBED_BURST", "10"))
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("EMBED_MAX_RETRIES", "5"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+
+        # Bulk may use all workers but one (unless there is only one worker)
+        self._bulk_limit = max(1, self.max_concurrency - 1)
+        self._bulk_running = 0
+        self._queues = {INTERACTIVE: deque(), BULK: deque()}
+        self._cv = threading.Condition()
+        self._stats = {"requests": 0, "texts": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+        for i in range(self.max_concurrency):
+            threading.Thread(target=self._worker, name=f"embed-{i}", daemon=True).start()
+
+    # Scheduling
+    def _submit(self, priority: str, call: Callable[[], Any]) -> Future:
+        task = _Task(priority, call)
+        with self._cv:
+            self._queues[priority].append(task)
+            self._cv.notify()
+        return task.future
+
+    def _next_task(self) -> _Task:
+        with self._cv:
+            while True:
+                if self._queues[INTERACTIVE]:
+                    return self._queues[INTERACTIVE].popleft()
+                if self._queues[BULK] and self._bulk_running < self._bulk_limit:
+                    self._bulk_running += 1
+                    return self._queues[BULK].popleft()
+                self._cv.wait()
+
+    def _worker(self) -> None:
+        while True:
+            task = self._next_task()
+            try:
+                task.future.set_result(self._run_with_retries(task))
+            except BaseException as e:
+                task.future.set_exception(e)
+            finally:
+                if task.priority == BULK:
+                    with self._cv:
+                        self._bulk_running -= 1
+                        self._cv.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _run_with_retries(self, task: _Task) -> Any:
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire(task.priority)
+            try:
+                result = task.call()
+                with self._stats_lock:
+                    self._stats["requests"] += 1
+                    self._stats["throttled_seconds"] += waited
+                return result
+            except Exception:
+                if attempt >= self.max_retries:
+                    with self._stats_lock:
+                        self._stats["failures"] += 1
+                    raise
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                self._sleep(self._backoff(attempt))
+                attempt += 1
+
+    # Embeddings interface
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Bulk (ingestion) priority"""
+        futures = [
+            self._submit(BULK, lambda batch=texts[start:start + self.batch_size]: self.embeddings.embed_documents(batch))
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        with self._stats_lock:
+            self._stats["texts"] += len(texts)
+
+        vectors: List[List[float]] = []
+        for future in futures:
+            vectors.extend(future.result())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """Interactive priority"""
+        with self._stats_lock:
+            self._stats["texts"] += 1
+        return self._submit(INTERACTIVE, lambda: self.embeddings.embed_query(text)).result()
+
+    # Async callers await the scheduler's futures instead of blocking a thread
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = [
+            asyncio.wrap_future(self._submit(BULK, lambda batch=texts[start:start + self.batch_size]: self.embeddings.embed_documents(batch)))
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        with self._stats_lock:
+            self._stats["texts"] += len(texts)
+
+        vectors: List[List[float]] = []
+        for batch_vectors in await asyncio.gather(*futures):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with self._stats_lock:
+            self._stats["texts"] += 1
+        return await asyncio.wrap_future(self._submit(INTERACTIVE, lambda: self.embeddings.embed_query(text)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        with self._cv:
+            stats["queued_interactive"] = len(self._queues[INTERACTIVE])
+            stats["queued_bulk"] = len(self._queues[BULK])
+            stats["bulk_running"] = self._bulk_running
+        stats["max_concurrency"] = self.max_concurrency
+        return stats
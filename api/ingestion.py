@@ -0,0 +1,329 @@
+"""
+Ingestion Jobs
+Runs the extract → chunk → embed → index pipeline (iter_versioned_chunks → initialize_rag)
+in a bounded background worker pool, persisting progress so jobs can be polled
+and resumed after a restart
+
+Uploading to a session that already has a document makes a new version of it.
+Namespaces stay immutable per content hash: the new version is indexed into its
+own namespace, copying vectors of unchanged pages from the previous version by
+stable chunk id, and the document switches over (releasing the previous
+content) when the job completes. Until then the previous version keeps serving.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from database import (
+    SessionLocal, Document, IngestionJob, get_ingestion_job, get_unfinished_jobs,
+    get_indexed_content, acquire_indexed_content, release_document_content, has_pending_jobs_for_content
+)
+from pdf_processor import iter_versioned_chunks
+from rag_engine_pinecone import initialize_rag, clear_session
+from session_context import session_contexts
+from metrics import span
+
+# Number of documents ingested concurrently
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+# Reuse vectors of unchanged pages when a document is re-uploaded (otherwise every page is re-embedded)
+DOCUMENT_VERSIONING_ENABLED = os.getenv("DOCUMENT_VERSIONING_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Progress counters are written at most this often (stage changes are written immediately)
+PROGRESS_WRITE_INTERVAL = 1.0
+
+# Progress stages shown to clients, in pipeline order. Extraction and embedding
+# overlap when streaming; the stage moves to "embedding" once vectors are stored.
+STAGES = ["queued", "extracting", "chunking", "embedding", "finalizing", "done"]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Jobs submitted by this process: resume_jobs() runs during warm-up, when
+# uploads may already have queued some of the jobs it finds
+_submitted_jobs = set()
+
+# Serializes indexing and freeing of the same content across requests and workers
+_content_locks: Dict[str, threading.Lock] = {}
+_content_locks_guard = threading.Lock()
+
+
+def content_lock(content_hash: str) -> threading.Lock:
+    """Lock guarding index/free of one content hash"""
+    with _content_locks_guard:
+        return _content_locks.setdefault(content_hash, threading.Lock())
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+        return _executor
+
+
+def submit_job(job_id) -> bool:
+    """Schedule a persisted job on the worker pool, unless it already is; returns whether it was scheduled"""
+    executor = _get_executor()
+    with _executor_lock:
+        if str(job_id) in _submitted_jobs:
+            return False
+        _submitted_jobs.add(str(job_id))
+    executor.submit(run_job, job_id)
+    return True
+
+
+def resume_jobs() -> int:
+    """Re-queue jobs left queued or running by a previous process, returns how many"""
+    if not SessionLocal:
+        return 0
+
+    db = SessionLocal()
+    try:
+        resumed = sum(1 for job in get_unfinished_jobs(db) if submit_job(job.id))
+        if resumed:
+            print(f"🔁 Resuming {resumed} ingestion job(s)")
+        return resumed
+    finally:
+        db.close()
+
+
+class _JobProgress:
+    """
+    Progress callback that persists stage and counters on the job row
+
+    Stages only move forward. on_first_vectors runs (before the commit)
+    the first time chunks are reported as stored.
+    """
+
+    def __init__(self, db, job: IngestionJob, on_first_vectors: Optional[Callable[[], None]] = None):
+        self.db = db
+        self.job = job
+        self.on_first_vectors = on_first_vectors
+        self._last_write = 0.0
+
+    def __call__(self, stage: str, done: int, total: int) -> None:
+        stage_changed = STAGES.index(stage) > STAGES.index(self.job.stage)
+        if stage_changed:
+            self.job.stage = stage
+        if stage == "extracting":
+            self.job.pages_done, self.job.pages_total = done, total
+        elif stage == "embedding":
+            # Total is unknown while the document is still streaming in
+            if done and not self.job.chunks_embedded and self.on_first_vectors:
+                self.on_first_vectors()
+            self.job.chunks_embedded, self.job.chunks_total = done, max(total, done)
+
+        now = time.monotonic()
+        if stage_changed or now - self._last_write >= PROGRESS_WRITE_INTERVAL:
+            self.db.commit()
+            self._last_write = now
+
+
+def _free_unreferenced(db, job: IngestionJob, namespace: str) -> None:
+    """Drop vectors (and the file, unless another job needs it) for content nobody references"""
+    clear_session(namespace)
+    if not has_pending_jobs_for_content(db, job.content_hash, exclude_job_id=job.id):
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+
+def _previous_version(db, job: IngestionJob) -> Optional[Tuple[str, Dict]]:
+    """(namespace, page_manifest) of the version a job replaces, if its pages can be reused"""
+    if not DOCUMENT_VERSIONING_ENABLED:
+        return None
+    document = db.query(Document).filter(Document.session_id == job.session_id).first()
+    if document is None or document.status != "active" or not document.content_hash:
+        return None
+    previous = get_indexed_content(db, document.content_hash)
+    if previous is None or not previous.page_manifest:
+        return None
+    return previous.vector_namespace, previous.page_manifest
+
+
+def run_job(job_id) -> None:
+    """
+    Run one ingestion job to completion
+
+    Content that is already indexed is reused. Otherwise any partial vectors
+    from an interrupted earlier attempt are cleared and the document is
+    re-indexed; chunks embedded by that attempt are served from the embedding cache.
+    For a new version of a document, unchanged pages reuse the previous version's vectors
+    instead of being embedded again (they are still written to the new namespace).
+    """
+    try:
+        with span("ingest.job"):
+            _run_job(job_id)
+    finally:
+        with _executor_lock:
+            _submitted_jobs.discard(str(job_id))
+
+
+def _run_job(job_id) -> None:
+    db = SessionLocal()
+    job = None
+    newly_indexed = False
+    namespace = None
+    try:
+        job = get_ingestion_job(db, job_id)
+        if not job or job.status not in ("queued", "running"):
+            return
+
+        job.status = "running"
+        job.attempts = (job.attempts or 0) + 1
+        job.started_at = job.started_at or datetime.utcnow()
+        job.error = None
+        db.commit()
+
+        def expose_partial_index():
+            # Let the document be queried over the pages indexed so far
+            db.query(Document).filter(
+                Document.session_id == job.session_id,
+                Document.status == "processing"
+            ).update({Document.vector_namespace: namespace}, synchronize_session=False)
+
+        progress = _JobProgress(db, job, on_first_vectors=expose_partial_index)
+        with content_lock(job.content_hash):
+            page_manifest = None
+            indexed = get_indexed_content(db, job.content_hash)
+            if indexed:
+                # Same bytes already indexed: reuse chunks and vectors
+                namespace = indexed.vector_namespace
+                chunk_count = indexed.chunk_count
+                job.deduplicated = True
+                job.chunks_reused = chunk_count
+            else:
+                namespace = job.content_hash
+                clear_session(namespace)  # leftovers from an interrupted attempt
+                newly_indexed = True
+                previous = _previous_version(db, job)
+                reuse_namespace, previous_manifest = previous or (None, None)
+
+                # Pages stream through chunking into batched embedding/upserts
+                progress("extracting", 0, 0)
+                failed_pages = []
+                page_manifest = {}
+                reuse_stats = {}
+                chunks = iter_versioned_chunks(job.file_path, previous_manifest, page_manifest,
+                                               progress=progress, failed_pages=failed_pages)
+                chunk_count = initialize_rag(namespace, chunks, progress=progress,
+                                             reuse_namespace=reuse_namespace, reuse_stats=reuse_stats)
+                job.failed_pages = failed_pages or None
+                if previous_manifest:
+                    previous_hashes = {text_hash for _, text_hash, _ in previous_manifest["pages"]}
+                    job.pages_reused = sum(1 for _, text_hash, _ in page_manifest["pages"] if text_hash in previous_hashes)
+                job.chunks_reused = reuse_stats.get("reused", 0)
+
+            progress("finalizing", 0, 0)
+            # Locked so a concurrent delete cannot release the previous version's content twice
+            document = db.query(Document).filter(Document.session_id == job.session_id).with_for_update().first()
+            if document is None:
+                # Document was deleted while processing
+                if newly_indexed:
+                    _free_unreferenced(db, job, namespace)
+                job.status = "cancelled"
+                job.stage = "done"
+                job.completed_at = datetime.utcnow()
+                db.commit()
+                return
+
+            # Reference the new content, release the previous version's and
+            # activate the document in one commit
+            acquire_indexed_content(
+                db,
+                content_hash=job.content_hash,
+                vector_namespace=namespace,
+                file_path=job.file_path,
+                file_size=job.file_size,
+                chunk_count=chunk_count,
+                page_manifest=page_manifest
+            )
+            cleanup_task = release_document_content(db, document)
+            document.content_hash = job.content_hash
+            document.vector_namespace = namespace
+            document.chunk_count = chunk_count
+            document.file_size = job.file_size
+            document.filename = job.filename or document.filename
+            document.status = "active"
+            job.chunks_total = job.chunks_embedded = chunk_count
+            job.status = "completed"
+            job.stage = "done"
+            job.completed_at = datetime.utcnow()
+            db.commit()
+
+        # Chats resolve the new namespace from here on
+        session_contexts.invalidate(job.session_id)
+        if cleanup_task:
+            from cleanup import notify_cleanup  # cleanup imports this module
+            notify_cleanup()
+        reused = f", {job.chunks_reused} reused" if job.chunks_reused and not job.deduplicated else ""
+        written = 0 if job.deduplicated else chunk_count
+        print(f"✅ Ingestion job {job.id} completed ({chunk_count} chunks{reused}, {written} vectors written)")
+
+    except Exception as e:
+        print(f"⚠️  Ingestion job {job_id} failed: {e}")
+        db.rollback()
+        if job is not None:
+            try:
+                if newly_indexed and namespace:
+                    _free_unreferenced(db, job, namespace)
+                job.status = "failed"
+                job.error = str(e)[:2000]
+                job.completed_at = datetime.utcnow()
+                db.query(Document).filter(
+                    Document.session_id == job.session_id,
+                    Document.status == "processing"
+                ).update({Document.status: "failed"}, synchronize_session=False)
+                db.commit()
+            except Exception as inner:
+                db.rollback()
+                print(f"⚠️  Could not record failure of job {job_id}: {inner}")
+    finally:
+        db.close()
+
+
+def job_to_dict(job: IngestionJob) -> Dict:
+    """Serialize a job with overall progress and ETA"""
+    # Embedding keeps pace with extraction, so pages parsed measure overall progress
+    if job.status == "completed":
+        fraction = 1.0
+    elif job.stage == "finalizing":
+        fraction = 0.99
+    elif job.pages_total:
+        fraction = 0.98 * job.pages_done / job.pages_total
+    else:
+        fraction = 0.0
+
+    eta_seconds = None
+    if job.status == "running" and job.started_at and 0 < fraction < 1:
+        elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed * (1 - fraction) / fraction, 1)
+
+    return {
+        "job_id": str(job.id),
+        "session_id": job.session_id,
+        "status": job.status,
+        "stage": job.stage,
+        "pages_done": job.pages_done or 0,
+        "pages_total": job.pages_total or 0,
+        "chunks_embedded": job.chunks_embedded or 0,
+        "chunks_total": job.chunks_total or 0,
+        "progress": round(fraction, 3),
+        "eta_seconds": eta_seconds,
+        "deduplicated": bool(job.deduplicated),
+        # New versions: pages/chunks whose vectors were copied from the previous version vs extracted and embedded
+        "pages_reused": job.pages_reused or 0,
+        "pages_recomputed": max(0, (job.pages_total or 0) - (job.pages_reused or 0) - len(job.failed_pages or [])),
+        "chunks_reused": job.chunks_reused or 0,
+        "chunks_recomputed": max(0, (job.chunks_total or 0) - (job.chunks_reused or 0)),
+        # Vector upserts: every chunk of newly indexed content, copied or embedded (none when deduplicated)
+        "vectors_written": 0 if job.deduplicated else job.chunks_embedded or 0,
+        "failed_pages": job.failed_pages or [],
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+    }
@@ -0,0 +1,359 @@
+"""
+Lexical Index
+Per-namespace BM25 inverted index over document chunks, and a hybrid retriever
+that fuses it with dense vector search
+"""
+
+import os
+import re
+import json
+import math
+import shutil
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from metrics import span
+from registry import LRUCache
+
+# Fuse BM25 with dense search (false: dense search only, as before)
+HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Candidates taken from each ranking before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))
+
+# Reciprocal-rank fusion constant: score = sum of 1 / (RRF_K + rank)
+RRF_K = 60
+
+# Lexical-only fast path: the top BM25 hit must beat the runner-up by this factor
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.5"))
+
+# Namespaces kept loaded (least recently used are dropped and rebuilt from disk on next use)
+LEXICAL_INDEX_MAX_NAMESPACES = int(os.getenv("LEXICAL_INDEX_MAX_NAMESPACES", "256"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
+_SEPARATOR_RE = re.compile(r"[._/-]")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it its of on or
+should that the their there this to was what when where which who why will with you your
+""".split())
+
+
+def _stem(token: str) -> str:
+    # Plural folding only; identifiers (anything with a digit) are kept verbatim
+    if len(token) > 4 and token.isalpha() and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms for indexing and querying
+
+    Compound tokens such as part numbers ("pn-4471-b") and clause ids ("7.3.2")
+    are kept whole and also indexed by their parts, so both exact and partial
+    identifiers match.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(_stem(token))
+        if not token.isalnum():
+            terms.extend(_stem(part) for part in _SEPARATOR_RE.split(token) if part and part not in STOPWORDS)
+    return terms
+
+
+def identifier_terms(text: str) -> List[str]:
+    """Whole tokens that contain a digit (part numbers, clause ids, error codes)"""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if any(c.isdigit() for c in token)]
+
+
+def chunk_key(metadata: Dict) -> Tuple:
+    """Identity of a chunk across backends (Pinecone returns numeric metadata as floats)"""
+    return (int(metadata.get("page", 0)), int(metadata.get("chunk_index", 0)))
+
+
+class _LexicalNamespace:
+    """In-memory BM25 postings for one namespace"""
+
+    def __init__(self):
+        self.records: List[Dict] = []  # [{"text", "metadata"}], same order as doc ids
+        self.lengths: List[int] = []
+        self.total_length = 0
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}  # term -> [(doc id, term frequency)]
+        self.lock = threading.Lock()
+
+    def add(self, record: Dict, tf: Dict[str, int]) -> None:
+        with self.lock:
+            doc_id = len(self.records)
+            self.records.append(record)
+            length = sum(tf.values())
+            self.lengths.append(length)
+            self.total_length += length
+            for term, count in tf.items():
+                self.postings.setdefault(term, []).append((doc_id, count))
+
+    def search(self, query: str, k: int) -> Tuple[List[Tuple[Document, float]], bool]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self.lock:
+            n = len(self.records)
+            if not n or not terms or k <= 0:
+                return [], False
+            avg_length = self.total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: -item[1])[:max(k, 2)]
+            confident = self._confident(query, ranked)
+            results = [
+                (Document(page_content=self.records[doc_id]["text"], metadata=dict(self.records[doc_id]["metadata"])), score)
+                for doc_id, score in ranked[:k]
+            ]
+        return results, confident
+
+    def _confident(self, query: str, ranked: List[Tuple[int, float]]) -> bool:
+        """
+        Whether the top hit is unambiguous enough to skip dense search: the query
+        names an identifier, the top chunk contains every identifier in the query,
+        and it clearly outscores the runner-up
+        """
+        identifiers = identifier_terms(query)
+        if not ranked or not identifiers:
+            return False
+        top_id, top_score = ranked[0]
+        top_terms = set()
+        for token in _TOKEN_RE.findall(self.records[top_id]["text"].lower()):
+            top_terms.add(token)
+            top_terms.update(_SEPARATOR_RE.split(token))
+        if not all(identifier in top_terms for identifier in identifiers):
+            return False
+        return len(ranked) == 1 or top_score >= LEXICAL_FAST_PATH_MARGIN * ranked[1][1]
+
+
+class LexicalStore:
+    """
+    BM25 indexes per vector namespace
+
+    Each namespace is persisted under LEXICAL_INDEX_DIR (default: VECTOR_STORE_DIR,
+    next to the local backend's vectors) as `lexical.jsonl`, one record per chunk
+    with its text, metadata and term frequencies, and `lexical.json` holding the
+    committed record count. Batches are appended, like the local vector backend,
+    so indexing streams with ingestion. Postings are rebuilt in memory on first use;
+    the max_namespaces most recently used stay loaded.
+    """
+
+    # Cached in place of a namespace that has no index, so it is not looked up on disk again
+    _NO_INDEX = object()
+
+    def __init__(self, root_dir: Optional[str] = None, max_namespaces: Optional[int] = None):
+        self.root_dir = root_dir or os.getenv("LEXICAL_INDEX_DIR") or os.getenv("VECTOR_STORE_DIR", "vector_store")
+        self._namespaces = LRUCache(max_namespaces or LEXICAL_INDEX_MAX_NAMESPACES)
+        self._lock = threading.RLock()
+        self._counters = {"fast_path": 0, "hybrid": 0, "dense_only": 0}
+
+    def _namespace_dir(self, namespace: str) -> str:
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", namespace)
+        return os.path.join(self.root_dir, safe_name)
+
+    def _load(self, namespace: str) -> Optional[_LexicalNamespace]:
+        with self._lock:
+            cached = self._namespaces.get(namespace)
+            if cached is not None:
+                return None if cached is self._NO_INDEX else cached
+
+            ns_dir = self._namespace_dir(namespace)
+            meta_path = os.path.join(ns_dir, "lexical.json")
+            loaded = None
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    count = json.load(f)["count"]
+                loaded = _LexicalNamespace()
+                records_path = os.path.join(ns_dir, "lexical.jsonl")
+                with open(records_path, "rb") as f:
+                    for _ in range(count):
+                        record = json.loads(f.readline())
+                        loaded.add({"text": record["text"], "metadata": record["metadata"]}, record["tf"])
+                    committed = f.tell()
+                # Records past the committed count are an interrupted append; drop
+                # them so the next append lines up with the count again
+                if os.path.getsize(records_path) > committed:
+                    os.truncate(records_path, committed)
+            # Documents indexed before lexical indexing have none (dense search only)
+            self._namespaces.put(namespace, self._NO_INDEX if loaded is None else loaded)
+            return loaded
+
+    def add_documents(self, namespace: str, documents: Sequence[Document]) -> int:
+        """Index chunks (appending to the namespace), returns number indexed"""
+        if not documents:
+            return 0
+
+        records = []
+        for doc in documents:
+            tf: Dict[str, int] = {}
+            for term in tokenize(doc.page_content):
+                tf[term] = tf.get(term, 0) + 1
+            records.append({"text": doc.page_content, "metadata": dict(doc.metadata), "tf": tf})
+
+        with self._lock:
+            loaded = self._load(namespace)
+            first_batch = loaded is None
+            if first_batch:
+                loaded = _LexicalNamespace()
+                self._namespaces.put(namespace, loaded)
+
+            ns_dir = self._namespace_dir(namespace)
+            os.makedirs(ns_dir, exist_ok=True)
+            # A first batch overwrites anything an uncommitted earlier attempt left
+            with open(os.path.join(ns_dir, "lexical.jsonl"), "w" if first_batch else "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+
+            for record in records:
+                loaded.add({"text": record["text"], "metadata": record["metadata"]}, record["tf"])
+
+            # Commit the new count atomically so readers never see a partial batch
+            meta_path = os.path.join(ns_dir, "lexical.json")
+            tmp_path = meta_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"count": len(loaded.records)}, f)
+            os.replace(tmp_path, meta_path)
+
+        return len(records)
+
+    def search(self, namespace: str, query: str, k: int) -> Tuple[List[Tuple[Document, float]], bool]:
+        """
+        Top-k chunks by BM25 score
+
+        Returns:
+            (results, confident) - confident means dense search can be skipped
+        """
+        loaded = self._load(namespace)
+        if loaded is None:
+            return [], False
+        return loaded.search(query, k)
+
+    def delete_namespace(self, namespace: str) -> None:
+        """Drop a namespace's index from memory and disk"""
+        with self._lock:
+            self._namespaces.pop(namespace)
+            ns_dir = self._namespace_dir(namespace)
+            for name in ("lexical.json", "lexical.jsonl"):
+                path = os.path.join(ns_dir, name)
+                if os.path.exists(path):
+                    os.remove(path)
+            # The directory is shared with the local backend's vectors
+            if os.path.isdir(ns_dir) and not os.listdir(ns_dir):
+                shutil.rmtree(ns_dir)
+
+    def record(self, mode: str) -> None:
+        with self._lock:
+            self._counters[mode] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            loaded = sum(1 for ns in self._namespaces.values() if ns is not self._NO_INDEX)
+        queries = sum(counters.values())
+        return {
+            **counters,
+            "fast_path_rate": round(counters["fast_path"] / queries, 4) if queries else 0.0,
+            "loaded_namespaces": loaded,
+        }
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int, rrf_k: int = RRF_K) -> List[Document]:
+    """Merge rankings by summed 1 / (rrf_k + rank); a chunk keeps its first-seen Document"""
+    scores: Dict[Tuple, float] = {}
+    documents: Dict[Tuple, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = chunk_key(doc.metadata)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    ordered = sorted(scores, key=lambda key: -scores[key])
+    return [documents[key] for key in ordered[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing BM25 and dense search with reciprocal-rank fusion
+
+    When BM25 alone is confident (see _LexicalNamespace._confident), its hits
+    are returned without embedding the query at all.
+    """
+    backend: Any
+    lexical: Any
+    namespace: str
+    embeddings: Any
+    k: int = 2
+    candidates: int = RETRIEVAL_CANDIDATES
+
+    def _fuse(self, lexical: List[Tuple[Document, float]], dense: List[Tuple[Document, float]]) -> List[Document]:
+        if not lexical:
+            self.lexical.record("dense_only")
+            return [doc for doc, _ in dense[:self.k]]
+        self.lexical.record("hybrid")
+        return reciprocal_rank_fusion([[doc for doc, _ in dense], [doc for doc, _ in lexical]], self.k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with span("retrieval.lexical"):
+            lexical, confident = self.lexical.search(self.namespace, query, self.candidates)
+        if confident:
+            self.lexical.record("fast_path")
+            return [doc for doc, _ in lexical[:self.k]]
+        with span("retrieval.embed"):
+            vector = self.embeddings.embed_query(query)
+        with span("retrieval.vector_search"):
+            dense = self.backend.search_by_vector(self.namespace, vector, k=self.candidates)
+        return self._fuse(lexical, dense)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        with span("retrieval.lexical"):
+            lexical, confident = await loop.run_in_executor(
+                None, self.lexical.search, self.namespace, query, self.candidates
+            )
+        if confident:
+            self.lexical.record("fast_path")
+            return [doc for doc, _ in lexical[:self.k]]
+        with span("retrieval.embed"):
+            vector = await self.embeddings.aembed_query(query)
+        with span("retrieval.vector_search"):
+            dense = await loop.run_in_executor(
+                None, self.backend.search_by_vector, self.namespace, vector, self.candidates
+            )
+        return self._fuse(lexical, dense)
+
+
+# Store (singleton)
+_lexical_store: Optional[LexicalStore] = None
+_lexical_store_lock = threading.Lock()
+
+
+def get_lexical_store() -> LexicalStore:
+    """Get the process-wide lexical store"""
+    global _lexical_store
+    with _lexical_store_lock:
+        if _lexical_store is None:
+            _lexical_store = LexicalStore()
+        return _lexical_store
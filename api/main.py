@@ -1,35 +1,60 @@
 """
 FastAPI Backend for PDF Document Q&A Assistant
+
+Only FastAPI and the database layer are imported here; the RAG pipeline
+(LangChain, vector stores, ingestion) is loaded by the startup warm-up and
+imported inside the endpoints that use it (see startup.py).
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
-import uvicorn
+from typing import List, Optional
+from datetime import date, datetime, timezone
 import os
+import json
+import asyncio
+from contextlib import aclosing, asynccontextmanager, suppress
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from pdf_processor import process_pdf
-from rag_engine_pinecone import initialize_rag, query_rag, is_session_initialized, clear_session
-from database import get_db, init_db, save_document, get_all_documents, get_chat_history
+from database import (
+    AsyncSessionLocal, get_async_db, total_queries, asave_document, aget_document, aget_indexed_content,
+    ahas_pending_jobs_for_session, acreate_ingestion_job, aget_ingestion_job, adelete_document, aget_documents_page,
+    aget_messages_page, astream_messages, aget_token_usage, aget_usage_report, InvalidCursor
+)
+from session_context import session_contexts
+from upload_storage import UPLOADS_DIR, UploadTooLarge, UploadSizeLimitMiddleware, stage_upload
+from startup import init_database, warm_up, load_pipeline, pipeline_loaded, check_ready
+import metrics
+from metrics import MetricsMiddleware, span
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="PDF RAG API", version="1.0.0")
 
-# Initialize database on startup
-@app.on_event("startup")
-async def startup_event():
-    try:
-        init_db()
-    except Exception as e:
-        print(f"⚠️  Database initialization failed: {e}")
-        print("💡 App will continue, but database features won't work")
-        print("💡 Fix DATABASE_URL in .env and restart")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema first, so no request sees a half-migrated database
+    database_ok = await init_database()
+    # Pipeline imports, job resumption and client warm-up run while serving; see /ready
+    warmup = asyncio.create_task(warm_up(database_ok))
+    yield
+    warmup.cancel()
+    with suppress(asyncio.CancelledError):
+        await warmup
+
+
+app = FastAPI(title="PDF RAG API", version="1.0.0", lifespan=lifespan)
+
+# Page size for /api/documents and /api/chat-history (?limit= overrides up to the max)
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+
+# Oversized uploads are refused before the multipart body is parsed (and spooled);
+# added first so CORS headers and metrics still cover the 413
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/api/upload"])
 
 # CORS middleware
 app.add_middleware(
@@ -38,8 +63,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Request counts, latency and DB statements per route; stage breakdown on "X-Trace: 1"
+app.add_middleware(MetricsMiddleware)
+
+
+def _collect_stats():
+    """Existing stats counters, exported alongside the metrics"""
+    contexts = session_contexts.stats()
+    families = [
+        ("rag_db_statements_total", "counter", "Database statements executed", [({}, total_queries())]),
+        ("rag_session_context_lookups_total", "counter", "Session context cache lookups",
+         [({"result": "hit"}, contexts["hits"]), ({"result": "miss"}, contexts["misses"])]),
+    ]
+    if not pipeline_loaded():
+        # A scrape during startup must not import the pipeline on the event loop
+        return families
+
+    from embedding_cache import get_embedding_cache
+    from lexical_index import get_lexical_store
+
+    embedding_cache = get_embedding_cache()
+    retrieval = get_lexical_store().stats()
+    families.append(("rag_retrievals_total", "counter", "Retrievals by path",
+                     [({"mode": mode}, retrieval[mode]) for mode in ("fast_path", "hybrid", "dense_only") if mode in retrieval]))
+    if embedding_cache:
+        cache = embedding_cache.stats()
+        families.append(("rag_embedding_cache_lookups_total", "counter", "Embedding cache lookups",
+                         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]))
+    return families
+
+
+metrics.register_collector(_collect_stats)
+
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -47,10 +105,16 @@ class ChatRequest(BaseModel):
     session_id: str = "default"
 
 
+class MultiChatRequest(BaseModel):
+    question: str
+    session_ids: List[str]
+
+
 class ChatResponse(BaseModel):
     answer: str
     sources: List[str]
     success: bool
+    cached: bool = False
 
 
 class UploadResponse(BaseModel):
@@ -58,6 +122,10 @@ class UploadResponse(BaseModel):
     message: str
     chunks: int
     session_id: str
+    job_id: str
+    status: str
+    deduplicated: bool = False
+    new_version: bool = False
 
 
 @app.get("/")
@@ -67,80 +135,187 @@ async def root():
 
 @app.get("/health")
 async def health():
+    """Liveness: the process is up and serving (see /ready for dependencies)"""
     return {"status": "healthy"}
 
 
-@app.post("/api/upload", response_model=UploadResponse)
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 200 once the startup warm-up succeeded and the database answers,
+    503 while warming up or when a dependency is unavailable
+    """
+    report = await check_ready()
+    return JSONResponse(status_code=200 if report["status"] == "ready" else 503, content=report)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Metrics in the Prometheus text format: per-stage latency histograms,
+    request counts/latency/DB statements per route and cache counters
+    """
+    if not metrics.METRICS_ENABLED:
+        return PlainTextResponse("# metrics disabled (METRICS_ENABLED=false)\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats")
+async def stats():
+    """
+    Cache and client reuse statistics
+    """
+    await load_pipeline()
+    from registry import registry
+    from embedding_cache import get_embedding_cache
+    from answer_cache import answer_cache
+    from lexical_index import get_lexical_store
+
+    embedding_cache = get_embedding_cache()
+    return {
+        "resources": registry.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "answer_cache": answer_cache.stats(),
+        "embedding_scheduler": registry.scheduler_stats(),
+        "session_contexts": session_contexts.stats(),
+        "retrieval": get_lexical_store().stats(),
+        "database": {"queries": total_queries()},
+    }
+
+
+@app.post("/api/upload", response_model=UploadResponse, status_code=202)
 async def upload_pdf(
     file: UploadFile = File(...),
     session_id: str = Form("default"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Upload and process PDF file
+    Upload a PDF and queue it for processing
+    Returns 202 with a job id; poll /api/jobs/{job_id} for progress
+
+    Uploading to a session that already has a document replaces it with a new
+    version: the current version keeps serving until the job completes, and
+    only changed pages are re-embedded (the job reports pages/chunks reused
+    vs recomputed). 409 while the session's previous upload is still processing.
     """
+    staged = None
     try:
         # Validate file type
         if file.content_type != "application/pdf":
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
-        # Create uploads directory
-        uploads_dir = "uploads"
-        os.makedirs(uploads_dir, exist_ok=True)
-
-        # Save file
-        file_path = os.path.join(uploads_dir, f"{session_id}-{file.filename}")
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-
-        # Process PDF
-        chunks = process_pdf(file_path)
-
-        # Initialize RAG
-        initialize_rag(session_id, chunks)
-
-        # Save document to database
-        save_document(
-            db=db,
-            session_id=session_id,
-            filename=file.filename or "unknown.pdf",
-            file_size=len(content),
-            chunk_count=len(chunks)
-        )
+        # Stream upload to a temp file, hashing as it goes
+        try:
+            with span("upload.stage_file"):
+                staged = await stage_upload(file)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        content_hash = staged.content_hash
+        filename = file.filename or "unknown.pdf"
+        with span("upload.db"):
+            # Informational only: the job re-checks and reuses indexed content
+            deduplicated = await aget_indexed_content(db, content_hash) is not None
+
+            document = await aget_document(db, session_id)
+            new_version = document is not None and document.status == "active"
+            if document is None:
+                # Document is visible right away and becomes 'active' when its job completes
+                await asave_document(
+                    db=db,
+                    session_id=session_id,
+                    filename=filename,
+                    file_size=staged.size,
+                    chunk_count=0,
+                    status="processing"
+                )
+            elif document.status == "processing" or await ahas_pending_jobs_for_session(db, session_id):
+                raise HTTPException(status_code=409, detail="The previous upload for this session is still processing")
+            elif document.status == "failed":
+                # Nothing to keep serving: retry as a first upload
+                document.status = "processing"
+            file_path = os.path.join(UPLOADS_DIR, f"{content_hash}.pdf")
+            job = await acreate_ingestion_job(
+                db,
+                session_id=session_id,
+                content_hash=content_hash,
+                file_path=file_path,
+                file_size=staged.size,
+                deduplicated=deduplicated,
+                filename=filename
+            )
 
-        return UploadResponse(
-            success=True,
-            message="PDF processed successfully",
-            chunks=len(chunks),
-            session_id=session_id
+        # Move file into place once the job exists, so a concurrent delete of the
+        # same content sees the pending job and keeps the file. Identical bytes
+        # make replacing an existing copy harmless.
+        with span("upload.commit_file"):
+            staged.commit(file_path)
+        await load_pipeline()
+        from ingestion import submit_job
+        submit_job(job.id)
+
+        return JSONResponse(
+            status_code=202,
+            content=UploadResponse(
+                success=True,
+                message="New version queued for processing" if new_version else "PDF queued for processing",
+                chunks=0,
+                session_id=session_id,
+                job_id=str(job.id),
+                status=job.status,
+                deduplicated=deduplicated,
+                new_version=new_version
+            ).model_dump()
         )
 
+    except HTTPException:
+        if staged:
+            staged.discard()
+        raise
     except Exception as e:
+        await db.rollback()
+        if staged:
+            staged.discard()
         raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
 
 
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Get ingestion job progress
+    """
+    job = await aget_ingestion_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    await load_pipeline()
+    from ingestion import job_to_dict
+    return job_to_dict(job)
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Query the RAG system with a question
     Uses sliding window: only last 1 message for context (POC)
     """
     try:
+        await load_pipeline()
+        from rag_engine_pinecone import query_rag, is_session_initialized
+
         # Check if session is initialized
-        if not is_session_initialized(request.session_id, db):
+        if not await is_session_initialized(request.session_id, db):
             raise HTTPException(
                 status_code=400,
                 detail="Please upload a PDF first"
             )
 
         # Query RAG (with database session for sliding window)
-        result = query_rag(request.session_id, request.question, db)
+        result = await query_rag(request.session_id, request.question, db)
 
         return ChatResponse(
             answer=result["answer"],
             sources=result["sources"],
-            success=True
+            success=True,
+            cached=result.get("cached", False)
         )
 
     except Exception as e:
@@ -150,65 +325,113 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
         )
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Query the RAG system, streaming the answer as server-sent events
+    Events: 'sources' (retrieved sources), 'token' (answer text as generated),
+    'usage' (token usage, once the answer is saved) or 'error'; with "X-Trace: 1",
+    a final 'trace' event holds the stage breakdown
+    """
+    await load_pipeline()
+    from rag_engine_pinecone import stream_rag, is_session_initialized
+
+    if not await is_session_initialized(request.session_id, db):
+        raise HTTPException(status_code=400, detail="Please upload a PDF first")
+
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def events():
+        # Own session: the request-scoped one may be closed before streaming ends
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                async with aclosing(stream_rag(request.session_id, request.question, stream_db)) as stream:
+                    async for event, data in stream:
+                        yield sse(event, data)
+                # Stages run after the headers were sent, so the trace goes in the stream
+                trace = metrics.current_trace()
+                if trace is not None:
+                    yield sse("trace", trace)
+            except asyncio.CancelledError:
+                # Client disconnected: generation stops and nothing is saved
+                print(f"⚠️  Chat stream for {request.session_id} cancelled by client")
+                raise
+            except Exception as e:
+                yield sse("error", {"detail": f"Failed to generate answer: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/chat/multi")
+async def chat_multi(request: MultiChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Ask one question across several documents
+    Documents are searched concurrently and answered in a single LLM call;
+    each source names the document it came from. Not saved to chat history.
+    """
+    await load_pipeline()
+    from rag_engine_pinecone import query_multi_rag, MULTI_DOC_MAX_DOCUMENTS
+
+    if not request.session_ids:
+        raise HTTPException(status_code=400, detail="session_ids must not be empty")
+    if len(request.session_ids) > MULTI_DOC_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MULTI_DOC_MAX_DOCUMENTS} documents can be queried at once"
+        )
+
+    try:
+        result = await query_multi_rag(request.session_ids, request.question, db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"success": True, **result}
+
+
 @app.delete("/api/document/{session_id}")
-async def delete_document(session_id: str, db: Session = Depends(get_db)):
+async def delete_document(session_id: str, db: AsyncSession = Depends(get_async_db)):
     """
-    Delete a document and all related data (Pinecone vectors, chat history, messages, token usage)
+    Delete a document and all related data (chat sessions, messages and token usage
+    cascade in the database; vectors and the upload file are removed in the background)
     """
     try:
-        from database import Document, ChatSession, Message, TokenUsage
-        import os
-        
-        # Get document
-        document = db.query(Document).filter(Document.session_id == session_id).first()
-        if not document:
-            raise HTTPException(status_code=404, detail="Document not found")
-        
-        # Delete from Pinecone
-        try:
-            clear_session(session_id)
-        except Exception as e:
-            print(f"⚠️  Error clearing Pinecone: {e}")
-        
-        # Delete related chat sessions
-        chat_sessions = db.query(ChatSession).filter(ChatSession.document_id == document.id).all()
-        for chat_session in chat_sessions:
-            # Delete all messages in this chat session
-            db.query(Message).filter(Message.chat_session_id == chat_session.id).delete()
-            # Delete the chat session
-            db.delete(chat_session)
-        
-        # Delete token usage records
-        db.query(TokenUsage).filter(TokenUsage.session_id == session_id).delete()
-        
-        # Delete the document
-        db.delete(document)
-        db.commit()
-        
-        # Delete uploaded file if exists
-        try:
-            uploads_dir = "uploads"
-            file_path = os.path.join(uploads_dir, f"{session_id}-{document.filename}")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            print(f"⚠️  Error deleting file: {e}")
-        
-        return {"success": True, "message": f"Document {session_id} deleted successfully"}
-    
-    except HTTPException:
-        raise
+        task = await adelete_document(db, session_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Document not found")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete document: {str(e)}")
+    
+    session_contexts.invalidate(session_id)
+    if task:
+        await load_pipeline()
+        from cleanup import notify_cleanup
+        notify_cleanup()
+    
+    return {"success": True, "message": f"Document {session_id} deleted successfully"}
 
 
 @app.get("/api/documents")
-async def get_documents(db: Session = Depends(get_db)):
+async def get_documents(
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Get all uploaded documents
+    Get uploaded documents, newest first
+    Keyset-paginated: pass the returned next_cursor to get the following page
     """
-    documents = get_all_documents(db)
+    try:
+        documents, next_cursor = await aget_documents_page(db, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "documents": [
             {
@@ -216,34 +439,108 @@ async def get_documents(db: Session = Depends(get_db)):
                 "session_id": doc.session_id,
                 "filename": doc.filename,
                 "chunk_count": doc.chunk_count,
+                "status": doc.status,
                 "uploaded_at": doc.uploaded_at.isoformat(),
             }
             for doc in documents
-        ]
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+def _message_to_dict(msg) -> dict:
+    return {
+        "id": str(msg.id),
+        "role": msg.role,
+        "content": msg.content,
+        "sources": msg.sources,
+        "created_at": msg.created_at.isoformat(),
     }
 
 
 @app.get("/api/chat-history/{session_id}")
-async def get_chat_history_endpoint(session_id: str, db: Session = Depends(get_db)):
+async def get_chat_history_endpoint(
+    session_id: str,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Get chat history for a session
+    Returns the most recent messages (oldest first); next_cursor pages back to older ones
     """
-    messages = get_chat_history(db, session_id)
+    context = await session_contexts.resolve(db, session_id)
+    if context is None:
+        return {"messages": [], "next_cursor": None}
+    
+    try:
+        messages, next_cursor = await aget_messages_page(db, context.chat_session_id, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "messages": [
-            {
-                "id": str(msg.id),
-                "role": msg.role,
-                "content": msg.content,
-                "sources": msg.sources,
-                "created_at": msg.created_at.isoformat(),
-            }
-            for msg in messages
-        ]
+        "messages": [_message_to_dict(msg) for msg in messages],
+        "next_cursor": next_cursor,
     }
 
 
+@app.get("/api/chat-history/{session_id}/export")
+async def export_chat_history(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Export a session's full chat history as NDJSON (one message per line, oldest first)
+    Streamed from a server-side cursor, so memory stays flat for long histories
+    """
+    context = await session_contexts.resolve(db, session_id)
+    if context is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    async def lines():
+        # Own session: the request-scoped one may be closed before streaming ends
+        async with AsyncSessionLocal() as export_db:
+            async for msg in astream_messages(export_db, context.chat_session_id):
+                yield json.dumps(_message_to_dict(msg)) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-{session_id}.ndjson"'}
+    )
+
+
+@app.get("/api/usage")
+async def get_usage_report(
+    group_by: str = "day,model",
+    session_id: Optional[str] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Token usage report from the daily rollup
+    group_by: comma-separated subset of session, day, model (empty for one total);
+    since/until: inclusive UTC days (YYYY-MM-DD)
+    """
+    fields = tuple(field.strip() for field in group_by.split(",") if field.strip())
+    try:
+        rows = await aget_usage_report(db, fields, session_id, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": list(fields), "rows": rows}
+
+
+@app.get("/api/usage/{session_id}")
+async def get_usage(session_id: str, since: Optional[datetime] = None, db: AsyncSession = Depends(get_async_db)):
+    """
+    Get token usage totals for a session, optionally since an ISO timestamp (UTC)
+    """
+    if since is not None and since.tzinfo is not None:
+        # Timestamps are stored as naive UTC
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    usage = await aget_token_usage(db, session_id, since)
+    return {"session_id": session_id, **usage}
+
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -0,0 +1,345 @@
+"""
+Metrics
+Per-stage latency spans, request counters and a Prometheus text endpoint
+
+Stages (database lookups, embedding calls, vector searches, LLM generation, ...)
+are timed with span() and exported as the rag_stage_seconds histogram. Every
+HTTP request is counted with its latency and number of database statements.
+Sending "X-Trace: 1" returns the request's stage breakdown in a Server-Timing
+header (streamed endpoints can add it to the stream with current_trace()).
+
+With METRICS_ENABLED=false, span() returns a shared no-op context manager and
+the middleware passes requests straight through, so the cost is one flag check.
+"""
+
+import os
+import time
+import bisect
+import threading
+import contextvars
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Request header asking for the stage breakdown
+TRACE_HEADER = b"x-trace"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55)
+LLM_CALL_BUCKETS = (0, 1, 2, 3, 5)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Histogram with fixed buckets and labels (cumulative buckets rendered on export)"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+# Metrics
+stage_seconds = Histogram("rag_stage_seconds", "Duration of pipeline stages", ["stage"])
+stage_errors = Counter("rag_stage_errors_total", "Pipeline stages that raised", ["stage"])
+http_requests = Counter("rag_http_requests_total", "HTTP requests", ["method", "route", "status"])
+http_seconds = Histogram("rag_http_request_seconds", "HTTP request latency (until the last body byte)", ["method", "route"])
+http_db_queries = Histogram("rag_http_request_db_queries", "Database statements per HTTP request", ["method", "route"],
+                            buckets=QUERY_COUNT_BUCKETS)
+chat_llm_calls = Histogram("rag_chat_llm_calls", "LLM calls per chat request (0 when answered from cache)", ["endpoint"],
+                           buckets=LLM_CALL_BUCKETS)
+
+_METRICS = [stage_seconds, stage_errors, http_requests, http_seconds, http_db_queries, chat_llm_calls]
+
+# Extra samples computed at scrape time: fn() -> [(name, type, help, [(labels dict, value)])]
+_collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def register_collector(collector: Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]) -> None:
+    """Add samples read from existing stats (cache counters etc.) at scrape time"""
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            print(f"⚠️  Metrics collector failed: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+# Spans
+class _RequestTrace:
+    """Stages finished so far in a traced request, and its DB statement counter"""
+    __slots__ = ("stages", "queries")
+
+    def __init__(self, queries):
+        self.stages: List[Tuple[str, float]] = []
+        self.queries = queries
+
+
+_trace: contextvars.ContextVar[Optional[_RequestTrace]] = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def current_trace() -> Optional[Dict[str, Any]]:
+    """Stage breakdown of the current request if it asked for a trace, else None"""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    return {
+        "stages": [{"stage": stage, "ms": round(seconds * 1000, 2)} for stage, seconds in trace.stages],
+        "db_statements": trace.queries.count,
+    }
+
+
+def set_enabled(enabled: bool) -> None:
+    """Turn instrumentation on or off at runtime (benchmarks)"""
+    global METRICS_ENABLED
+    METRICS_ENABLED = enabled
+
+
+def _record(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.stages.append((stage, seconds))
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _record(self.stage, time.perf_counter() - self.started)
+        if exc_type is not None:
+            stage_errors.inc(1, self.stage)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage: str):
+    """
+    Time a block as one observation of rag_stage_seconds{stage=...}
+
+    Works around awaits as well; in a worker thread it still feeds the
+    histogram, but the request trace only sees spans opened in the request's
+    own task (wrap the awaited run_in_executor call instead).
+    """
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span(stage)
+
+
+def timed_iter(stage: str, iterable: Iterable) -> Iterator:
+    """Yield from iterable, recording the total time spent producing items as one span"""
+    if not METRICS_ENABLED:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    spent = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                spent += time.perf_counter() - started
+                break
+            spent += time.perf_counter() - started
+            yield item
+    finally:
+        _record(stage, spent)
+
+
+class _LLMTiming:
+    """LangChain callback recording every LLM call as an "llm.generate" span"""
+
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            _record("llm.generate", time.perf_counter() - started)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            _record("llm.generate", time.perf_counter() - started)
+            stage_errors.inc(1, "llm.generate")
+
+
+# Built on first use, so importing metrics (the middleware) does not load LangChain
+_llm_timing_callback: Optional[type] = None
+
+
+def llm_callbacks() -> list:
+    """Callbacks to pass to LLM calls (none when metrics are disabled)"""
+    global _llm_timing_callback
+    if not METRICS_ENABLED:
+        return []
+    if _llm_timing_callback is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+        _llm_timing_callback = type("LLMTimingCallback", (_LLMTiming, BaseCallbackHandler), {})
+    return [_llm_timing_callback()]
+
+
+def observe_llm_calls(endpoint: str, calls: int) -> None:
+    """Record how many LLM calls one chat request made (rag_chat_llm_calls)"""
+    if METRICS_ENABLED:
+        chat_llm_calls.observe(calls, endpoint)
+
+
+# HTTP middleware
+def _server_timing(trace: _RequestTrace) -> bytes:
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in trace.stages]
+    entries.append(f'db;desc="{trace.queries.count} statements"')
+    return ", ".join(entries).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests, their latency and database statements
+
+    Routes are labelled by their path template (/api/chat-history/{session_id}),
+    so label cardinality stays bounded. For streamed responses the latency runs
+    to the last body chunk, while a requested Server-Timing header (sent with the
+    response start) covers the stages finished before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        from database import count_queries
+
+        wants_trace = any(name == TRACE_HEADER and value not in (b"", b"0") for name, value in scope.get("headers", ()))
+        status = {"code": 500}
+        started = time.perf_counter()
+
+        with count_queries() as counter:
+            trace = _RequestTrace(counter) if wants_trace else None
+            token = _trace.set(trace)
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                    if trace is not None:
+                        message["headers"] = list(message.get("headers", [])) + [
+                            (b"server-timing", _server_timing(trace))
+                        ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                _trace.reset(token)
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                method = scope.get("method", "")
+                http_requests.inc(1, method, path, str(status["code"]))
+                http_seconds.observe(time.perf_counter() - started, method, path)
+                http_db_queries.observe(counter.count, method, path)
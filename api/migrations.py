@@ -0,0 +1,271 @@
+"""
+Schema Migrations
+Versioned schema changes for databases created before the current models
+
+init_db() creates missing tables with create_all, which never alters an existing
+table. Changes to existing tables (columns, indexes, constraints) are listed here and applied
+in order on startup; the schema_version table records which ones have run. Every
+migration is written to be a no-op on a database create_all just built, so a fresh
+database simply gets all versions recorded.
+"""
+
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select, delete, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+# Serializes migrations across processes sharing a PostgreSQL database
+MIGRATION_LOCK_KEY = 7250316
+
+_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration:
+    """One schema change; downgrade is optional and only used by benchmarks/tooling"""
+
+    def __init__(self, version: int, description: str, upgrade: Callable[[Connection], None],
+                 downgrade: Optional[Callable[[Connection], None]] = None):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.downgrade = downgrade
+
+
+# 1: columns added to documents for content deduplication
+def _add_document_content_columns(conn: Connection) -> None:
+    columns = {column["name"] for column in inspect(conn).get_columns("documents")}
+    if "content_hash" not in columns:
+        conn.execute(text("ALTER TABLE documents ADD COLUMN content_hash VARCHAR(64)"))
+    if "vector_namespace" not in columns:
+        conn.execute(text("ALTER TABLE documents ADD COLUMN vector_namespace VARCHAR(255)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)"))
+
+
+# 2: cascading foreign keys (added to the models with cascade deletes)
+CASCADE_FOREIGN_KEYS = [
+    # (table, column, referenced table, referenced column), parents first
+    ("chat_sessions", "document_id", "documents", "id"),
+    ("messages", "chat_session_id", "chat_sessions", "id"),
+    ("token_usage", "session_id", "documents", "session_id"),
+]
+
+
+def _add_cascade_foreign_keys(conn: Connection) -> None:
+    if conn.dialect.name != "postgresql":
+        # SQLite cannot add a constraint to an existing table without rebuilding it
+        if conn.dialect.name == "sqlite" and not _has_cascade_foreign_keys(conn):
+            print("💡 SQLite database predates cascading deletes; recreate it to enable them")
+        return
+
+    inspector = inspect(conn)
+    for table, column, ref_table, ref_column in CASCADE_FOREIGN_KEYS:
+        existing = [fk for fk in inspector.get_foreign_keys(table) if fk["constrained_columns"] == [column]]
+        if any((fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE" for fk in existing):
+            continue
+
+        # Rows left behind by deletes that predate the constraint would block it
+        conn.execute(text(
+            f"DELETE FROM {table} WHERE {column} IS NOT NULL "
+            f"AND {column} NOT IN (SELECT {ref_column} FROM {ref_table})"
+        ))
+        for fk in existing:
+            conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{fk["name"]}"'))
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey "
+            f"FOREIGN KEY ({column}) REFERENCES {ref_table} ({ref_column}) ON DELETE CASCADE"
+        ))
+
+
+def _has_cascade_foreign_keys(conn: Connection) -> bool:
+    inspector = inspect(conn)
+    return all(
+        any(fk["constrained_columns"] == [column] for fk in inspector.get_foreign_keys(table))
+        for table, column, _, _ in CASCADE_FOREIGN_KEYS
+    )
+
+
+# 3: composite indexes matching the hot queries' filter + sort order
+COMPOSITE_INDEXES = [
+    # Recent messages, history pages and export: WHERE chat_session_id ORDER BY created_at, id
+    ("ix_messages_chat_session_created", "messages", "chat_session_id, created_at, id"),
+    # Usage per session over a time range
+    ("ix_token_usage_session_created", "token_usage", "session_id, created_at"),
+    # Document list pages: ORDER BY uploaded_at DESC, id DESC
+    ("ix_documents_uploaded_id", "documents", "uploaded_at, id"),
+    # Cleanup worker: WHERE status = 'pending' AND next_attempt_at <= now
+    ("ix_cleanup_tasks_status_due", "cleanup_tasks", "status, next_attempt_at"),
+]
+
+# Single-column indexes the composites replace (a leading column serves the same lookups)
+LEGACY_INDEXES = [
+    ("ix_messages_chat_session_id", "messages", "chat_session_id"),
+    ("ix_messages_created_at", "messages", "created_at"),
+    ("ix_token_usage_session_id", "token_usage", "session_id"),
+    ("ix_token_usage_created_at", "token_usage", "created_at"),
+    ("ix_cleanup_tasks_status", "cleanup_tasks", "status"),
+]
+
+
+def _create_composite_indexes(conn: Connection) -> None:
+    for name, table, columns in COMPOSITE_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    for name, _, _ in LEGACY_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _restore_legacy_indexes(conn: Connection) -> None:
+    for name, table, columns in LEGACY_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    for name, _, _ in COMPOSITE_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+# 4: real token accounting; token_usage_daily itself is created by create_all
+def _add_token_accounting(conn: Connection) -> None:
+    columns = {column["name"] for column in inspect(conn).get_columns("token_usage")}
+    if "embedding_tokens" not in columns:
+        conn.execute(text("ALTER TABLE token_usage ADD COLUMN embedding_tokens INTEGER DEFAULT 0"))
+    if "estimated" not in columns:
+        conn.execute(text("ALTER TABLE token_usage ADD COLUMN estimated BOOLEAN DEFAULT FALSE"))
+        # Rows written before this were word-count estimates
+        conn.execute(text("UPDATE token_usage SET estimated = TRUE, embedding_tokens = 0"))
+    
+    # Roll up existing rows once, unless the rollup is already being maintained
+    if conn.execute(text("SELECT 1 FROM token_usage_daily LIMIT 1")).first() is None:
+        conn.execute(text(
+            "INSERT INTO token_usage_daily (session_id, day, model, requests, input_tokens, output_tokens, "
+            "total_tokens, embedding_tokens, estimated_requests) "
+            "SELECT session_id, DATE(created_at), COALESCE(model, 'unknown'), COUNT(*), "
+            "COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0), COALESCE(SUM(total_tokens), 0), "
+            "COALESCE(SUM(embedding_tokens), 0), SUM(CASE WHEN estimated THEN 1 ELSE 0 END) "
+            "FROM token_usage WHERE created_at IS NOT NULL "
+            "GROUP BY session_id, DATE(created_at), COALESCE(model, 'unknown')"
+        ))
+
+
+# 5: document versions (page manifests for incremental re-indexing)
+def _add_document_versioning(conn: Connection) -> None:
+    columns = {column["name"] for column in inspect(conn).get_columns("indexed_contents")}
+    if "page_manifest" not in columns:
+        conn.execute(text("ALTER TABLE indexed_contents ADD COLUMN page_manifest JSON"))
+    columns = {column["name"] for column in inspect(conn).get_columns("ingestion_jobs")}
+    if "filename" not in columns:
+        conn.execute(text("ALTER TABLE ingestion_jobs ADD COLUMN filename VARCHAR(255)"))
+    if "pages_reused" not in columns:
+        conn.execute(text("ALTER TABLE ingestion_jobs ADD COLUMN pages_reused INTEGER DEFAULT 0"))
+    if "chunks_reused" not in columns:
+        conn.execute(text("ALTER TABLE ingestion_jobs ADD COLUMN chunks_reused INTEGER DEFAULT 0"))
+
+
+# 6: one chat session per document, so concurrent first messages share it
+def _unique_chat_session_per_document(conn: Connection) -> None:
+    # Sessions duplicated by earlier races: keep each document's oldest, move the messages to it
+    rows = conn.execute(text(
+        "SELECT document_id, id FROM chat_sessions WHERE document_id IN ("
+        " SELECT document_id FROM chat_sessions GROUP BY document_id HAVING COUNT(*) > 1)"
+        " ORDER BY document_id, created_at, id"
+    )).all()
+    keep = {}
+    for document_id, chat_session_id in rows:
+        if document_id not in keep:
+            keep[document_id] = chat_session_id
+            continue
+        conn.execute(text("UPDATE messages SET chat_session_id = :keep WHERE chat_session_id = :dup"),
+                     {"keep": keep[document_id], "dup": chat_session_id})
+        conn.execute(text("DELETE FROM chat_sessions WHERE id = :dup"), {"dup": chat_session_id})
+    
+    conn.execute(text("DROP INDEX IF EXISTS ix_chat_sessions_document_id"))
+    conn.execute(text("CREATE UNIQUE INDEX ix_chat_sessions_document_id ON chat_sessions (document_id)"))
+
+
+def _non_unique_chat_session_index(conn: Connection) -> None:
+    conn.execute(text("DROP INDEX IF EXISTS ix_chat_sessions_document_id"))
+    conn.execute(text("CREATE INDEX ix_chat_sessions_document_id ON chat_sessions (document_id)"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Content hash and vector namespace on documents", _add_document_content_columns),
+    Migration(2, "Cascading foreign keys for document deletes", _add_cascade_foreign_keys),
+    Migration(3, "Composite indexes for message, usage, document and cleanup queries",
+              _create_composite_indexes, _restore_legacy_indexes),
+    Migration(4, "Embedding tokens and estimated flag on token_usage, daily usage rollup", _add_token_accounting),
+    Migration(5, "Page manifests and reuse counters for document versions", _add_document_versioning),
+    Migration(6, "Unique chat session per document", _unique_chat_session_per_document,
+              _non_unique_chat_session_index),
+]
+
+
+def _lock(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def run_migrations(engine: Engine, target: Optional[int] = None) -> List[int]:
+    """
+    Apply pending migrations in order, each in its own transaction
+
+    Args:
+        engine: Sync engine to migrate
+        target: Stop after this version (default: latest)
+
+    Returns:
+        Versions applied by this call
+    """
+    schema_version.create(engine, checkfirst=True)
+    applied = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        with engine.begin() as conn:
+            _lock(conn)
+            # Re-checked under the lock: another process may have just applied it
+            done = conn.execute(
+                select(schema_version.c.version).where(schema_version.c.version == migration.version)
+            ).first()
+            if done:
+                continue
+            migration.upgrade(conn)
+            conn.execute(schema_version.insert().values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.utcnow()
+            ))
+        print(f"✅ Applied migration {migration.version}: {migration.description}")
+        applied.append(migration.version)
+    return applied
+
+
+def downgrade_to(engine: Engine, target: int) -> List[int]:
+    """
+    Revert applied migrations above target, newest first
+
+    Raises:
+        Exception: if a migration to revert has no downgrade
+    """
+    schema_version.create(engine, checkfirst=True)
+    reverted = []
+    for migration in reversed(MIGRATIONS):
+        if migration.version <= target:
+            break
+        with engine.begin() as conn:
+            _lock(conn)
+            done = conn.execute(
+                select(schema_version.c.version).where(schema_version.c.version == migration.version)
+            ).first()
+            if not done:
+                continue
+            if migration.downgrade is None:
+                raise Exception(f"Migration {migration.version} cannot be reverted")
+            migration.downgrade(conn)
+            conn.execute(delete(schema_version).where(schema_version.c.version == migration.version))
+        reverted.append(migration.version)
+    return reverted
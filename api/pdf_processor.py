@@ -3,8 +3,29 @@ PDF Processing Module
 Extracts text from PDFs and chunks it
 """
 
+import os
+import re
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pdfplumber
-from typing import List, Dict
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+
+# Progress callback: (stage, done, total)
+ProgressCallback = Callable[[str, int, int], None]
+
+# Parallel extraction: more than 1 worker shards page ranges across processes
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+PDF_EXTRACT_SHARD_SIZE = int(os.getenv("PDF_EXTRACT_SHARD_SIZE", "25"))
+
+# Page delimiter used in extract_text_from_pdf's combined text
+PAGE_MARKER = re.compile(r"--- Page (\d+) ---")
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_workers = 0
+_process_pool_lock = threading.Lock()
 
 
 class PDFChunk:
@@ -22,110 +43,357 @@ class PDFChunk:
         }
 
 
-def extract_text_from_pdf(file_path: str) -> Dict[str, any]:
+def _iter_page_range(pdf, start: int, end: int) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    Extract pages [start, end) (0-based indexes) from an open PDF
+
+    Yields (page_number, text, error) per page; a failing page gets text=None.
+    """
+    for index in range(start, end):
+        page = pdf.pages[index]
+        try:
+            yield page.page_number, page.extract_text() or "", None
+        except Exception as e:
+            yield page.page_number, None, str(e)
+        finally:
+            # Drop pdfplumber's per-page layout cache
+            page.close()
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    Extract pages [start, end) (0-based indexes) from a PDF
+
+    Runs inside worker processes, so it opens the file itself.
+    """
+    with pdfplumber.open(file_path) as pdf:
+        return list(_iter_page_range(pdf, start, end))
+
+
+def page_hash(text: str) -> str:
+    """SHA-256 of a page's extracted text; an unchanged page hashes the same in every upload"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(page: int, text_hash: str, chunk_index: int) -> str:
+    """Stable vector id of a chunk: the same page text at the same page number gives the same ids"""
+    return f"p{page}-{text_hash[:16]}-{chunk_index}"
+
+
+def _get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared extraction pool, rebuilt if the worker count changes"""
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            # spawn: forking a server process that already runs threads is unsafe
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _process_pool_workers = workers
+        return _process_pool
+
+
+def iter_pages(
+    file_path: str,
+    progress: Optional[ProgressCallback] = None,
+    workers: Optional[int] = None,
+    shard_size: Optional[int] = None
+) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    Yield (page_number, text, error) for every page, in page order
+
+    With more than one worker, page ranges of shard_size pages are extracted
+    in a process pool and merged back in order. At most 2 shards per worker
+    are in flight, so results never pile up beyond that window.
+    """
+    workers = workers or PDF_EXTRACT_WORKERS
+    shard_size = max(1, shard_size or PDF_EXTRACT_SHARD_SIZE)
+
+    with pdfplumber.open(file_path) as pdf:
+        total_pages = len(pdf.pages)
+        if workers <= 1 or total_pages <= shard_size:
+            # Serial: extract with the reader that counted the pages
+            for pages_done, result in enumerate(_iter_page_range(pdf, 0, total_pages), start=1):
+                if progress:
+                    progress("extracting", pages_done, total_pages)
+                yield result
+            return
+
+    shards = [(start, min(start + shard_size, total_pages)) for start in range(0, total_pages, shard_size)]
+    pool = _get_process_pool(workers)
+    pages_done = 0
+    window = workers * 2
+    pending = deque()
+    next_shard = 0
+    while next_shard < len(shards) or pending:
+        while next_shard < len(shards) and len(pending) < window:
+            start, end = shards[next_shard]
+            pending.append((start, end, pool.submit(_extract_page_range, file_path, start, end)))
+            next_shard += 1
+
+        start, end, future = pending.popleft()
+        try:
+            results = future.result()
+        except Exception as e:
+            # Whole shard lost (e.g. worker crashed): report each of its pages
+            results = [(index + 1, None, f"Shard failed: {e}") for index in range(start, end)]
+
+        for result in results:
+            pages_done += 1
+            if progress:
+                progress("extracting", pages_done, total_pages)
+            yield result
+
+
+def extract_text_from_pdf(
+    file_path: str,
+    progress: Optional[ProgressCallback] = None,
+    workers: Optional[int] = None,
+    shard_size: Optional[int] = None
+) -> Dict[str, any]:
     """
     Extract text from PDF file
     
+    Args:
+        file_path: Path to PDF file
+        progress: Called as progress("extracting", pages_done, pages_total) as pages finish
+        workers: Extraction processes (default PDF_EXTRACT_WORKERS, 1 = serial)
+        shard_size: Pages per worker task (default PDF_EXTRACT_SHARD_SIZE)
+    
     Returns:
-        dict with 'text' and 'pages' keys
+        dict with 'text', 'pages', 'page_hashes' and 'failed_pages' keys;
+        page_hashes maps each page with text to page_hash() of that text,
+        failed_pages lists {'page', 'error'} for pages that could not be extracted
     """
     try:
-        with pdfplumber.open(file_path) as pdf:
-            full_text = ""
-            page_count = 0
+        page_texts = []
+        page_hashes = {}
+        failed_pages = []
+
+        for page_number, text, error in iter_pages(file_path, progress, workers, shard_size):
+            if error is not None:
+                failed_pages.append({"page": page_number, "error": error})
+            elif text:
+                page_texts.append(f"\n\n--- Page {page_number} ---\n\n{text}")
+                page_hashes[page_number] = page_hash(text)
 
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += f"\n\n--- Page {page.page_number} ---\n\n{text}"
-                    page_count += 1
+        if failed_pages:
+            print(f"⚠️  {len(failed_pages)} page(s) could not be extracted from {file_path}")
 
-            return {"text": full_text, "pages": page_count}
+        return {
+            "text": "".join(page_texts),
+            "pages": len(page_hashes),
+            "page_hashes": page_hashes,
+            "failed_pages": failed_pages
+        }
     except Exception as e:
         raise Exception(f"Failed to extract text from PDF: {str(e)}")
 
 
-def chunk_text(
-    text: str,
+def iter_chunks(
+    pages: Iterable[Tuple[int, str]],
     chunk_size: int = 300,  # OPTIMIZATION: Reduced from 500 to 300 for token savings
     chunk_overlap: int = 30  # OPTIMIZATION: Reduced from 50 to 30 (10% overlap)
-) -> List[PDFChunk]:
+) -> Iterator[PDFChunk]:
     """
-    Split text into chunks with metadata
+    Split page texts into chunks as they arrive
     
     Args:
-        text: Full text to chunk
+        pages: (page_number, text) pairs in page order
         chunk_size: Maximum characters per chunk
         chunk_overlap: Overlap between chunks
     
-    Returns:
-        List of PDFChunk objects
+    Yields:
+        PDFChunk objects; page is the page the chunk's new text starts on
     """
-    chunks = []
-    lines = text.split('\n')
     current_chunk = ""
-    current_page = 1
+    chunk_page = None
     chunk_index = 0
 
-    for line in lines:
-        # Extract page number from line if present
-        if "--- Page" in line and "---" in line:
-            try:
-                page_num = int(line.split("Page")[1].split("---")[0].strip())
-                current_page = page_num
-                continue
-            except:
-                pass
-
-        # Add line to current chunk
-        if len(current_chunk) + len(line) < chunk_size:
-            current_chunk += (current_chunk and "\n" or "") + line
-        else:
-            # Save current chunk if it has content
-            if current_chunk.strip():
-                chunks.append(
-                    PDFChunk(
+    for page_number, text in pages:
+        for line in text.split('\n'):
+            if chunk_page is None:
+                chunk_page = page_number
+
+            # Add line to current chunk
+            if len(current_chunk) + len(line) < chunk_size:
+                current_chunk += (current_chunk and "\n" or "") + line
+            else:
+                # Emit current chunk if it has content
+                if current_chunk.strip():
+                    yield PDFChunk(
                         content=current_chunk.strip(),
-                        page=current_page,
+                        page=chunk_page,
                         chunk_index=chunk_index
                     )
-                )
-                chunk_index += 1
+                    chunk_index += 1
 
-            # Start new chunk with overlap
-            overlap = current_chunk[-chunk_overlap:] if len(current_chunk) > chunk_overlap else ""
-            current_chunk = overlap + "\n" + line if overlap else line
+                # Start new chunk with overlap
+                overlap = current_chunk[-chunk_overlap:] if len(current_chunk) > chunk_overlap else ""
+                current_chunk = overlap + "\n" + line if overlap else line
+                chunk_page = page_number
 
-    # Add final chunk
+    # Emit final chunk
     if current_chunk.strip():
-        chunks.append(
-            PDFChunk(
-                content=current_chunk.strip(),
-                page=current_page,
-                chunk_index=chunk_index
-            )
+        yield PDFChunk(
+            content=current_chunk.strip(),
+            page=chunk_page,
+            chunk_index=chunk_index
         )
 
-    return chunks
 
+def _split_page_markers(text: str) -> Iterator[Tuple[int, str]]:
+    """Turn '--- Page N ---' delimited text back into (page_number, text) pairs"""
+    current_page = 1
+    lines = []
+    for line in text.split('\n'):
+        match = PAGE_MARKER.fullmatch(line.strip())
+        if match:
+            if lines:
+                yield current_page, "\n".join(lines).strip("\n")
+            current_page, lines = int(match.group(1)), []
+        else:
+            lines.append(line)
+    if lines:
+        yield current_page, "\n".join(lines).strip("\n")
+
+
+def chunk_text(
+    text: str,
+    chunk_size: int = 300,  # OPTIMIZATION: Reduced from 500 to 300 for token savings
+    chunk_overlap: int = 30  # OPTIMIZATION: Reduced from 50 to 30 (10% overlap)
+) -> List[PDFChunk]:
+    """
+    Split text into chunks with metadata
+    
+    Args:
+        text: Full text to chunk ('--- Page N ---' markers set the page)
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Overlap between chunks
+    
+    Returns:
+        List of PDFChunk objects
+    """
+    return list(iter_chunks(_split_page_markers(text), chunk_size, chunk_overlap))
+
+
+def _iter_page_texts(
+    file_path: str,
+    progress: Optional[ProgressCallback],
+    failed_pages: Optional[List[Dict]]
+) -> Iterator[Tuple[int, str]]:
+    """(page_number, text) for every page with text; failed pages are logged and collected"""
+    # Imported here: spawned extraction workers import this module but never time anything
+    from metrics import timed_iter
 
-def process_pdf(file_path: str) -> List[Dict]:
+    for page_number, text, error in timed_iter("pdf.extract_pages", iter_pages(file_path, progress)):
+        if error is not None:
+            print(f"⚠️  Page {page_number} of {file_path} could not be extracted: {error}")
+            if failed_pages is not None:
+                failed_pages.append({"page": page_number, "error": error})
+        elif text:
+            yield page_number, text
+
+
+def iter_pdf_chunks(
+    file_path: str,
+    progress: Optional[ProgressCallback] = None,
+    failed_pages: Optional[List[Dict]] = None,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50
+) -> Iterator[PDFChunk]:
     """
-    Process PDF file and return chunks
+    Stream chunks from a PDF: pages are extracted and chunked as they are read,
+    so no stage holds the whole document
     
     Args:
         file_path: Path to PDF file
+        progress: Optional (stage, done, total) callback for extraction progress
+        failed_pages: If given, extended with {'page', 'error'} for pages that failed
+    """
+    try:
+        pages = _iter_page_texts(file_path, progress, failed_pages)
+        yield from iter_chunks(pages, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    except Exception as e:
+        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+
+
+def iter_versioned_chunks(
+    file_path: str,
+    previous_manifest: Optional[Dict] = None,
+    page_manifest: Optional[Dict] = None,
+    progress: Optional[ProgressCallback] = None,
+    failed_pages: Optional[List[Dict]] = None,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50
+) -> Iterator[Dict]:
+    """
+    Stream chunks like iter_pdf_chunks, chunked page by page with stable ids,
+    so a new version of a document can reuse the vectors of unchanged pages
+
+    Chunks never span pages, so a page's chunks (and their ids, see chunk_id)
+    depend only on that page's text. Pages whose page_hash() appears in
+    previous_manifest get a 'reuse_id' per chunk: the id of the same chunk in
+    the previous version's namespace, whose vector can be copied instead of
+    re-embedded. Matching is by text, so pages that only moved are reused too.
     
-    Returns:
-        List of chunk dictionaries
+    Args:
+        file_path: Path to PDF file
+        previous_manifest: page_manifest recorded for the previous version, if any
+        page_manifest: If given, filled in for this version: chunk_size, chunk_overlap
+            and 'pages' as [page, page_hash, chunk_count] lists
+        progress: Optional (stage, done, total) callback for extraction progress
+        failed_pages: If given, extended with {'page', 'error'} for pages that failed
+    
+    Yields:
+        Chunk dictionaries with content, page, chunk_index, id and (for
+        unchanged pages) reuse_id
     """
-    # Extract text
-    result = extract_text_from_pdf(file_path)
-    text = result["text"]
+    # Chunks cut with other settings would not line up with this version's
+    previous_pages = {}
+    settings = (chunk_size, chunk_overlap)
+    if previous_manifest and (previous_manifest.get("chunk_size"), previous_manifest.get("chunk_overlap")) == settings:
+        previous_pages = {text_hash: page for page, text_hash, _ in previous_manifest.get("pages", [])}
+
+    if page_manifest is not None:
+        page_manifest.update(chunk_size=chunk_size, chunk_overlap=chunk_overlap, pages=[])
+
+    try:
+        for page_number, text in _iter_page_texts(file_path, progress, failed_pages):
+            text_hash = page_hash(text)
+            previous_page = previous_pages.get(text_hash)
+            count = 0
+            for chunk in iter_chunks([(page_number, text)], chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+                record = chunk.to_dict()
+                record["id"] = chunk_id(page_number, text_hash, chunk.chunk_index)
+                if previous_page is not None:
+                    record["reuse_id"] = chunk_id(previous_page, text_hash, chunk.chunk_index)
+                count += 1
+                yield record
+            if page_manifest is not None:
+                page_manifest["pages"].append([page_number, text_hash, count])
+    except Exception as e:
+        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+
+
+def process_pdf(
+    file_path: str,
+    progress: Optional[ProgressCallback] = None,
+    failed_pages: Optional[List[Dict]] = None
+) -> List[Dict]:
+    """
+    Process PDF file and return chunks
     
-    # Chunk text
-    chunks = chunk_text(text, chunk_size=500, chunk_overlap=50)
+    Args:
+        file_path: Path to PDF file
+        progress: Optional (stage, done, total) callback for extraction progress
+        failed_pages: If given, extended with {'page', 'error'} for pages that failed
     
-    # Convert to dictionaries
-    return [chunk.to_dict() for chunk in chunks]
+    Returns:
+        List of chunk dictionaries (use iter_pdf_chunks to stream instead)
+    """
+    from metrics import span
+
+    with span("pdf.process"):
+        return [chunk.to_dict() for chunk in iter_pdf_chunks(file_path, progress, failed_pages)]
 
@@ -1,300 +1,719 @@
 """
 RAG Engine Module with Pinecone
 Production-ready version with persistent vector storage
+(vector backend is pluggable, see vector_store.py)
 """
 
 import os
-from typing import Dict, List, Optional
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_pinecone import PineconeVectorStore
-from langchain_classic.chains import ConversationalRetrievalChain
+import re
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
 from langchain_core.documents import Document
 
-from pinecone import Pinecone as PineconeClient, ServerlessSpec
+from vector_store import get_vector_backend
+from registry import registry, DEFAULT_LLM_MODEL, FALLBACK_LLM_MODEL
+from answer_cache import answer_cache
+from lexical_index import HYBRID_RETRIEVAL_ENABLED, RETRIEVAL_CANDIDATES, RRF_K, chunk_key, get_lexical_store
 
 # Database import
-from database import get_recent_messages, save_message, track_token_usage, get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import aget_recent_messages, asave_exchange
+from session_context import SessionContext, session_contexts
+from token_accounting import UsageRecorder, estimate_tokens
+from metrics import span, timed_iter, llm_callbacks, observe_llm_calls
 
-# Pinecone client (singleton)
-pinecone_client = None
-pinecone_index = None
+# Chunks embedded and stored per backend call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
 
+# Cross-document chat: documents per question, per-document search timeout, chunks in the prompt
+MULTI_DOC_MAX_DOCUMENTS = int(os.getenv("MULTI_DOC_MAX_DOCUMENTS", "20"))
+MULTI_DOC_SHARD_TIMEOUT_SECONDS = float(os.getenv("MULTI_DOC_SHARD_TIMEOUT_SECONDS", "2.0"))
+# Multi-document requests served at once without their shards queueing for a thread,
+# and how long a shard may wait for one before it counts as timed out
+MULTI_DOC_MAX_CONCURRENT_REQUESTS = int(os.getenv("MULTI_DOC_MAX_CONCURRENT_REQUESTS", "4"))
+MULTI_DOC_QUEUE_TIMEOUT_SECONDS = float(os.getenv("MULTI_DOC_QUEUE_TIMEOUT_SECONDS", "10.0"))
+MULTI_DOC_TOP_K = int(os.getenv("MULTI_DOC_TOP_K", "4"))
 
-def initialize_pinecone():
-    """Initialize Pinecone connection"""
-    global pinecone_client, pinecone_index
+MULTI_DOC_PROMPT = """Answer the question using only the excerpts below, taken from several documents.
+Cite the excerpts you use by their number in square brackets, e.g. [2]. If the excerpts
+do not contain the answer, say so.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+# Serve repeated questions from the per-document answer cache
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Follow-up questions: rewrite into a standalone question only when needs_rewrite()
+# says so (otherwise the history goes into the answer prompt and one LLM call answers);
+# false rewrites every question that has history, as ConversationalRetrievalChain did
+SINGLE_CALL_CHAT_ENABLED = os.getenv("SINGLE_CALL_CHAT_ENABLED", "true").lower() not in ("0", "false", "no")
+# Questions shorter than this (in words) are rewritten when there is history
+REWRITE_MIN_WORDS = int(os.getenv("REWRITE_MIN_WORDS", "4"))
+
+ANSWER_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+{history}
+Question: {question}
+Helpful Answer:"""
+
+REWRITE_PROMPT = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
+
+Chat History:
+{history}
+Follow Up Input: {question}
+Standalone question:"""
+
+# Words that point back into the conversation ("there" is left out: "is there ...")
+_REFERRING_WORDS = frozenset((
+    "it", "its", "it's", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "former", "latter", "above", "previous", "same",
+))
+_CONTINUATIONS = ("and", "also", "but", "so", "then", "what about", "how about", "what else")
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _chunk_to_document(chunk, namespace: str) -> Document:
+    """Convert a chunk (dict or PDFChunk) to a LangChain document"""
+    if not isinstance(chunk, dict):
+        chunk = chunk.to_dict()
+    return Document(
+        page_content=chunk["content"],
+        metadata={
+            "page": chunk["page"],
+            "chunk_index": chunk["chunk_index"],
+            "source": f"Page {chunk['page']}, Chunk {chunk['chunk_index']}",
+            "namespace": namespace,
+        }
+    )
+
+
+def initialize_rag(
+    namespace: str,
+    chunks: Iterable,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+    reuse_namespace: Optional[str] = None,
+    reuse_stats: Optional[Dict[str, int]] = None
+) -> int:
+    """
+    Initialize RAG engine with PDF chunks in the configured vector backend
     
-    if pinecone_client and pinecone_index:
-        return  # Already initialized
+    Chunks are consumed lazily and embedded/stored in rolling batches of
+    EMBED_BATCH_SIZE, so a generator (e.g. pdf_processor.iter_pdf_chunks)
+    is indexed with memory bounded by the batch size, and the first batches
+    are searchable while later pages are still being parsed.
     
-    api_key = os.getenv("PINECONE_API_KEY")
-    index_name = os.getenv("PINECONE_INDEX_NAME", "pdf-rag-demo")
-    environment = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")  # Default for serverless
+    Chunks with an 'id' are stored under it. Chunks with a 'reuse_id' (see
+    pdf_processor.iter_versioned_chunks) take their vector from that id in
+    reuse_namespace, fetched once per batch; any not found there are embedded.
     
-    if not api_key:
-        raise Exception("PINECONE_API_KEY not found in environment variables")
+    Args:
+        namespace: Vector namespace (content hash, or session_id for older documents)
+        chunks: Iterable of chunk dictionaries (or PDFChunk) with content, page, chunk_index
+        progress: Called as progress("embedding", chunks_done, 0) after each batch
+        reuse_namespace: Namespace of the previous version of the document
+        reuse_stats: If given, its 'reused' and 'embedded' chunk counts are incremented
     
+    Returns:
+        Number of chunks stored
+    """
     try:
-        # Initialize Pinecone client (v5+)
-        pinecone_client = PineconeClient(api_key=api_key)
+        # Shared Gemini embedding client
+        embeddings = registry.get_embeddings()
+        backend = get_vector_backend()
+        lexical = get_lexical_store() if HYBRID_RETRIEVAL_ENABLED else None
         
-        # Check if index exists
-        existing_indexes = [idx.name for idx in pinecone_client.list_indexes()]
+        def store(batch):
+            docs = [doc for doc, _, _ in batch]
+            texts = [doc.page_content for doc in docs]
+            ids = [chunk_id for _, chunk_id, _ in batch]
+            
+            # Vectors of unchanged chunks come from the previous version
+            vectors = [None] * len(batch)
+            reuse_ids = [reuse_id for _, _, reuse_id in batch if reuse_id]
+            if reuse_namespace and reuse_ids:
+                with span("index.fetch_reused"):
+                    fetched = backend.fetch(reuse_namespace, reuse_ids)
+                for i, (_, _, reuse_id) in enumerate(batch):
+                    if reuse_id in fetched:
+                        vectors[i] = fetched[reuse_id][0]
+            
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if missing:
+                with span("index.embed"):
+                    embedded = embeddings.embed_documents([texts[i] for i in missing])
+                for i, vector in zip(missing, embedded):
+                    vectors[i] = vector
+            if reuse_stats is not None:
+                reuse_stats["reused"] = reuse_stats.get("reused", 0) + len(batch) - len(missing)
+                reuse_stats["embedded"] = reuse_stats.get("embedded", 0) + len(missing)
+            
+            with span("index.store_vectors"):
+                stored = backend.add_embeddings(
+                    namespace, texts, vectors, [doc.metadata for doc in docs], ids if all(ids) else None
+                )
+            # BM25 index over the same chunks, for hybrid retrieval
+            if lexical:
+                with span("index.lexical"):
+                    lexical.add_documents(namespace, docs)
+            return stored
         
-        if index_name in existing_indexes:
-            # Check if index has wrong dimension (1536 from OpenAI)
-            # Delete and recreate with correct dimension (768 for Gemini)
-            try:
-                index_info = pinecone_client.describe_index(index_name)
-                if index_info.dimension != 768:
-                    print(f"⚠️  Index {index_name} has dimension {index_info.dimension}, but we need 768 (Gemini)")
-                    print(f"🗑️  Deleting old index to create new one with correct dimension...")
-                    pinecone_client.delete_index(index_name)
-                    # Wait for deletion
-                    import time
-                    time.sleep(3)
-                    print(f"✅ Old index deleted")
-            except Exception as e:
-                print(f"⚠️  Could not check index dimension: {e}")
+        # Embed and store vectors in batches (one namespace per document content for isolation)
+        stored = 0
+        batch = []
+        for chunk in timed_iter("index.read_chunks", chunks):
+            ids = (chunk.get("id"), chunk.get("reuse_id")) if isinstance(chunk, dict) else (None, None)
+            batch.append((_chunk_to_document(chunk, namespace), *ids))
+            if len(batch) >= EMBED_BATCH_SIZE:
+                stored += store(batch)
+                batch = []
+                if progress:
+                    progress("embedding", stored, 0)
+        if batch:
+            stored += store(batch)
+            if progress:
+                progress("embedding", stored, 0)
         
-        if index_name not in [idx.name for idx in pinecone_client.list_indexes()]:
-            # Create index if it doesn't exist (v6+)
-            print(f"📦 Creating new Pinecone index: {index_name} with dimension 768 (Gemini)")
-            pinecone_client.create_index(
-                name=index_name,
-                dimension=768,  # Gemini text-embedding-004 dimension
-                metric="cosine",
-                spec=ServerlessSpec(
-                    cloud="aws",
-                    region=environment
-                )
-            )
-            print(f"✅ Created Pinecone index: {index_name}")
-            # Wait for index to be ready
-            import time
-            time.sleep(5)
+        # Re-indexed namespaces must not keep serving stale retriever handles or answers
+        registry.evict_namespace(namespace)
+        answer_cache.invalidate(namespace)
         
-        # Get index
-        pinecone_index = pinecone_client.Index(index_name)
-        print(f"Pinecone initialized with index: {index_name}")
+        # No longer using ConversationBufferMemory
+        # Messages will be stored in database and retrieved as needed
+        print(f"RAG engine initialized for namespace {namespace} with {stored} chunks ({backend.name} backend)")
+        return stored
         
     except Exception as e:
-        raise Exception(f"Failed to initialize Pinecone: {str(e)}")
+        raise Exception(f"Failed to initialize RAG engine: {str(e)}")
+
+
+def _get_llm():
+    """Shared Gemini chat model, falling back to the pro model"""
+    try:
+        return registry.get_llm(DEFAULT_LLM_MODEL)
+    except Exception as e:
+        # Fallback to gemini-pro-latest if flash doesn't work
+        print(f"⚠️  gemini-flash-latest failed, trying gemini-pro-latest: {e}")
+        return registry.get_llm(FALLBACK_LLM_MODEL)
+
+
+def _build_chat_history(recent_messages: list) -> List[Tuple[str, str]]:
+    """Build chat_history from the last message (if exists), as (human, ai) tuples"""
+    # OPTIMIZATION: Truncate to max 100 chars to save tokens
+    MAX_HISTORY_LENGTH = 100
+    chat_history = []
+    if recent_messages:
+        last_msg = recent_messages[0]
+        # Truncate message content to save tokens
+        truncated_content = last_msg.content[:MAX_HISTORY_LENGTH]
+        if len(last_msg.content) > MAX_HISTORY_LENGTH:
+            truncated_content += "..."
+        
+        if last_msg.role == "user":
+            # Last was user, so no AI response yet - just user message
+            chat_history = [(truncated_content, "")]
+        elif last_msg.role == "assistant":
+            # Last was assistant - we need to get previous user message
+            # For POC with only 1 message, we'll use empty user message
+            chat_history = [("", truncated_content)]
+    return chat_history
+
+
+def _extract_sources(source_documents: List[Document]) -> List[str]:
+    """Source labels (limit to prevent token bloat)"""
+    return [
+        doc.metadata.get("source", "")[:50]  # Truncate source strings
+        for doc in source_documents[:2]  # Only first 2 sources
+        if doc.metadata.get("source")
+    ]
 
 
-def initialize_rag(session_id: str, chunks: List[Dict]) -> None:
+def _format_history(chat_history: List[Tuple[str, str]]) -> str:
+    """Render (human, ai) tuples as "Human: ..." / "Assistant: ..." lines, skipping empty turns"""
+    lines = []
+    for human, ai in chat_history:
+        if human:
+            lines.append(f"Human: {human}")
+        if ai:
+            lines.append(f"Assistant: {ai}")
+    return "\n".join(lines)
+
+
+def needs_rewrite(question: str, history: str) -> bool:
+    """
+    Whether a follow-up question must be rewritten before retrieval
+    
+    Cheap heuristic, erring towards rewriting: with history, questions that are
+    very short, open with a continuation ("and", "what about") or contain a
+    referring word ("it", "those", ...) are rewritten; anything else is
+    searched as asked and the history only goes into the answer prompt.
+    """
+    if not history:
+        return False
+    words = _WORD.findall(question.lower())
+    if len(words) < REWRITE_MIN_WORDS:
+        return True
+    opening = " ".join(words[:2])
+    if any(opening == c or opening.startswith(c + " ") for c in _CONTINUATIONS):
+        return True
+    return any(word in _REFERRING_WORDS for word in words)
+
+
+async def _prepare_answer(namespace: str, question: str, chat_history: List[Tuple[str, str]],
+                          llm, config: Dict) -> Tuple[str, List[Document]]:
+    """
+    Retrieve for a question and build its answer prompt
+    
+    The question is first rewritten into a standalone one (an extra LLM call)
+    only if needs_rewrite() says so, or always with history when
+    SINGLE_CALL_CHAT_ENABLED is off. Retrieval uses the rewritten question; the
+    prompt keeps the original one next to the truncated history.
+    
+    Returns:
+        (answer prompt, source documents)
     """
-    Initialize RAG engine with PDF chunks using Pinecone
+    history = _format_history(chat_history)
+    search_query = question
+    if history and (needs_rewrite(question, history) or not SINGLE_CALL_CHAT_ENABLED):
+        with span("chat.rewrite"):
+            response = await llm.ainvoke(REWRITE_PROMPT.format(history=history, question=question), config=config)
+        search_query = (response.content if isinstance(response.content, str) else str(response.content)).strip() or question
+    
+    # OPTIMIZATION: Use k=2 instead of k=3 to reduce tokens (POC requirement)
+    source_documents = await registry.get_retriever(namespace, k=2).ainvoke(search_query)
+    prompt = ANSWER_PROMPT.format(
+        context="\n\n".join(doc.page_content for doc in source_documents),
+        history=f"\nConversation so far:\n{history}\n" if history else "",
+        question=question
+    )
+    return prompt, source_documents
+
+
+async def _save_exchange(
+    db: AsyncSession,
+    context: SessionContext,
+    question: str,
+    answer: str,
+    sources: List[str],
+    recorder: UsageRecorder
+) -> Dict[str, int]:
+    """Persist the question, answer and token usage in one commit, returns the usage"""
+    usage = recorder.usage()
+    # Message token counts: the answer's as reported by the model when available
+    answer_tokens = usage["output_tokens"] if recorder.llm_calls == 1 else estimate_tokens(answer)
+    
+    context.chat_session_id = await asave_exchange(
+        db, context.session_id, context.document_id, context.chat_session_id, context.filename,
+        question, estimate_tokens(question), answer, answer_tokens, sources=sources, usage=usage
+    )
+    return {
+        "input_tokens": usage["input_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "total_tokens": usage["input_tokens"] + usage["output_tokens"],
+        "embedding_tokens": usage["embedding_tokens"],
+        "model": usage["model"],
+        "estimated": usage["estimated"],
+    }
+
+
+async def _save_cached_exchange(db: AsyncSession, context: SessionContext, question: str, cached: Dict,
+                                recorder: UsageRecorder) -> None:
+    """Persist a question answered from the answer cache (no LLM tokens; maybe a query embedding)"""
+    context.chat_session_id = await asave_exchange(
+        db, context.session_id, context.document_id, context.chat_session_id, context.filename,
+        question, estimate_tokens(question), cached["answer"], estimate_tokens(cached["answer"]),
+        sources=cached["sources"], usage=recorder.usage() if recorder.has_usage else None
+    )
+
+
+async def _resolve_ready(db: AsyncSession, session_id: str) -> SessionContext:
+    context = await session_contexts.resolve(db, session_id)
+    if context is None:
+        raise Exception("RAG engine not initialized. Please upload a PDF first.")
+    return context
+
+
+async def _lookup_cached_answer(namespace: str, question: str):
+    """Answer cache lookup, returns (cached answer or None, embed_query for a later aput)"""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    
+    # Near-duplicate matching embeds the question only after an exact miss, and
+    # at most once per request (embedding cache makes the retriever's own query
+    # embedding a hit afterwards)
+    embed_query = None
+    if answer_cache.similarity_enabled:
+        vectors = {}
+        
+        async def embed_query(text: str) -> List[float]:
+            if text not in vectors:
+                vectors[text] = await registry.get_embeddings().aembed_query(text)
+            return vectors[text]
+    
+    return await answer_cache.aget(namespace, question, embed_query), embed_query
+
+
+async def query_rag(session_id: str, question: str, db: AsyncSession) -> Dict[str, any]:
+    """
+    Query RAG system with a question using the configured vector backend
+    Uses sliding window: only last 1 message for context (POC), folded into
+    the answer prompt (see _prepare_answer)
+    
+    Non-blocking: database access, embedding and LLM calls are awaited, and
+    synchronous vector backend searches run in a worker thread.
     
     Args:
-        session_id: Unique session identifier
-        chunks: List of chunk dictionaries with content, page, chunk_index
+        session_id: Session identifier
+        question: User question
+        db: Async database session
+    
+    Returns:
+        Dictionary with 'answer', 'sources' and 'cached' keys
     """
     try:
-        # Initialize Pinecone
-        initialize_pinecone()
+        # Check if session is initialized (document exists); cached per session
+        with span("chat.resolve_session"):
+            context = await _resolve_ready(db, session_id)
+        namespace = context.namespace
         
-        # Convert chunks to LangChain documents
-        documents = [
-            Document(
-                page_content=chunk["content"],
-                metadata={
-                    "page": chunk["page"],
-                    "chunk_index": chunk["chunk_index"],
-                    "source": f"Page {chunk['page']}, Chunk {chunk['chunk_index']}",
-                    "session_id": session_id,  # Important: filter by session
-                }
-            )
-            for chunk in chunks
-        ]
+        llm = _get_llm()
+        recorder = UsageRecorder(default_model=getattr(llm, "model", None))
+        activation = recorder.activate()
+        try:
+            # Get last 1 message for context (sliding window - POC)
+            with span("chat.recent_messages"):
+                recent_messages = await aget_recent_messages(db, context.chat_session_id, limit=1)
+            chat_history = _build_chat_history(recent_messages)
+            
+            # Repeated question against the same document: skip retrieval and generation.
+            # Cached answers are context-free, so a follow-up never takes one
+            cached, embed_query = None, None
+            if not chat_history:
+                with span("chat.answer_cache"):
+                    cached, embed_query = await _lookup_cached_answer(namespace, question)
+            if cached:
+                with span("chat.save"):
+                    await _save_cached_exchange(db, context, question, cached, recorder)
+                observe_llm_calls("chat", 0)
+                return {**cached, "cached": True}
+            
+            # (retrieval.* and llm.generate spans break this stage down)
+            config = {"callbacks": [recorder] + llm_callbacks()}
+            with span("chat.answer"):
+                prompt, source_documents = await _prepare_answer(namespace, question, chat_history, llm, config)
+                response = await llm.ainvoke(prompt, config=config)
+        finally:
+            recorder.deactivate(activation)
         
-        # Create embeddings using Gemini
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise Exception("GEMINI_API_KEY not found in environment variables")
+        sources = _extract_sources(source_documents)
+        answer = response.content if isinstance(response.content, str) else str(response.content)
         
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/text-embedding-004",
-            google_api_key=api_key
-        )
+        with span("chat.save"):
+            await _save_exchange(db, context, question, answer, sources, recorder)
+        observe_llm_calls("chat", recorder.llm_calls)
         
-        # Create Pinecone vector store
-        vector_store = PineconeVectorStore.from_documents(
-            documents,
-            embeddings,
-            index_name=os.getenv("PINECONE_INDEX_NAME", "pdf-rag-demo"),
-            namespace=session_id  # Use sessionId as namespace for isolation
-        )
+        sources = list(set(sources))  # Remove duplicates
         
-        # No longer using ConversationBufferMemory
-        # Messages will be stored in database and retrieved as needed
-        print(f"RAG engine initialized for session {session_id} with {len(chunks)} chunks in Pinecone")
+        # Only context-free answers over a fully indexed document are reusable later
+        if ANSWER_CACHE_ENABLED and not chat_history and context.status in (None, "active"):
+            await answer_cache.aput(namespace, question, answer, sources, embed_query)
+        
+        return {
+            "answer": answer,
+            "sources": sources,
+            "cached": False
+        }
         
     except Exception as e:
-        raise Exception(f"Failed to initialize RAG engine: {str(e)}")
+        raise Exception(f"Failed to generate answer: {str(e)}")
 
 
-def query_rag(session_id: str, question: str, db = None) -> Dict[str, any]:
+async def stream_rag(session_id: str, question: str, db: AsyncSession) -> AsyncIterator[Tuple[str, Dict]]:
     """
-    Query RAG system with a question using Pinecone
-    Uses sliding window: only last 1 message for context (POC)
+    Streaming variant of query_rag
+    
+    Runs the same steps (rewrite the question if needed, retrieve, build the
+    answer prompt) but streams the answer. The exchange is saved only
+    once the answer is complete, so a cancelled stream (client disconnect)
+    leaves nothing behind.
     
     Args:
         session_id: Session identifier
         question: User question
-        db: Database session
+        db: Async database session
     
-    Returns:
-        Dictionary with 'answer' and 'sources' keys
+    Yields:
+        (event, data) pairs: ("sources", {"sources"}), then ("token", {"text"})
+        for each generated piece, then ("usage", token counts, 'llm_calls' and 'cached')
     """
-    if not db:
-        from database import SessionLocal
-        db = next(SessionLocal())
+    with span("chat.resolve_session"):
+        context = await _resolve_ready(db, session_id)
+    namespace = context.namespace
+    llm = _get_llm()
+    recorder = UsageRecorder(default_model=getattr(llm, "model", None))
+    config = {"callbacks": [recorder] + llm_callbacks()}
     
-    try:
-        # Check if session is initialized (document exists)
-        from database import Document
-        document = db.query(Document).filter(Document.session_id == session_id).first()
-        if not document:
-            raise Exception("RAG engine not initialized. Please upload a PDF first.")
-        
-        # Initialize Pinecone if not already done
-        initialize_pinecone()
-        
-        # Get last 1 message for context (sliding window - POC)
-        recent_messages = get_recent_messages(db, session_id, limit=1)
-        
-        # Create embeddings using Gemini
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise Exception("GEMINI_API_KEY not found in environment variables")
-        
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/text-embedding-004",
-            google_api_key=api_key
-        )
-        
-        # Create Pinecone vector store (for querying)
-        vector_store = PineconeVectorStore.from_existing_index(
-            index_name=os.getenv("PINECONE_INDEX_NAME", "pdf-rag-demo"),
-            embedding=embeddings,
-            namespace=session_id
-        )
-        
-        # Create LLM using Gemini
+    with span("chat.recent_messages"):
+        recent_messages = await aget_recent_messages(db, context.chat_session_id, limit=1)
+    chat_history = _build_chat_history(recent_messages)
+    
+    # Only the steps that may embed the question run with the recorder active.
+    # Cached answers are context-free, so a follow-up never takes one
+    cached, embed_query = None, None
+    if not chat_history:
+        activation = recorder.activate()
         try:
-            llm = ChatGoogleGenerativeAI(
-                model="models/gemini-flash-latest",
-                google_api_key=api_key,
-                temperature=0.1,
-                convert_system_message_to_human=True
-            )
-        except Exception as e:
-            # Fallback to gemini-pro-latest if flash doesn't work
-            print(f"⚠️  gemini-flash-latest failed, trying gemini-pro-latest: {e}")
-            llm = ChatGoogleGenerativeAI(
-                model="models/gemini-pro-latest",
-                google_api_key=api_key,
-                temperature=0.1,
-                convert_system_message_to_human=True
+            with span("chat.answer_cache"):
+                cached, embed_query = await _lookup_cached_answer(namespace, question)
+        finally:
+            recorder.deactivate(activation)
+    if cached:
+        yield "sources", {"sources": cached["sources"]}
+        yield "token", {"text": cached["answer"]}
+        with span("chat.save"):
+            await _save_cached_exchange(db, context, question, cached, recorder)
+        observe_llm_calls("chat_stream", 0)
+        yield "usage", {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0,
+                        "embedding_tokens": recorder.embedding_tokens, "llm_calls": 0, "cached": True}
+        return
+    
+    activation = recorder.activate()
+    try:
+        prompt, source_documents = await _prepare_answer(namespace, question, chat_history, llm, config)
+    finally:
+        recorder.deactivate(activation)
+    sources = _extract_sources(source_documents)
+    yield "sources", {"sources": list(dict.fromkeys(sources))}
+    
+    parts = []
+    async for chunk in llm.astream(prompt, config=config):
+        if chunk.text:
+            parts.append(chunk.text)
+            yield "token", {"text": chunk.text}
+    answer = "".join(parts)
+    
+    with span("chat.save"):
+        usage = await _save_exchange(db, context, question, answer, sources, recorder)
+    observe_llm_calls("chat_stream", recorder.llm_calls)
+    
+    if ANSWER_CACHE_ENABLED and not chat_history and context.status in (None, "active"):
+        await answer_cache.aput(namespace, question, answer, list(set(sources)), embed_query)
+    
+    yield "usage", {**usage, "llm_calls": recorder.llm_calls, "cached": False}
+
+
+# Shard searches get their own threads, so one fan-out never queues behind the default pool.
+# Sized for MULTI_DOC_MAX_CONCURRENT_REQUESTS full fan-outs (threads start on demand)
+_shard_executor: Optional[ThreadPoolExecutor] = None
+_shard_executor_lock = threading.Lock()
+
+
+def _get_shard_executor() -> ThreadPoolExecutor:
+    global _shard_executor
+    with _shard_executor_lock:
+        if _shard_executor is None:
+            _shard_executor = ThreadPoolExecutor(
+                max_workers=MULTI_DOC_MAX_CONCURRENT_REQUESTS * MULTI_DOC_MAX_DOCUMENTS,
+                thread_name_prefix="shard"
             )
+        return _shard_executor
+
+
+def _search_shard(namespace: str, question: str, vector: List[float],
+                  abandoned: Optional[threading.Event] = None) -> Tuple[list, list]:
+    """Dense (and BM25, if enabled) candidates from one namespace, stopping early once abandoned is set"""
+    dense = get_vector_backend().search_by_vector(namespace, vector, k=RETRIEVAL_CANDIDATES)
+    lexical = []
+    if HYBRID_RETRIEVAL_ENABLED and not (abandoned and abandoned.is_set()):
+        lexical, _ = get_lexical_store().search(namespace, question, RETRIEVAL_CANDIDATES)
+    return dense, lexical
+
+
+async def _run_shard(executor: ThreadPoolExecutor, namespace: str, question: str,
+                     vector: List[float]) -> Tuple[list, list]:
+    """
+    One shard search on the shard pool
+    
+    MULTI_DOC_SHARD_TIMEOUT_SECONDS runs from when a worker picks the search up,
+    so time queued behind other requests is not billed to the shard (that wait
+    is bounded by MULTI_DOC_QUEUE_TIMEOUT_SECONDS). A shard still queued at a
+    timeout is dropped from the queue; one already running skips its remaining
+    steps, so timed-out searches hold their thread as briefly as possible.
+    
+    Raises:
+        asyncio.TimeoutError: if the search did not start or finish in time
+    """
+    loop = asyncio.get_running_loop()
+    started = asyncio.Event()
+    abandoned = threading.Event()
+    
+    def search() -> Tuple[list, list]:
+        loop.call_soon_threadsafe(started.set)
+        if abandoned.is_set():
+            return [], []
+        return _search_shard(namespace, question, vector, abandoned)
+    
+    future = loop.run_in_executor(executor, search)
+    try:
+        await asyncio.wait_for(started.wait(), timeout=MULTI_DOC_QUEUE_TIMEOUT_SECONDS)
+        return await asyncio.wait_for(future, timeout=MULTI_DOC_SHARD_TIMEOUT_SECONDS)
+    except BaseException:
+        abandoned.set()
+        future.cancel()
+        raise
+
+
+def _merge_shards(results: Dict[str, Tuple[list, list]], k: int) -> List[Tuple[str, Document, float]]:
+    """
+    Global top-k across namespaces as (namespace, chunk, score). Dense hits are ranked by
+    cosine score, which is comparable across shards (same embedding model); with hybrid
+    retrieval on, that ranking is fused with the BM25 hits by reciprocal rank.
+    """
+    def ranked(position: int) -> List[Tuple[str, Document, float]]:
+        hits = [(namespace, doc, float(score)) for namespace, pair in results.items() for doc, score in pair[position]]
+        return sorted(hits, key=lambda hit: -hit[2])
+
+    dense, lexical = ranked(0), ranked(1)
+    if not lexical:
+        return dense[:k]
+
+    # Same fusion as reciprocal_rank_fusion, keyed by namespace too: chunk keys repeat across documents
+    scores: Dict[Tuple, float] = {}
+    hits: Dict[Tuple, Tuple[str, Document, float]] = {}
+    for ranking in (dense, lexical):
+        for rank, (namespace, doc, _) in enumerate(ranking, start=1):
+            key = (namespace,) + chunk_key(doc.metadata)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            hits.setdefault(key, (namespace, doc, 0.0))
+    ordered = sorted(scores, key=lambda key: -scores[key])[:k]
+    return [(hits[key][0], hits[key][1], scores[key]) for key in ordered]
+
+
+async def query_multi_rag(session_ids: List[str], question: str, db: AsyncSession, k: Optional[int] = None) -> Dict[str, any]:
+    """
+    Answer a question across several documents
+    
+    The question is embedded once, then every document's namespace is searched
+    concurrently, each with its own timeout, so latency follows the slowest
+    shard rather than the sum. Hits are merged into one global top-k and
+    answered with a single LLM call; each source names its document.
+    
+    Args:
+        session_ids: Documents to search (at most MULTI_DOC_MAX_DOCUMENTS)
+        question: User question
+        db: Async database session
+        k: Chunks passed to the LLM (default MULTI_DOC_TOP_K)
+    
+    Returns:
+        Dictionary with 'answer', 'sources' (document, page, chunk, score) and
+        'documents' (which sessions were searched, skipped, timed out or failed)
+    
+    Raises:
+        ValueError: if none of the documents can be queried yet
+    """
+    with span("chat.resolve_session"):
+        contexts = await session_contexts.resolve_many(db, session_ids)
+    skipped = [sid for sid in dict.fromkeys(session_ids) if sid not in contexts or not contexts[sid].is_ready]
+    
+    # Documents with identical content share a namespace; search it once
+    by_namespace: Dict[str, List[SessionContext]] = {}
+    for session_id, context in contexts.items():
+        if context.is_ready:
+            by_namespace.setdefault(context.namespace, []).append(context)
+    if not by_namespace:
+        raise ValueError("None of the requested documents are ready. Please upload a PDF first.")
+    
+    try:
+        k = k or MULTI_DOC_TOP_K
+        with span("retrieval.embed"):
+            vector = await registry.get_embeddings().aembed_query(question)
         
-        # Build chat_history from last message (if exists)
-        # OPTIMIZATION: Truncate to max 100 chars to save tokens
-        MAX_HISTORY_LENGTH = 100
-        chat_history = []
-        if recent_messages:
-            last_msg = recent_messages[0]
-            # Truncate message content to save tokens
-            truncated_content = last_msg.content[:MAX_HISTORY_LENGTH]
-            if len(last_msg.content) > MAX_HISTORY_LENGTH:
-                truncated_content += "..."
-            
-            # Format: (human_message, ai_message) tuples
-            if last_msg.role == "user":
-                # Last was user, so no AI response yet - just user message
-                chat_history = [(truncated_content, "")]
-            elif last_msg.role == "assistant":
-                # Last was assistant - we need to get previous user message
-                # For POC with only 1 message, we'll use empty user message
-                chat_history = [("", truncated_content)]
-        
-        # OPTIMIZATION: Use k=2 instead of k=3 to reduce tokens (POC requirement)
-        # Create retrieval chain (without memory - we handle context manually)
-        chain = ConversationalRetrievalChain.from_llm(
-            llm,
-            vector_store.as_retriever(k=2),  # Reduced from 3 to 2 for token optimization
-            return_source_documents=True,
-            verbose=False
-        )
-        
-        # Query with chat_history - ConversationalRetrievalChain requires this
-        response = chain({
-            "question": question,
-            "chat_history": chat_history  # List of (human, ai) tuples
-        })
-        
-        # Extract sources (limit to prevent token bloat)
-        sources = []
-        if "source_documents" in response:
-            sources = [
-                doc.metadata.get("source", "")[:50]  # Truncate source strings
-                for doc in response["source_documents"][:2]  # Only first 2 sources
-                if doc.metadata.get("source")
-            ]
-        
-        answer = response.get("answer", "")
+        executor = _get_shard_executor()
+        namespaces = list(by_namespace)
+        with span("retrieval.shard_fanout"):
+            outcomes = await asyncio.gather(*(
+                _run_shard(executor, namespace, question, vector) for namespace in namespaces
+            ), return_exceptions=True)
         
-        # Calculate token usage (better estimation for optimization tracking)
-        # Gemini: ~1.3 tokens per word for English
-        question_tokens = len(question.split()) * 1.3
-        history_tokens = sum(len(msg.content.split()) * 1.3 for msg in recent_messages) if recent_messages else 0
-        # Estimate chunks: 2 chunks × ~300 chars = ~150 words = ~200 tokens
-        chunk_tokens = 200
-        input_tokens = int(question_tokens + history_tokens + chunk_tokens)
-        output_tokens = int(len(answer.split()) * 1.3)
+        results, timed_out, failed = {}, [], []
+        for namespace, outcome in zip(namespaces, outcomes):
+            session_ids_in_ns = [context.session_id for context in by_namespace[namespace]]
+            if isinstance(outcome, asyncio.TimeoutError):
+                timed_out.extend(session_ids_in_ns)
+            elif isinstance(outcome, BaseException):
+                print(f"⚠️  Search of {namespace} failed: {outcome}")
+                failed.extend(session_ids_in_ns)
+            else:
+                results[namespace] = outcome
         
-        # Save messages to database with token counts
-        save_message(db, session_id, "user", question, token_count=int(question_tokens))
-        save_message(db, session_id, "assistant", answer, sources=sources, token_count=output_tokens)
+        sources, excerpts = [], []
+        for number, (namespace, doc, score) in enumerate(_merge_shards(results, k), start=1):
+            context = by_namespace[namespace][0]
+            page, chunk_index = chunk_key(doc.metadata)
+            label = f"{context.filename}, Page {page}, Chunk {chunk_index}"
+            excerpts.append(f"[{number}] {label}\n{doc.page_content}")
+            sources.append({
+                "session_id": context.session_id,
+                "filename": context.filename,
+                "page": page,
+                "chunk_index": chunk_index,
+                "score": round(score, 4),
+                "source": label,
+            })
         
-        # Track token usage
-        track_token_usage(db, session_id, "gemini-flash-latest", 
-                         input_tokens, output_tokens)
+        if excerpts:
+            prompt = MULTI_DOC_PROMPT.format(context="\n\n".join(excerpts), question=question)
+            response = await _get_llm().ainvoke(prompt, config={"callbacks": llm_callbacks()})
+            answer = response.content if isinstance(response.content, str) else str(response.content)
+        else:
+            answer = "No relevant passages were found in the selected documents."
+        observe_llm_calls("chat_multi", 1 if excerpts else 0)
         
         return {
             "answer": answer,
-            "sources": list(set(sources))  # Remove duplicates
+            "sources": sources,
+            "documents": {
+                "searched": [sid for ns in results for sid in (c.session_id for c in by_namespace[ns])],
+                "skipped": skipped,
+                "timed_out": timed_out,
+                "failed": failed,
+            },
         }
-        
+    
     except Exception as e:
         raise Exception(f"Failed to generate answer: {str(e)}")
 
 
-def clear_session(session_id: str) -> None:
+def clear_session(namespace: str, raise_errors: bool = False) -> None:
     """
-    Clear session data from Pinecone
+    Clear a document's vectors from the vector backend
+    
+    Errors are logged, or re-raised when raise_errors is set (retrying callers)
     """
     try:
-        if pinecone_index:
-            # Delete all vectors in the namespace
-            pinecone_index.delete(delete_all=True, namespace=session_id)
+        # Delete all vectors in the namespace
+        backend = get_vector_backend()
+        backend.delete_namespace(namespace)
+        get_lexical_store().delete_namespace(namespace)
+        registry.evict_namespace(namespace)
+        answer_cache.invalidate(namespace)
         
-        print(f"Session {session_id} cleared from Pinecone")
+        print(f"Namespace {namespace} cleared from {backend.name} backend")
         
     except Exception as e:
         print(f"Error clearing session: {str(e)}")
+        if raise_errors:
+            raise
 
 
-def is_session_initialized(session_id: str, db = None) -> bool:
+async def is_session_initialized(session_id: str, db: AsyncSession) -> bool:
     """
-    Check if session is initialized (document exists in DB)
+    Check if session is initialized (document exists in DB and is indexed)
     """
-    if not db:
-        db_gen = get_db()
-        db = next(db_gen)
-    
-    from database import Document
-    document = db.query(Document).filter(Document.session_id == session_id).first()
-    return document is not None
-
+    context = await session_contexts.resolve(db, session_id)
+    return context is not None and context.is_ready
@@ -0,0 +1,202 @@
+"""
+Resource Registry
+Process-wide cache of long-lived embedding/LLM clients and per-session retrievers
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+DEFAULT_EMBEDDING_MODEL = "models/text-embedding-004"
+DEFAULT_LLM_MODEL = "models/gemini-flash-latest"
+FALLBACK_LLM_MODEL = "models/gemini-pro-latest"
+
+EMBED_SCHEDULER_ENABLED = os.getenv("EMBED_SCHEDULER_ENABLED", "true").lower() not in ("0", "false", "no")
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, max_size: int, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        evicted = []
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                evicted.append(self._items.popitem(last=False))
+        if self.on_evict:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._items.pop(key, None)
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._items.keys())
+
+    def values(self) -> list:
+        with self._lock:
+            return list(self._items.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class ResourceRegistry:
+    """
+    Holds clients that are expensive to construct so they are built once
+
+    - Embedding and LLM clients: one per model (and settings), never evicted
+    - Retrievers: one per vector namespace, bounded LRU
+
+    Counters record how often each kind of resource was constructed versus reused.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None):
+        self.max_sessions = max_sessions or int(os.getenv("RAG_MAX_CACHED_SESSIONS", "256"))
+        self._clients: Dict[Hashable, Any] = {}
+        self._retrievers = LRUCache(self.max_sessions, on_evict=self._count_eviction("retriever"))
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._schedulers: Dict[str, Any] = {}
+
+    # Counters
+    def _count(self, kind: str, event: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(kind, {"constructed": 0, "reused": 0, "evicted": 0})
+            counters[event] += 1
+
+    def _count_eviction(self, kind: str) -> Callable[[Hashable, Any], None]:
+        return lambda key, value: self._count(kind, "evicted")
+
+    def stats(self) -> Dict[str, Any]:
+        """Construction/reuse counters per resource kind"""
+        with self._lock:
+            counters = {kind: dict(values) for kind, values in self._counters.items()}
+        return {
+            "counters": counters,
+            "cached_namespaces": len(self._retrievers),
+            "max_namespaces": self.max_sessions,
+        }
+
+    def scheduler_stats(self) -> Dict[str, Any]:
+        """Embedding scheduler counters per embedding model"""
+        with self._lock:
+            schedulers = dict(self._schedulers)
+        return {model: scheduler.stats() for model, scheduler in schedulers.items()}
+
+    # Clients
+    def _get_client(self, kind: str, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None:
+            self._count(kind, "reused")
+            return client
+
+        client = factory()
+        with self._lock:
+            # Another thread may have raced us; keep the first one
+            existing = self._clients.setdefault(key, client)
+        self._count(kind, "constructed" if existing is client else "reused")
+        return existing
+
+    @staticmethod
+    def _api_key() -> str:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise Exception("GEMINI_API_KEY not found in environment variables")
+        return api_key
+
+    def get_embeddings(self, model: str = DEFAULT_EMBEDDING_MODEL):
+        """
+        Get the shared embedding client for a model
+
+        Calls go through the embedding cache, then usage tracking (cache misses
+        only), then the embedding scheduler (batching, concurrency, rate limit,
+        retries), then the Gemini client.
+        """
+        def factory():
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            from embedding_cache import CachedEmbeddings, get_embedding_cache
+            from embedding_scheduler import EmbeddingScheduler
+            from token_accounting import UsageTrackingEmbeddings
+
+            embeddings = GoogleGenerativeAIEmbeddings(model=model, google_api_key=self._api_key())
+            if EMBED_SCHEDULER_ENABLED:
+                embeddings = EmbeddingScheduler(embeddings)
+                with self._lock:
+                    self._schedulers[model] = embeddings
+            embeddings = UsageTrackingEmbeddings(embeddings)
+            cache = get_embedding_cache()
+            return CachedEmbeddings(embeddings, model, cache) if cache else embeddings
+
+        return self._get_client("embeddings", ("embeddings", model), factory)
+
+    def get_llm(self, model: str = DEFAULT_LLM_MODEL, temperature: float = 0.1):
+        """Get the shared chat model client for a model"""
+        def factory():
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            return ChatGoogleGenerativeAI(
+                model=model,
+                google_api_key=self._api_key(),
+                temperature=temperature,
+                convert_system_message_to_human=True
+            )
+
+        return self._get_client("llm", ("llm", model, temperature), factory)
+
+    # Per-session handles
+    def get_retriever(self, namespace: str, k: int = 2):
+        """Get the retriever for a vector namespace (hybrid BM25 + dense unless disabled)"""
+        from vector_store import get_vector_backend
+        from lexical_index import HYBRID_RETRIEVAL_ENABLED, HybridRetriever, get_lexical_store
+
+        key = (namespace, k)
+        retriever = self._retrievers.get(key)
+        if retriever is not None:
+            self._count("retriever", "reused")
+            return retriever
+
+        if HYBRID_RETRIEVAL_ENABLED:
+            retriever = HybridRetriever(
+                backend=get_vector_backend(),
+                lexical=get_lexical_store(),
+                namespace=namespace,
+                embeddings=self.get_embeddings(),
+                k=k
+            )
+        else:
+            retriever = get_vector_backend().as_retriever(namespace, self.get_embeddings(), k=k)
+        self._retrievers.put(key, retriever)
+        self._count("retriever", "constructed")
+        return retriever
+
+    def evict_namespace(self, namespace: str) -> None:
+        """Drop cached handles for a namespace (e.g. after its vectors are deleted)"""
+        for key in self._retrievers.keys():
+            if key[0] == namespace:
+                self._retrievers.pop(key)
+
+
+# Registry (singleton)
+registry = ResourceRegistry()
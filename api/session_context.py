@@ -0,0 +1,130 @@
+"""
+Session Context
+Cached resolution of a chat session_id to its document and chat session rows
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import aget_session_context, aget_session_contexts
+
+
+class SessionContext:
+    """Ids and state of the document behind a session_id"""
+
+    def __init__(self, session_id: str, document_id, filename: str, status: Optional[str],
+                 vector_namespace: Optional[str], chat_session_id=None):
+        self.session_id = session_id
+        self.document_id = document_id
+        self.filename = filename
+        self.status = status
+        self.vector_namespace = vector_namespace
+        self.chat_session_id = chat_session_id
+
+    @property
+    def namespace(self) -> str:
+        """Vector namespace (session_id for documents uploaded before deduplication)"""
+        return self.vector_namespace or self.session_id
+
+    @property
+    def is_ready(self) -> bool:
+        """Queryable: indexed, or still ingesting with its first vectors stored"""
+        return self.status in (None, "active") or (
+            self.status == "processing" and self.vector_namespace is not None
+        )
+
+
+class SessionContextResolver:
+    """
+    session_id → SessionContext with an LRU/TTL cache
+
+    Only active documents are cached: their ids and namespace no longer
+    change, so a chat on a warm session needs no lookup at all. Documents
+    still processing are resolved on every call. Entries are invalidated
+    when the document is deleted; the TTL bounds staleness across processes.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("SESSION_CONTEXT_MAX_ENTRIES", "4096"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("SESSION_CONTEXT_TTL_SECONDS", "300"))
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, db: AsyncSession, session_id: str) -> Optional[SessionContext]:
+        """Get the context for a session, or None if it has no document"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        row = await aget_session_context(db, session_id)
+        if row is None:
+            return None
+
+        document_id, filename, status, vector_namespace, chat_session_id = row
+        context = SessionContext(session_id, document_id, filename, status, vector_namespace, chat_session_id)
+        if status in (None, "active"):
+            self._store(context)
+        return context
+
+    async def resolve_many(self, db: AsyncSession, session_ids: List[str]) -> Dict[str, SessionContext]:
+        """Contexts for several sessions (cache hits plus one query for the rest); unknown ones are left out"""
+        contexts: Dict[str, SessionContext] = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            for session_id in dict.fromkeys(session_ids):
+                entry = self._entries.get(session_id)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(session_id)
+                    self.hits += 1
+                    contexts[session_id] = entry[0]
+                else:
+                    self.misses += 1
+                    missing.append(session_id)
+
+        for row in await aget_session_contexts(db, missing):
+            session_id, document_id, filename, status, vector_namespace, chat_session_id = row
+            if session_id in contexts:
+                continue  # several chat sessions; any one will do
+            context = SessionContext(session_id, document_id, filename, status, vector_namespace, chat_session_id)
+            contexts[session_id] = context
+            if status in (None, "active"):
+                self._store(context)
+        return contexts
+
+    def _store(self, context: SessionContext) -> None:
+        with self._lock:
+            self._entries[context.session_id] = (context, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(context.session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session_id: str) -> None:
+        """Forget a session (e.g. its document was deleted)"""
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# Resolver (singleton)
+session_contexts = SessionContextResolver()
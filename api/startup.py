@@ -0,0 +1,174 @@
+"""
+Startup
+Background warm-up of the RAG pipeline, and the readiness state behind /ready
+
+main.py imports only FastAPI and the database layer, so the server listens
+quickly. Its lifespan hook creates the schema, then runs warm_up() in the
+background: import the pipeline modules (LangChain, vector and lexical stores,
+ingestion), resume interrupted ingestion jobs, open the async database pool and
+build the embedding and chat clients and the vector index handle, so the first
+upload or chat does not pay for any of it.
+
+Endpoints that need the pipeline await load_pipeline() first; before warm-up
+has finished importing, they wait for it without blocking the event loop.
+"""
+
+import os
+import time
+import asyncio
+import importlib
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from database import AsyncSessionLocal, init_db
+
+# Build clients and open the vector index during warm-up (otherwise on first use)
+WARMUP_CLIENTS = os.getenv("WARMUP_CLIENTS", "true").lower() not in ("0", "false", "no")
+
+# Seconds /ready waits for the database before reporting it unavailable
+READY_DB_TIMEOUT_SECONDS = float(os.getenv("READY_DB_TIMEOUT_SECONDS", "2.0"))
+
+# Imported by load_pipeline(); ingestion and cleanup pull in the rest
+PIPELINE_MODULES = ("rag_engine_pinecone", "ingestion", "cleanup")
+
+
+class Readiness:
+    """Outcome and duration of each startup step"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, step: str, seconds: float, error: Optional[str] = None) -> None:
+        self.steps[step] = {"ok": error is None, "ms": round(seconds * 1000, 1)}
+        if error is not None:
+            self.steps[step]["error"] = error
+
+    @property
+    def ready(self) -> bool:
+        return self.finished is not None and all(step["ok"] for step in self.steps.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "warmed_up": self.finished is not None,
+            "warmup_seconds": round(self.finished - self.started, 3) if self.finished is not None else None,
+            "steps": {name: dict(step) for name, step in self.steps.items()},
+        }
+
+
+# Readiness (singleton)
+readiness = Readiness()
+
+_pipeline_loaded = False
+
+
+def _import_pipeline() -> None:
+    global _pipeline_loaded
+    for module in PIPELINE_MODULES:
+        importlib.import_module(module)
+    _pipeline_loaded = True
+
+
+def pipeline_loaded() -> bool:
+    """Whether the pipeline modules have been imported"""
+    return _pipeline_loaded
+
+
+async def load_pipeline() -> None:
+    """
+    Make sure the pipeline modules are imported
+
+    The import runs in a worker thread; concurrent callers wait on Python's
+    module locks there, so the event loop keeps serving other requests.
+    """
+    if not _pipeline_loaded:
+        await asyncio.to_thread(_import_pipeline)
+
+
+async def _step(name: str, fn: Callable[[], Any], in_thread: bool = True) -> bool:
+    """Run one startup step, recording its duration and any error"""
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(fn) if in_thread else await fn()
+        if result is False:
+            raise Exception("see the log above")
+    except Exception as e:
+        readiness.record(name, time.perf_counter() - started, str(e))
+        print(f"⚠️  Startup step '{name}' failed: {e}")
+        return False
+    readiness.record(name, time.perf_counter() - started)
+    return True
+
+
+async def _ping_database() -> None:
+    if not AsyncSessionLocal:
+        raise Exception("Database engine not initialized. Check DATABASE_URL in .env")
+    async with AsyncSessionLocal() as db:
+        await asyncio.wait_for(db.execute(text("SELECT 1")), READY_DB_TIMEOUT_SECONDS)
+
+
+def _warm_clients() -> None:
+    from registry import registry, DEFAULT_LLM_MODEL
+    registry.get_embeddings()
+    registry.get_llm(DEFAULT_LLM_MODEL)
+
+
+def _warm_vector_index() -> None:
+    from vector_store import get_vector_backend
+    get_vector_backend().warm_up()
+
+
+def _start_workers() -> None:
+    from ingestion import resume_jobs
+    from cleanup import start_cleanup_worker
+
+    # Pick up ingestion jobs interrupted by a restart
+    try:
+        resume_jobs()
+    except Exception as e:
+        print(f"⚠️  Could not resume ingestion jobs: {e}")
+
+    # Finish (and keep retrying) vector/file cleanup for deleted documents
+    start_cleanup_worker()
+
+
+async def init_database() -> bool:
+    """Create tables and apply migrations before the server takes requests"""
+    ok = await _step("database", init_db)
+    if not ok:
+        print("💡 App will continue, but database features won't work")
+        print("💡 Fix DATABASE_URL in .env and restart")
+    return ok
+
+
+async def warm_up(database_ok: bool) -> None:
+    """Load the pipeline and open clients, pool and index handles (runs in the background)"""
+    try:
+        if await _step("pipeline", _import_pipeline) and database_ok:
+            await _step("workers", _start_workers)
+        if database_ok:
+            await _step("database_pool", _ping_database, in_thread=False)
+        if WARMUP_CLIENTS:
+            await _step("clients", _warm_clients)
+            await _step("vector_index", _warm_vector_index)
+    finally:
+        readiness.finished = time.perf_counter()
+        steps = ", ".join(f"{name} {step['ms']:g}ms" for name, step in readiness.steps.items())
+        print(f"{'✅' if readiness.ready else '⚠️ '} Warm-up finished in "
+              f"{readiness.finished - readiness.started:.2f}s ({steps})")
+
+
+async def check_ready() -> Dict[str, Any]:
+    """Readiness report; "ready" requires a finished warm-up and a responsive database"""
+    report = readiness.snapshot()
+    ready = readiness.ready
+    if ready:
+        try:
+            await _ping_database()
+        except Exception as e:
+            ready = False
+            report["database"] = f"unavailable: {str(e) or type(e).__name__}"
+    report["status"] = "ready" if ready else ("starting" if readiness.finished is None else "unavailable")
+    return report
@@ -0,0 +1,59 @@
+"""
+Shared test setup
+
+Tests run in the offline benchmark environment (benchmarks/offline.py):
+temporary SQLite database, local vector backend and fake models. offline is
+imported here, before any application module, so every test module sees it.
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import offline
+
+import httpx
+
+
+@pytest.fixture(scope="session")
+def app():
+    """The API with fake models and an initialized database (no lifespan: background workers stay off)"""
+    offline.install_fakes(llm_latency=0)
+    from database import init_db
+    init_db()
+    from main import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Async HTTP client factory for the API, used inside asyncio.run()"""
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.fixture
+def upload():
+    """Upload a PDF and wait for its ingestion job, returns the finished job"""
+    async def upload(client, session_id: str, pdf_path: str, timeout: float = 30.0):
+        with open(pdf_path, "rb") as f:
+            response = await client.post(
+                "/api/upload", files={"file": (os.path.basename(pdf_path), f.read(), "application/pdf")},
+                data={"session_id": session_id}
+            )
+        assert response.status_code == 202, response.text
+        job_id = response.json()["job_id"]
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = (await client.get(f"/api/jobs/{job_id}")).json()
+            if job["status"] not in ("queued", "running"):
+                return job
+            await asyncio.sleep(0.05)
+        raise AssertionError(f"job {job_id} did not finish within {timeout}s")
+
+    return upload
@@ -0,0 +1,21 @@
+"""
+Database statements per chat request (see benchmarks/chat_queries.py)
+
+Runs against the offline benchmark environment: temporary SQLite database,
+local vector backend and fake models.
+"""
+
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import chat_queries
+
+
+def test_chat_query_budget():
+    counts = asyncio.run(chat_queries.measure())
+
+    assert all(count > 0 for count in counts.values()), f"no statements observed: {counts}"
+    assert chat_queries.check(counts) == [], counts
@@ -0,0 +1,129 @@
+"""
+Document uploads and deletes: content deduplication with reference counting,
+cascading deletes and the cleanup task retried until it succeeds
+"""
+
+import os
+import asyncio
+import hashlib
+
+from sqlalchemy import func, select
+
+import offline
+
+
+def _content_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _namespace_exists(namespace: str) -> bool:
+    return os.path.isdir(os.path.join(os.environ["VECTOR_STORE_DIR"], namespace))
+
+
+def _indexed_content(content_hash: str):
+    from database import SessionLocal, IndexedContent
+    db = SessionLocal()
+    try:
+        return db.get(IndexedContent, content_hash)
+    finally:
+        db.close()
+
+
+def test_identical_uploads_share_one_index_until_the_last_delete(client, upload, tmp_path):
+    from cleanup import process_due_tasks
+
+    pdf = offline.write_synthetic_pdf(str(tmp_path / "shared.pdf"), pages=3, lines_per_page=10, seed=31)
+    content_hash = _content_hash(pdf)
+
+    async def scenario():
+        async with client() as api:
+            first = await upload(api, "dedup-a", pdf)
+            second = await upload(api, "dedup-b", pdf)
+            assert first["status"] == second["status"] == "completed"
+            assert not first["deduplicated"] and second["deduplicated"]
+            assert second["vectors_written"] == 0
+
+            indexed = _indexed_content(content_hash)
+            assert indexed.ref_count == 2
+            file_path = indexed.file_path
+
+            # Deleting one copy keeps the shared vectors and file for the other
+            assert (await api.delete("/api/document/dedup-a")).status_code == 200
+            process_due_tasks()
+            assert _indexed_content(content_hash).ref_count == 1
+            assert _namespace_exists(indexed.vector_namespace) and os.path.exists(file_path)
+            chat = await api.post("/api/chat", json={"question": "What is the inspection interval?", "session_id": "dedup-b"})
+            assert chat.status_code == 200 and chat.json()["sources"]
+
+            # The last reference frees them
+            assert (await api.delete("/api/document/dedup-b")).status_code == 200
+            process_due_tasks()
+            assert _indexed_content(content_hash) is None
+            assert not _namespace_exists(indexed.vector_namespace) and not os.path.exists(file_path)
+
+    asyncio.run(scenario())
+
+
+def test_delete_cascades_and_retries_failed_cleanup(client, upload, tmp_path, monkeypatch):
+    import cleanup
+    from database import SessionLocal, ChatSession, CleanupTask, Document, Message, TokenUsage
+    from vector_store import get_vector_backend
+
+    pdf = offline.write_synthetic_pdf(str(tmp_path / "cascade.pdf"), pages=2, lines_per_page=10, seed=32)
+    namespace = _content_hash(pdf)
+    backend = get_vector_backend()
+    delete_namespace = backend.delete_namespace
+    failures = []
+
+    def flaky_delete(name):
+        if not failures:
+            failures.append(name)
+            raise RuntimeError("vector store unavailable")
+        return delete_namespace(name)
+
+    async def scenario():
+        async with client() as api:
+            job = await upload(api, "cascade", pdf)
+            assert job["status"] == "completed"
+            for question in ("Which supplier is named?", "And the warranty?"):
+                assert (await api.post("/api/chat", json={"question": question, "session_id": "cascade"})).status_code == 200
+            chat_session_ids.extend(
+                db.query(ChatSession.id).join(Document, ChatSession.document_id == Document.id)
+                .filter(Document.session_id == "cascade").all()
+            )
+            monkeypatch.setattr(backend, "delete_namespace", flaky_delete)
+            assert (await api.delete("/api/document/cascade")).status_code == 200
+
+    db = SessionLocal()
+    chat_session_ids = []
+    monkeypatch.setattr(cleanup, "CLEANUP_RETRY_BASE_SECONDS", 0)
+    try:
+        asyncio.run(scenario())
+
+        # Chat sessions, messages and token usage went with the document, in the database
+        assert len(chat_session_ids) == 1
+        (chat_session_id,) = chat_session_ids[0]
+        assert db.query(Document).filter(Document.session_id == "cascade").count() == 0
+        assert db.get(ChatSession, chat_session_id) is None
+        assert db.query(Message).filter(Message.chat_session_id == chat_session_id).count() == 0
+        assert db.query(TokenUsage).filter(TokenUsage.session_id == "cascade").count() == 0
+        orphans = db.execute(
+            select(func.count()).select_from(Message)
+            .outerjoin(ChatSession, Message.chat_session_id == ChatSession.id).where(ChatSession.id.is_(None))
+        ).scalar()
+        assert orphans == 0
+
+        # The first cleanup attempt fails and is rescheduled, the retry removes the vectors
+        cleanup.process_due_tasks()
+        task = db.query(CleanupTask).filter(CleanupTask.vector_namespace == namespace).one()
+        assert (task.status, task.attempts) == ("pending", 1)
+        assert "vector store unavailable" in task.error
+        assert _namespace_exists(namespace)
+
+        cleanup.process_due_tasks()
+        db.refresh(task)
+        assert (task.status, task.attempts) == ("done", 2)
+        assert not _namespace_exists(namespace)
+    finally:
+        db.close()
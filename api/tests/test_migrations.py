@@ -0,0 +1,72 @@
+"""
+Schema migrations: versions recorded once, reversible migrations downgraded
+and re-applied, irreversible ones refusing to be reverted
+"""
+
+import pytest
+from sqlalchemy import create_engine, inspect, select
+
+from database import Base
+from migrations import MIGRATIONS, COMPOSITE_INDEXES, LEGACY_INDEXES, downgrade_to, run_migrations, schema_version
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _versions(engine) -> list:
+    with engine.connect() as conn:
+        return sorted(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def _indexes(engine, table: str) -> dict:
+    return {index["name"]: index for index in inspect(engine).get_indexes(table)}
+
+
+def test_fresh_database_records_every_version_once(engine):
+    latest = [migration.version for migration in MIGRATIONS]
+    assert run_migrations(engine) == latest
+    assert run_migrations(engine) == []
+    assert _versions(engine) == latest
+
+
+def test_downgrade_reverts_and_upgrade_reapplies(engine):
+    run_migrations(engine)
+    assert _indexes(engine, "chat_sessions")["ix_chat_sessions_document_id"]["unique"]
+
+    assert downgrade_to(engine, 5) == [6]
+    assert 6 not in _versions(engine)
+    assert not _indexes(engine, "chat_sessions")["ix_chat_sessions_document_id"]["unique"]
+
+    assert run_migrations(engine) == [6]
+    assert _indexes(engine, "chat_sessions")["ix_chat_sessions_document_id"]["unique"]
+
+
+def test_downgrade_stops_at_an_irreversible_migration(engine):
+    run_migrations(engine)
+    with pytest.raises(Exception, match="Migration 5 cannot be reverted"):
+        downgrade_to(engine, 2)
+    # Migrations above it were reverted, the rest stay applied
+    assert _versions(engine) == [1, 2, 3, 4, 5]
+
+
+def test_index_migration_round_trip(engine):
+    run_migrations(engine)
+    index_migration = next(migration for migration in MIGRATIONS if migration.version == 3)
+    composite = {name for name, _, _ in COMPOSITE_INDEXES}
+    legacy = {name for name, _, _ in LEGACY_INDEXES}
+
+    def all_indexes():
+        return {name for table in inspect(engine).get_table_names() for name in _indexes(engine, table)}
+
+    with engine.begin() as conn:
+        index_migration.downgrade(conn)
+    assert legacy <= all_indexes() and not composite & all_indexes()
+
+    with engine.begin() as conn:
+        index_migration.upgrade(conn)
+    assert composite <= all_indexes() and not legacy & all_indexes()
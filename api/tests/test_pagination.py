@@ -0,0 +1,80 @@
+"""
+Keyset pagination of the document list and chat history: every row exactly
+once, in order, including rows that share a timestamp
+"""
+
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import update
+
+
+def _walk(api, path: str, key: str, limit: int):
+    """All pages of a paginated endpoint, following next_cursor until it is None"""
+    async def walk():
+        pages, cursor = [], None
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            response = await api.get(path, params=params)
+            assert response.status_code == 200, response.text
+            body = response.json()
+            pages.append(body[key])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return pages
+    return walk()
+
+
+def test_document_pages_cover_every_document_once(client, app):
+    from database import SessionLocal, Document, save_document
+
+    db = SessionLocal()
+    try:
+        for i in range(7):
+            save_document(db, session_id=f"page-doc-{i}", filename=f"page-doc-{i}.pdf", file_size=0, chunk_count=0)
+        # Several documents uploaded in the same instant: the id breaks the tie
+        db.execute(update(Document).where(Document.session_id.in_([f"page-doc-{i}" for i in range(5)]))
+                   .values(uploaded_at=datetime(2001, 1, 1)))
+        db.commit()
+        expected = sorted(db.query(Document).all(), key=lambda doc: (doc.uploaded_at, doc.id.hex), reverse=True)
+    finally:
+        db.close()
+
+    async def scenario():
+        async with client() as api:
+            pages = await _walk(api, "/api/documents", "documents", limit=3)
+            invalid = await api.get("/api/documents", params={"cursor": "not-a-cursor"})
+            return pages, invalid
+
+    pages, invalid = asyncio.run(scenario())
+    assert all(len(page) == 3 for page in pages[:-1]) and 0 < len(pages[-1]) <= 3
+    assert [doc["id"] for page in pages for doc in page] == [str(doc.id) for doc in expected]
+    assert invalid.status_code == 400
+
+
+def test_chat_history_pages_walk_back_in_time(client, app):
+    from database import AsyncSessionLocal, SessionLocal, save_document, asave_exchange
+
+    db = SessionLocal()
+    try:
+        document = save_document(db, session_id="page-chat", filename="page-chat.pdf", file_size=0, chunk_count=0)
+        document_id = document.id
+    finally:
+        db.close()
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            chat_session_id = None
+            for i in range(4):
+                chat_session_id = await asave_exchange(session, "page-chat", document_id, chat_session_id,
+                                                       "page-chat.pdf", f"question {i}", 2, f"answer {i}", 2)
+        async with client() as api:
+            return await _walk(api, "/api/chat-history/page-chat", "messages", limit=3)
+
+    pages = asyncio.run(scenario())
+    # The first page is the most recent messages; each page is in chronological order
+    assert [[message["content"] for message in page] for page in pages] == [
+        ["answer 2", "question 3", "answer 3"],
+        ["question 1", "answer 1", "question 2"],
+        ["question 0", "answer 0"],
+    ]
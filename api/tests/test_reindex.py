@@ -0,0 +1,50 @@
+"""
+Re-uploading a revised document: unchanged pages (same page hash) keep their
+vectors, only changed pages are extracted into new chunks and embedded
+"""
+
+import re
+import asyncio
+
+import offline
+
+
+def test_new_version_embeds_only_changed_pages(client, upload, tmp_path, monkeypatch):
+    embedded = []
+    embed_documents = offline.SlowFakeEmbeddings.embed_documents
+
+    def counting_embed_documents(self, texts):
+        embedded.extend(texts)
+        return embed_documents(self, texts)
+
+    monkeypatch.setattr(offline.SlowFakeEmbeddings, "embed_documents", counting_embed_documents)
+
+    first_version = offline.write_synthetic_pdf(str(tmp_path / "v1.pdf"), pages=8, lines_per_page=20, seed=41)
+    second_version = offline.write_synthetic_pdf(str(tmp_path / "v2.pdf"), pages=8, lines_per_page=20, seed=41,
+                                                 changed_pages=(3, 6))
+
+    async def scenario():
+        async with client() as api:
+            first = await upload(api, "reindex", first_version)
+            first_embedded = len(embedded)
+            embedded.clear()
+            second = await upload(api, "reindex", second_version)
+            chat = await api.post("/api/chat", json={"question": "Which parts changed?", "session_id": "reindex"})
+            return first, first_embedded, second, chat
+
+    first, first_embedded, second, chat = asyncio.run(scenario())
+
+    assert first["status"] == "completed" and first["pages_reused"] == 0
+    assert first_embedded == first["chunks_total"]
+
+    assert second["status"] == "completed"
+    assert (second["pages_reused"], second["pages_recomputed"]) == (6, 2)
+    assert second["chunks_reused"] + second["chunks_recomputed"] == second["chunks_total"]
+    assert 0 < second["chunks_recomputed"] < second["chunks_total"]
+    # Only the chunks of pages 3 and 6 went to the embedding model
+    assert len(embedded) == second["chunks_recomputed"]
+    pages = [set(re.findall(r"^(\d+)\.\d+ ", text, re.MULTILINE)) for text in embedded]
+    assert all(chunk_pages and chunk_pages <= {"3", "6"} for chunk_pages in pages)
+    # Every chunk of the new version is searchable, whether its vector was copied or embedded
+    assert second["vectors_written"] == second["chunks_total"]
+    assert chat.status_code == 200 and chat.json()["sources"]
@@ -0,0 +1,67 @@
+"""
+Local vector backend with quantized codes: the first pass over int8/binary
+codes, rescored with the float rows, keeps the exact search's top hits
+"""
+
+import numpy as np
+import pytest
+
+from vector_store import LocalVectorBackend
+
+DIMENSION = 256
+ROWS = 2000
+K = 10
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Clustered vectors (like chunks of a few topics) and queries near those clusters"""
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(40, DIMENSION))
+    vectors = (centers[rng.integers(0, 40, ROWS)] + rng.normal(size=(ROWS, DIMENSION)) * 1.5).astype(np.float32)
+    queries = (centers[rng.integers(0, 40, 30)] + rng.normal(size=(30, DIMENSION)) * 1.5).astype(np.float32)
+    return vectors, queries
+
+
+def _index(root, quantization, vectors):
+    backend = LocalVectorBackend(str(root), quantization)
+    for start in range(0, len(vectors), 500):
+        rows = range(start, min(start + 500, len(vectors)))
+        backend.add_embeddings("docs", [f"chunk {i}" for i in rows], vectors[start:start + 500], [{"row": i} for i in rows])
+    return backend
+
+
+def _top_k(backend, queries):
+    return [backend.search_by_vector("docs", query, k=K) for query in queries]
+
+
+@pytest.mark.parametrize("quantization, min_recall", [("int8", 0.95), ("binary", 0.9)])
+def test_rescored_search_keeps_exact_recall(tmp_path, corpus, quantization, min_recall):
+    vectors, queries = corpus
+    exact = _top_k(_index(tmp_path / "exact", "none", vectors), queries)
+    quantized = _top_k(_index(tmp_path / quantization, quantization, vectors), queries)
+
+    recall = np.mean([
+        len({doc.metadata["row"] for doc, _ in a} & {doc.metadata["row"] for doc, _ in b}) / K
+        for a, b in zip(exact, quantized)
+    ])
+    assert recall >= min_recall
+
+    # Scores come from the float rows, so a hit found by both has the same score
+    exact_scores = {(q, doc.metadata["row"]): score for q, hits in enumerate(exact) for doc, score in hits}
+    for q, hits in enumerate(quantized):
+        for doc, score in hits:
+            if (q, doc.metadata["row"]) in exact_scores:
+                assert score == pytest.approx(exact_scores[(q, doc.metadata["row"])], abs=1e-5)
+                assert doc.page_content == f"chunk {doc.metadata['row']}"
+
+
+def test_codes_are_built_for_an_index_written_without_them(tmp_path, corpus):
+    vectors, queries = corpus
+    _index(tmp_path, "none", vectors)
+
+    # Reopening with quantization on builds the codes from the stored float rows
+    backend = LocalVectorBackend(str(tmp_path), "int8")
+    hits = backend.search_by_vector("docs", vectors[123], k=1)
+    assert hits[0][0].metadata["row"] == 123
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
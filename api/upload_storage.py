@@ -0,0 +1,148 @@
+"""
+Upload Storage
+Streams uploaded files to disk in fixed-size chunks with a size limit
+"""
+
+import os
+import hashlib
+import tempfile
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+# Where uploaded PDFs are kept (one file per distinct content hash)
+UPLOADS_DIR = os.getenv("UPLOADS_DIR", "uploads")
+
+# Uploads are read in fixed-size pieces, so peak memory per upload is one chunk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Largest accepted upload (default 250 MB)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "250")) * 1024 * 1024
+
+# Room for the multipart boundaries, part headers and form fields around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware answering 413 for request bodies past the upload limit on the given paths
+
+    Runs before the form is parsed, so an oversized upload is never spooled:
+    a Content-Length above the limit is rejected without reading the body, and
+    a body without one (chunked) is cut off once it grows past the limit.
+    stage_upload still enforces the exact limit on the file itself.
+    """
+
+    def __init__(self, app, paths, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+        self.max_body_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", ()))
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        state = {"received": 0, "rejected": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request" and not state["rejected"]:
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > self.max_body_bytes:
+                    await self._reject(scope, receive, send)
+                    state["rejected"] = True
+            if state["rejected"]:
+                # Ends form parsing as if the client had gone away
+                return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # The 413 has already been sent
+            if not state["rejected"]:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    async def _reject(self, scope, receive, send) -> None:
+        response = JSONResponse({"detail": str(UploadTooLarge(self.max_bytes))}, status_code=413)
+        await response(scope, receive, send)
+
+
+class StagedUpload:
+    """An upload written to a temporary file, not yet moved into place"""
+
+    def __init__(self, temp_path: str, size: int, content_hash: str):
+        self.temp_path = temp_path
+        self.size = size
+        self.content_hash = content_hash
+
+    def commit(self, final_path: str) -> str:
+        """Atomically move the file to its final path"""
+        os.replace(self.temp_path, final_path)
+        self.temp_path = None
+        return final_path
+
+    def discard(self) -> None:
+        """Remove the temporary file if it was not committed"""
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.temp_path = None
+
+
+def _hash_and_write(hasher, f, chunk: bytes) -> None:
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+async def stage_upload(file, max_bytes: int = MAX_UPLOAD_BYTES, uploads_dir: str = UPLOADS_DIR) -> StagedUpload:
+    """
+    Stream an UploadFile to a temporary file in uploads_dir
+
+    The SHA-256 and size are computed while copying; copying stops as soon
+    as the size limit is exceeded. Hashing and disk writes run in the
+    threadpool so large uploads don't block the event loop.
+
+    Raises:
+        UploadTooLarge: if the upload is larger than max_bytes
+    """
+    os.makedirs(uploads_dir, exist_ok=True)
+
+    # Reject early when the size is already known
+    if getattr(file, "size", None) and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    # Temp file in the same directory so the final rename is atomic
+    fd, temp_path = tempfile.mkstemp(dir=uploads_dir, prefix=".upload-", suffix=".part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                await run_in_threadpool(_hash_and_write, hasher, f, chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    return StagedUpload(temp_path, size, hasher.hexdigest())
@@ -0,0 +1,654 @@
+"""
+Vector Store Backends
+Pluggable vector storage for the RAG engine: Pinecone (remote) or a local NumPy index
+"""
+
+import os
+import re
+import asyncio
+import json
+import mmap
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from metrics import span
+from registry import LRUCache
+
+# Gemini text-embedding-004 dimension
+EMBEDDING_DIMENSION = 768
+
+# Pinecone client (singleton)
+pinecone_client = None
+pinecone_index = None
+_pinecone_lock = threading.Lock()
+
+# Seconds to wait for a Pinecone index to be deleted or become ready
+PINECONE_READY_TIMEOUT_SECONDS = float(os.getenv("PINECONE_READY_TIMEOUT_SECONDS", "120"))
+
+# Local index: first-pass search over "int8" or "binary" codes instead of the
+# float32 vectors ("none"), then exact rescoring of LOCAL_VECTOR_RESCORE_CANDIDATES
+# candidates (at least 4 per requested result)
+QUANTIZATION_MODES = ("none", "int8", "binary")
+LOCAL_VECTOR_QUANTIZATION = os.getenv("LOCAL_VECTOR_QUANTIZATION", "none").lower()
+LOCAL_VECTOR_RESCORE_CANDIDATES = int(os.getenv("LOCAL_VECTOR_RESCORE_CANDIDATES", "64"))
+
+# Local index: namespaces kept loaded (least recently used are dropped and re-mapped from disk on next use)
+LOCAL_VECTOR_MAX_NAMESPACES = int(os.getenv("LOCAL_VECTOR_MAX_NAMESPACES", "256"))
+
+# Rows scored per block in the int8 first pass (bounds the float32 temporary)
+_SCORE_BLOCK_ROWS = 1024
+
+# Set bits per byte value, for NumPy versions without bitwise_count
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def _truncate(path: str, size: int) -> None:
+    """Cut a file back to size bytes if an interrupted append left more"""
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        os.truncate(path, size)
+
+
+def _wait_until(condition, description: str, timeout: float = PINECONE_READY_TIMEOUT_SECONDS) -> None:
+    """Poll condition() with backoff (0.25s doubling up to 2s) until it holds"""
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while not condition():
+        if time.monotonic() >= deadline:
+            raise Exception(f"Timed out after {timeout:g}s waiting for {description}")
+        time.sleep(delay)
+        delay = min(delay * 2, 2.0)
+
+
+def initialize_pinecone():
+    """
+    Initialize Pinecone connection
+
+    Lists indexes once (the listing carries each index's dimension and status).
+    Only when the index has to be replaced, created or is still starting does
+    it poll, returning as soon as Pinecone reports the index ready.
+    """
+    global pinecone_client, pinecone_index
+
+    if pinecone_client and pinecone_index:
+        return  # Already initialized
+
+    from pinecone import Pinecone as PineconeClient, ServerlessSpec
+
+    api_key = os.getenv("PINECONE_API_KEY")
+    index_name = os.getenv("PINECONE_INDEX_NAME", "pdf-rag-demo")
+    environment = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")  # Default for serverless
+
+    if not api_key:
+        raise Exception("PINECONE_API_KEY not found in environment variables")
+
+    with _pinecone_lock:
+        if pinecone_client and pinecone_index:
+            return  # Initialized by a concurrent caller
+
+        try:
+            # Initialize Pinecone client (v5+)
+            client = PineconeClient(api_key=api_key)
+            index_info = next((idx for idx in client.list_indexes() if idx.name == index_name), None)
+
+            # Index with the wrong dimension (1536 from OpenAI): delete and
+            # recreate with the correct dimension (768 for Gemini)
+            if index_info is not None and index_info.dimension != EMBEDDING_DIMENSION:
+                print(f"⚠️  Index {index_name} has dimension {index_info.dimension}, but we need 768 (Gemini)")
+                print(f"🗑️  Deleting old index to create new one with correct dimension...")
+                client.delete_index(index_name, timeout=-1)
+                _wait_until(lambda: not client.has_index(index_name), f"index {index_name} to be deleted")
+                print(f"✅ Old index deleted")
+                index_info = None
+
+            if index_info is None:
+                # Create index if it doesn't exist (v6+)
+                print(f"📦 Creating new Pinecone index: {index_name} with dimension 768 (Gemini)")
+                client.create_index(
+                    name=index_name,
+                    dimension=EMBEDDING_DIMENSION,
+                    metric="cosine",
+                    spec=ServerlessSpec(
+                        cloud="aws",
+                        region=environment
+                    ),
+                    timeout=-1
+                )
+                print(f"✅ Created Pinecone index: {index_name}")
+
+            if index_info is None or not index_info.status.ready:
+                _wait_until(lambda: client.describe_index(index_name).status.ready, f"index {index_name} to be ready")
+
+            # Get index
+            pinecone_index = client.Index(index_name)
+            pinecone_client = client
+            print(f"Pinecone initialized with index: {index_name}")
+
+        except Exception as e:
+            raise Exception(f"Failed to initialize Pinecone: {str(e)}")
+
+
+class VectorBackend:
+    """
+    Base class for vector storage backends
+
+    Vectors are grouped by namespace (one namespace per indexed document).
+    Backends store pre-computed embeddings so the embedding model stays
+    under the caller's control.
+    """
+    name = "base"
+
+    def add_embeddings(
+        self,
+        namespace: str,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        metadatas: Sequence[Dict],
+        ids: Optional[Sequence[str]] = None
+    ) -> int:
+        """Store vectors with their texts and metadata, returns number stored"""
+        raise NotImplementedError
+
+    def search_by_vector(self, namespace: str, vector: Sequence[float], k: int = 2) -> List[Tuple[Document, float]]:
+        """Return the k most similar documents with cosine similarity scores"""
+        raise NotImplementedError
+
+    def fetch(self, namespace: str, ids: Sequence[str]) -> Dict[str, Tuple[List[float], str, Dict]]:
+        """Stored (vector, text, metadata) by id; ids that are not in the namespace are left out"""
+        raise NotImplementedError
+
+    def delete_namespace(self, namespace: str) -> None:
+        """Delete all vectors in a namespace"""
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Open connections and handles ahead of the first request (nothing to do by default)"""
+
+    def add_documents(self, namespace: str, documents: List[Document], embeddings: Embeddings) -> int:
+        """Embed documents and store them in a namespace"""
+        if not documents:
+            return 0
+        texts = [doc.page_content for doc in documents]
+        vectors = embeddings.embed_documents(texts)
+        return self.add_embeddings(namespace, texts, vectors, [doc.metadata for doc in documents])
+
+    def as_retriever(self, namespace: str, embeddings: Embeddings, k: int = 2) -> "BackendRetriever":
+        """Build a LangChain retriever over a namespace"""
+        return BackendRetriever(backend=self, namespace=namespace, embeddings=embeddings, k=k)
+
+
+class BackendRetriever(BaseRetriever):
+    """LangChain retriever that embeds the query and searches a VectorBackend"""
+    backend: Any
+    namespace: str
+    embeddings: Any
+    k: int = 2
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with span("retrieval.embed"):
+            vector = self.embeddings.embed_query(query)
+        with span("retrieval.vector_search"):
+            return [doc for doc, _ in self.backend.search_by_vector(self.namespace, vector, k=self.k)]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # Backend clients are synchronous (Pinecone SDK, NumPy), so search in a worker thread
+        with span("retrieval.embed"):
+            vector = await self.embeddings.aembed_query(query)
+        with span("retrieval.vector_search"):
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, self.backend.search_by_vector, self.namespace, vector, self.k
+            )
+        return [doc for doc, _ in results]
+
+
+class PineconeBackend(VectorBackend):
+    """Remote vector storage in a Pinecone serverless index"""
+    name = "pinecone"
+
+    def __init__(self, index_name: Optional[str] = None, upsert_batch_size: int = 100):
+        self.index_name = index_name or os.getenv("PINECONE_INDEX_NAME", "pdf-rag-demo")
+        self.upsert_batch_size = upsert_batch_size
+
+    def _index(self):
+        initialize_pinecone()
+        return pinecone_index
+
+    def warm_up(self):
+        self._index()
+
+    def add_embeddings(self, namespace, texts, vectors, metadatas, ids=None) -> int:
+        index = self._index()
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        records = [
+            # "text" matches the text_key used by langchain_pinecone
+            (vector_id, list(map(float, vector)), {**metadata, "text": text})
+            for vector_id, text, vector, metadata in zip(ids, texts, vectors, metadatas)
+        ]
+        for start in range(0, len(records), self.upsert_batch_size):
+            index.upsert(vectors=records[start:start + self.upsert_batch_size], namespace=namespace)
+        return len(records)
+
+    def search_by_vector(self, namespace, vector, k=2):
+        response = self._index().query(
+            vector=list(map(float, vector)),
+            top_k=k,
+            namespace=namespace,
+            include_metadata=True
+        )
+        results = []
+        for match in response.matches:
+            metadata = dict(match.metadata or {})
+            text = metadata.pop("text", "")
+            results.append((Document(page_content=text, metadata=metadata), float(match.score)))
+        return results
+
+    def fetch(self, namespace, ids):
+        index = self._index()
+        ids = list(ids)
+        fetched = {}
+        for start in range(0, len(ids), self.upsert_batch_size):
+            response = index.fetch(ids=ids[start:start + self.upsert_batch_size], namespace=namespace)
+            for vector_id, vector in response.vectors.items():
+                metadata = dict(vector.metadata or {})
+                text = metadata.pop("text", "")
+                fetched[vector_id] = (list(vector.values), text, metadata)
+        return fetched
+
+    def delete_namespace(self, namespace):
+        try:
+            self._index().delete(delete_all=True, namespace=namespace)
+        except Exception as e:
+            # Deleting a namespace that no longer exists is not an error (retried cleanups)
+            if getattr(e, "status", None) != 404:
+                raise
+
+
+class _RecordFile:
+    """
+    Rows of records.jsonl, parsed on access from a memory map
+
+    Only the byte offset of each line stays in memory (8 bytes per row), so a
+    loaded namespace does not hold its chunk texts; searches read just the
+    records of the rows they return.
+    """
+
+    def __init__(self, path: str, offsets: np.ndarray):
+        self.offsets = offsets  # (n + 1,) int64 line starts, then the end of the last line
+        self._map = None
+        if offsets[-1]:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), int(offsets[-1]), access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def line_offsets(lines: Sequence[bytes], start: int = 0) -> np.ndarray:
+        """Offsets of encoded lines written from byte position start (without the leading start)"""
+        return start + np.cumsum([len(line) for line in lines], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> Dict:
+        return json.loads(self._map[self.offsets[row]:self.offsets[row + 1]])
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+class _LocalNamespace:
+    """View of one namespace: memory-mapped float32 rows (and codes) plus its records"""
+
+    def __init__(self, matrix: np.ndarray, records: Sequence[Dict],
+                 codes: Optional[np.ndarray] = None, scales: Optional[np.ndarray] = None):
+        self.matrix = matrix  # (n, dim), rows are L2-normalized
+        self.records = records  # {"id", "text", "metadata"} per row: a _RecordFile (or an older namespace's list)
+        self.codes = codes  # quantized rows: (n, dim) int8 or (n, dim / 8) packed sign bits
+        self.scales = scales  # (n,) float32 per-row int8 scale
+        self._rows: Optional[Dict[str, int]] = None
+
+    def row_of(self, vector_id: str) -> Optional[int]:
+        """Row index of an id (the id map is built on first use)"""
+        if self._rows is None:
+            self._rows = {record["id"]: row for row, record in enumerate(self.records)}
+        return self._rows.get(vector_id)
+
+
+class LocalVectorBackend(VectorBackend):
+    """
+    In-process vector index using NumPy
+
+    Each namespace is a float32 matrix of unit-length rows, persisted under
+    VECTOR_STORE_DIR as `vectors.f32` (raw, row-major, memory-mapped on load),
+    `records.jsonl` (texts and metadata) and `meta.json` (row count and dimension).
+    Batches are appended, so streaming ingestion stays linear. Cosine similarity
+    is a single matrix product. At most max_namespaces namespaces stay loaded;
+    the least recently used one is dropped and mapped again on its next search.
+
+    With quantization ("int8" or "binary"), each namespace also keeps codes:
+    `codes.i8` (rows scaled to int8, with per-row `scales.f32`; 4x smaller) or
+    `codes.bits` (sign bits; 32x smaller). Searches score the codes, then
+    rescore the best candidates exactly from the float32 rows, so only the
+    codes and a few float32 rows per query are read. Codes missing for older
+    namespaces are built from the float32 rows on load.
+    """
+    name = "local"
+
+    def __init__(self, root_dir: Optional[str] = None, quantization: Optional[str] = None,
+                 rescore_candidates: Optional[int] = None, max_namespaces: Optional[int] = None):
+        self.root_dir = root_dir or os.getenv("VECTOR_STORE_DIR", "vector_store")
+        self.quantization = (quantization or LOCAL_VECTOR_QUANTIZATION).lower()
+        if self.quantization not in QUANTIZATION_MODES:
+            raise Exception(f"Unknown LOCAL_VECTOR_QUANTIZATION '{self.quantization}' "
+                            f"(expected 'none', 'int8' or 'binary')")
+        self.rescore_candidates = rescore_candidates or LOCAL_VECTOR_RESCORE_CANDIDATES
+        self._namespaces = LRUCache(max_namespaces or LOCAL_VECTOR_MAX_NAMESPACES)
+        self._lock = threading.RLock()
+
+    def _namespace_dir(self, namespace: str) -> str:
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", namespace)
+        return os.path.join(self.root_dir, safe_name)
+
+    def _load(self, namespace: str) -> Optional[_LocalNamespace]:
+        """Get a namespace from memory, memory-mapping it from disk on first use"""
+        with self._lock:
+            cached = self._namespaces.get(namespace)
+            if cached is not None:
+                return cached
+
+            ns_dir = self._namespace_dir(namespace)
+            meta_path = os.path.join(ns_dir, "meta.json")
+            if not os.path.exists(meta_path):
+                return None
+
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            # meta.json count is written last, so rows/records past it are an
+            # interrupted append: drop them so the next append lines up with the count again
+            count, dim = meta["count"], meta["dim"]
+            if "records" in meta:
+                records = meta["records"][:count]  # older layout kept records inline
+            else:
+                records_path = os.path.join(ns_dir, "records.jsonl")
+                offsets = np.zeros(count + 1, dtype=np.int64)
+                with open(records_path, "rb") as f:
+                    for row in range(count):
+                        f.readline()
+                        offsets[row + 1] = f.tell()
+                _truncate(records_path, int(offsets[-1]))
+                records = _RecordFile(records_path, offsets)
+            _truncate(os.path.join(ns_dir, "vectors.f32"), count * dim * 4)
+
+            matrix = self._map_vectors(ns_dir, count, dim)
+            loaded = _LocalNamespace(matrix, records, *self._map_codes(ns_dir, matrix))
+            self._advise_random(loaded)
+            self._namespaces.put(namespace, loaded)
+            return loaded
+
+    @staticmethod
+    def _map_vectors(ns_dir: str, count: int, dim: int) -> np.ndarray:
+        if not count:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.memmap(os.path.join(ns_dir, "vectors.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+
+    def _code_layout(self, dim: int) -> Tuple[str, np.dtype, int]:
+        """(file name, dtype, bytes per row) of the codes for the configured quantization"""
+        if self.quantization == "binary":
+            return "codes.bits", np.dtype(np.uint8), (dim + 7) // 8
+        return "codes.i8", np.dtype(np.int8), dim
+
+    @staticmethod
+    def _quantize(matrix: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Codes (and int8 scales) for unit-length float32 rows"""
+        if mode == "binary":
+            return np.packbits(matrix > 0, axis=1), None
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.rint(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _write_codes(self, ns_dir: str, matrix: np.ndarray, file_mode: str) -> None:
+        codes, scales = self._quantize(matrix, self.quantization)
+        codes_file = self._code_layout(matrix.shape[1])[0]
+        with open(os.path.join(ns_dir, codes_file), file_mode) as f:
+            f.write(np.ascontiguousarray(codes).tobytes())
+        if scales is not None:
+            with open(os.path.join(ns_dir, "scales.f32"), file_mode) as f:
+                f.write(scales.tobytes())
+
+    def _map_codes(self, ns_dir: str, matrix: np.ndarray) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Memory-map a namespace's codes (and scales), building them first if they lag behind the rows"""
+        if self.quantization == "none":
+            return None, None
+
+        count, dim = matrix.shape
+        codes_file, dtype, width = self._code_layout(dim)
+        if not count:
+            return np.zeros((0, width), dtype=dtype), np.zeros(0, dtype=np.float32) if self.quantization == "int8" else None
+
+        codes_path = os.path.join(ns_dir, codes_file)
+        scales_path = os.path.join(ns_dir, "scales.f32")
+        stored = os.path.getsize(codes_path) // width if os.path.exists(codes_path) else 0
+        if self.quantization == "int8":
+            stored = min(stored, os.path.getsize(scales_path) // 4 if os.path.exists(scales_path) else 0)
+            _truncate(scales_path, count * 4)
+        _truncate(codes_path, count * width)
+        if stored < count:
+            # Rows written while quantization was off: encode them all, a block at a time
+            for start in range(0, count, _SCORE_BLOCK_ROWS):
+                self._write_codes(ns_dir, np.asarray(matrix[start:start + _SCORE_BLOCK_ROWS]), "wb" if start == 0 else "ab")
+
+        codes = np.memmap(codes_path, dtype=dtype, mode="r", shape=(count, width))
+        scales = np.memmap(scales_path, dtype=np.float32, mode="r", shape=(count,)) if self.quantization == "int8" else None
+        return codes, scales
+
+    @staticmethod
+    def _advise_random(loaded: _LocalNamespace) -> None:
+        """
+        With codes, float32 rows are only read for rescoring, a few scattered rows
+        per query: turn off readahead so each read pages in just those rows
+        """
+        mapping = getattr(loaded.matrix, "_mmap", None)
+        if loaded.codes is not None and mapping is not None and hasattr(mmap, "MADV_RANDOM"):
+            mapping.madvise(mmap.MADV_RANDOM)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_embeddings(self, namespace, texts, vectors, metadatas, ids=None) -> int:
+        if not texts:
+            return 0
+
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32))
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        new_records = [
+            {"id": vector_id, "text": text, "metadata": dict(metadata)}
+            for vector_id, text, metadata in zip(ids, texts, metadatas)
+        ]
+
+        with self._lock:
+            existing = self._load(namespace)
+            dim = matrix.shape[1]
+            if existing and existing.matrix.shape[1] != dim:
+                raise ValueError(f"Dimension mismatch: namespace has {existing.matrix.shape[1]}, got {dim}")
+
+            ns_dir = self._namespace_dir(namespace)
+            os.makedirs(ns_dir, exist_ok=True)
+            records_path = os.path.join(ns_dir, "records.jsonl")
+            offsets = np.zeros(1, dtype=np.int64)
+            if existing and not isinstance(existing.records, _RecordFile):
+                # Migrate the older inline-records layout before appending
+                lines = [(json.dumps(record) + "\n").encode("utf-8") for record in existing.records]
+                with open(records_path, "wb") as f:
+                    f.writelines(lines)
+                offsets = np.concatenate([offsets, _RecordFile.line_offsets(lines)])
+            elif existing:
+                offsets = existing.records.offsets
+
+            # Append-only: each batch costs O(batch), not O(namespace). A first batch
+            # overwrites anything an uncommitted earlier attempt left
+            first_batch = existing is None
+            lines = [(json.dumps(record) + "\n").encode("utf-8") for record in new_records]
+            with open(os.path.join(ns_dir, "vectors.f32"), "wb" if first_batch else "ab") as f:
+                f.write(np.ascontiguousarray(matrix).tobytes())
+            with open(records_path, "wb" if first_batch else "ab") as f:
+                f.writelines(lines)
+            if self.quantization != "none":
+                self._write_codes(ns_dir, matrix, "wb" if first_batch else "ab")
+            offsets = np.concatenate([offsets, _RecordFile.line_offsets(lines, int(offsets[-1]))])
+            count = len(offsets) - 1
+
+            # Commit the new count atomically so readers never see a partial batch
+            meta_path = os.path.join(ns_dir, "meta.json")
+            tmp_path = meta_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "count": count}, f)
+            os.replace(tmp_path, meta_path)
+
+            # Searches already running keep their old (still valid) view
+            matrix = self._map_vectors(ns_dir, count, dim)
+            loaded = _LocalNamespace(matrix, _RecordFile(records_path, offsets), *self._map_codes(ns_dir, matrix))
+            self._advise_random(loaded)
+            self._namespaces.put(namespace, loaded)
+
+        return len(new_records)
+
+    def search_batch(
+        self, namespace: str, vectors: Sequence[Sequence[float]], k: int = 2
+    ) -> List[List[Tuple[Document, float]]]:
+        """Top-k cosine search for several query vectors at once"""
+        loaded = self._load(namespace)
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if loaded is None or not len(loaded.records) or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        queries = self._normalize(queries)
+        k = min(k, len(loaded.records))
+        if loaded.codes is None:
+            ranked = self._exact_top_k(loaded, queries, k)
+        else:
+            ranked = self._rescored_top_k(loaded, queries, k)
+
+        return [
+            [
+                (
+                    Document(
+                        page_content=loaded.records[i]["text"],
+                        metadata=dict(loaded.records[i]["metadata"])
+                    ),
+                    float(score)
+                )
+                for i, score in zip(rows, scores)
+            ]
+            for rows, scores in ranked
+        ]
+
+    @staticmethod
+    def _exact_top_k(loaded: _LocalNamespace, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(rows, scores) of the k best float32 rows per query"""
+        scores = queries @ loaded.matrix.T  # (m, n)
+
+        # argpartition gives the unordered top-k in O(n); only those k get sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ranked = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            ranked.append((ordered, scores[row, ordered]))
+        return ranked
+
+    def _first_pass(self, loaded: _LocalNamespace, queries: np.ndarray) -> np.ndarray:
+        """Approximate scores (m, n) from the codes; higher is more similar"""
+        n = len(loaded.codes)
+        if self.quantization == "binary":
+            # Fewer differing sign bits = smaller angle
+            bitcount = getattr(np, "bitwise_count", None) or _POPCOUNT.__getitem__
+            scores = np.empty((len(queries), n), dtype=np.int32)
+            for row, bits in enumerate(np.packbits(queries > 0, axis=1)):
+                scores[row] = -bitcount(np.bitwise_xor(loaded.codes, bits)).sum(axis=1, dtype=np.int32)
+            return scores
+
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, _SCORE_BLOCK_ROWS):
+            end = start + _SCORE_BLOCK_ROWS
+            block = np.asarray(loaded.codes[start:end], dtype=np.float32)
+            scores[:, start:end] = (queries @ block.T) * loaded.scales[start:end]
+        return scores
+
+    def _rescored_top_k(self, loaded: _LocalNamespace, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(rows, exact scores) of the k best rows per query among the best candidates by code"""
+        approx = self._first_pass(loaded, queries)
+        candidates = min(approx.shape[1], max(self.rescore_candidates, 4 * k))
+        top = np.argpartition(-approx, candidates - 1, axis=1)[:, :candidates]
+        ranked = []
+        for row, rows in enumerate(top):
+            rows = np.sort(rows)  # ascending offsets: reads from the memory map stay sequential
+            exact = loaded.matrix[rows] @ queries[row]
+            best = np.argsort(-exact)[:k]
+            ranked.append((rows[best], exact[best]))
+        return ranked
+
+    def search_by_vector(self, namespace, vector, k=2):
+        return self.search_batch(namespace, [vector], k=k)[0]
+
+    def fetch(self, namespace, ids):
+        loaded = self._load(namespace)
+        fetched = {}
+        if loaded is None:
+            return fetched
+        for vector_id in ids:
+            row = loaded.row_of(vector_id)
+            if row is not None:
+                record = loaded.records[row]
+                fetched[vector_id] = (loaded.matrix[row].tolist(), record["text"], dict(record["metadata"]))
+        return fetched
+
+    def delete_namespace(self, namespace):
+        with self._lock:
+            self._namespaces.pop(namespace)
+            ns_dir = self._namespace_dir(namespace)
+            if os.path.isdir(ns_dir):
+                shutil.rmtree(ns_dir)
+
+
+# Backend (singleton)
+_vector_backend: Optional[VectorBackend] = None
+_vector_backend_lock = threading.Lock()
+
+
+def get_vector_backend() -> VectorBackend:
+    """
+    Get the configured vector backend
+
+    VECTOR_BACKEND selects the implementation: "pinecone" (default) or "local"
+    """
+    global _vector_backend
+
+    if _vector_backend is not None:
+        return _vector_backend
+    with _vector_backend_lock:
+        # Another caller may have built it while this one waited
+        if _vector_backend is None:
+            backend_name = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+            if backend_name == "local":
+                backend = LocalVectorBackend()
+            elif backend_name == "pinecone":
+                backend = PineconeBackend()
+            else:
+                raise Exception(f"Unknown VECTOR_BACKEND '{backend_name}' (expected 'pinecone' or 'local')")
+            quantization = getattr(backend, "quantization", "none")
+            print(f"Vector backend: {backend.name}" + (f" ({quantization} codes)" if quantization != "none" else ""))
+            _vector_backend = backend
+    return _vector_backend
@@ -72,7 +72,7 @@ export default function ChatInterface({ sessionId, isReady, onSessionChange }: C
     setIsLoading(true);
 
     try {
-      const response = await fetch(`${API_URL}/api/chat`, {
+      const response = await fetch(`${API_URL}/api/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -83,19 +83,51 @@ export default function ChatInterface({ sessionId, isReady, onSessionChange }: C
         }),
       });
 
-      const data = await response.json();
-
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
         throw new Error(data.detail || data.error || 'Failed to get answer');
       }
 
-      const assistantMessage: Message = {
-        role: 'assistant',
-        content: data.answer,
-        sources: data.sources,
+      // Server-sent events: sources first, then answer tokens, then usage
+      let started = false;
+      const updateAssistant = (update: (message: Message) => Message) => {
+        const isFirst = !started;
+        started = true;
+        setMessages((prev) => {
+          if (isFirst) {
+            return [...prev, update({ role: 'assistant', content: '' })];
+          }
+          const next = [...prev];
+          next[next.length - 1] = update(next[next.length - 1]);
+          return next;
+        });
       };
 
-      setMessages((prev) => [...prev, assistantMessage]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary: number;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const raw = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+
+          if (event === 'sources') {
+            updateAssistant((message) => ({ ...message, sources: data.sources }));
+          } else if (event === 'token') {
+            updateAssistant((message) => ({ ...message, content: message.content + data.text }));
+          } else if (event === 'error') {
+            throw new Error(data.detail || 'Failed to get answer');
+          }
+        }
+      }
+
       loadChatHistory();
     } catch (error: any) {
       showToast(error.message || 'Failed to get answer. Please try again.', 'error');
@@ -214,8 +246,8 @@ export default function ChatInterface({ sessionId, isReady, onSessionChange }: C
                 </div>
               ))}
 
-              {/* Loading indicator */}
-              {isLoading && (
+              {/* Loading indicator (until the streamed answer starts) */}
+              {isLoading && messages[messages.length - 1]?.role !== 'assistant' && (
                 <div className="flex items-start gap-3 animate-slide-up">
                   <div className="flex-shrink-0 h-9 w-9 rounded-xl bg-slate-100 flex items-center justify-center shadow-sm">
                     <Bot className="h-5 w-5 text-slate-600" />
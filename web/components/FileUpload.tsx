@@ -12,6 +12,10 @@ interface FileUploadProps {
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
+// Ingestion stages reported by /api/jobs/{id}, in ProcessingLoader step order
+const JOB_STAGES = ['extracting', 'chunking', 'embedding', 'indexing', 'finalizing'];
+const JOB_POLL_INTERVAL_MS = 1000;
+
 export default function FileUpload({ onUploadSuccess, sessionId }: FileUploadProps) {
   const [isDragging, setIsDragging] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
@@ -21,6 +25,27 @@ export default function FileUpload({ onUploadSuccess, sessionId }: FileUploadPro
   const [uploadProgress, setUploadProgress] = useState(0);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
+  const waitForJob = async (jobId: string) => {
+    while (true) {
+      const response = await fetch(`${API_URL}/api/jobs/${jobId}`);
+      const job = await response.json();
+
+      if (!response.ok) {
+        throw new Error(job.detail || 'Failed to check processing status');
+      }
+      if (job.status === 'completed') {
+        return job;
+      }
+      if (job.status === 'failed' || job.status === 'cancelled') {
+        throw new Error(job.error || 'Failed to process PDF');
+      }
+
+      const step = JOB_STAGES.indexOf(job.stage);
+      setProcessingStep(step === -1 ? 0 : step);
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+  };
+
   const handleFileSelect = async (file: File) => {
     if (file.type !== 'application/pdf') {
       showToast('Please upload a PDF file', 'error');
@@ -68,15 +93,18 @@ export default function FileUpload({ onUploadSuccess, sessionId }: FileUploadPro
       setIsUploading(false);
       setIsProcessing(true);
 
-      const steps = [0, 1, 2, 3, 4];
-      for (const step of steps) {
-        setProcessingStep(step);
-        await new Promise((resolve) => setTimeout(resolve, 800));
-      }
+      const job = await waitForJob(data.job_id);
 
       setIsProcessing(false);
-      showToast(`PDF processed successfully! ${data.chunks} chunks ready.`, 'success');
-      onUploadSuccess(sessionId, data.chunks);
+      if (data.new_version && !job.deduplicated) {
+        showToast(
+          `New version ready: ${job.pages_recomputed} changed pages re-embedded, ${job.chunks_reused} of ${job.chunks_total} chunks reused without re-embedding.`,
+          'success'
+        );
+      } else {
+        showToast(`PDF processed successfully! ${job.chunks_total} chunks ready.`, 'success');
+      }
+      onUploadSuccess(sessionId, job.chunks_total);
     } catch (error: any) {
       setIsUploading(false);
       setIsProcessing(false);
@@ -26,6 +26,8 @@ export default function Sidebar({ isOpen, onClose, onSelectDocument, currentSess
   const [documents, setDocuments] = useState<Document[]>([]);
   const [searchQuery, setSearchQuery] = useState('');
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     // Fetch documents when sidebar opens or when refresh trigger changes (after upload)
@@ -40,6 +42,7 @@ export default function Sidebar({ isOpen, onClose, onSelectDocument, currentSess
       if (response.ok) {
         const data = await response.json();
         setDocuments(data.documents || []);
+        setNextCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Failed to fetch documents:', error);
@@ -48,6 +51,24 @@ export default function Sidebar({ isOpen, onClose, onSelectDocument, currentSess
     }
   };
 
+  // Documents are paginated (newest first); append the next page
+  const fetchMoreDocuments = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetch(`${API_URL}/api/documents?cursor=${encodeURIComponent(nextCursor)}`);
+      if (response.ok) {
+        const data = await response.json();
+        setDocuments((prev) => [...prev, ...(data.documents || [])]);
+        setNextCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      console.error('Failed to fetch more documents:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const filteredDocuments = documents.filter(doc =>
     doc.filename.toLowerCase().includes(searchQuery.toLowerCase())
   );
@@ -123,7 +144,7 @@ export default function Sidebar({ isOpen, onClose, onSelectDocument, currentSess
               </div>
               <div>
                 <h2 className="text-lg font-semibold text-white">Documents</h2>
-                <p className="text-xs text-slate-400">{documents.length} files</p>
+                <p className="text-xs text-slate-400">{documents.length}{nextCursor ? '+' : ''} files</p>
               </div>
             </div>
             <button
@@ -232,6 +253,16 @@ export default function Sidebar({ isOpen, onClose, onSelectDocument, currentSess
                   </button>
                 </div>
               ))}
+              {nextCursor && (
+                <button
+                  onClick={fetchMoreDocuments}
+                  disabled={loadingMore}
+                  className="w-full py-2 text-xs font-medium text-slate-400 hover:text-slate-200 
+                    bg-slate-800/50 hover:bg-slate-800 rounded-xl transition-colors disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              )}
             </div>
           )}
         </div>